@@ -1,12 +1,20 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
+import asyncio
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 from database import get_db
+from state_store import StateStore, state_store
+from config import AUTH_CACHE_ENABLED, AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES, AUTH_EMBED_CLAIMS, PASSWORD_HASH_WORKERS
 
 SECRET_KEY = "your-secret-key-keep-it-secret"
 ALGORITHM = "HS256"
@@ -15,6 +23,67 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# 密码哈希线程池：pbkdf2 计算期间释放 GIL，放到独立线程池中既不阻塞事件循环，也不会挤占合成任务的线程
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+# 缓存的用户快照字段 (不含密码哈希)
+PRINCIPAL_FIELDS = ("id", "username", "nickname", "phone", "email", "gender", "role")
+
+class PrincipalCache:
+    """
+    令牌 -> 用户快照的进程内 LRU 缓存。
+    条目在 AUTH_CACHE_TTL_SECONDS 与令牌过期时间中较早者失效；
+    用户信息被修改、删除或重置密码时由 routers/users.py 调用 invalidate_user 立即清除。
+    用户的变更时间记录在共享状态中：其他工作进程缓存的条目与内嵌声明在读取时比对变更时间，同样立即失效。
+    """
+    def __init__(self, max_entries: int, ttl: float, store: StateStore = state_store):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # token -> (snapshot, expire_at, cached_at)
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            snapshot, expire_at, cached_at = entry
+            if expire_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+        if self.changed_since(snapshot["id"], cached_at):
+            with self._lock:
+                self._entries.pop(token, None)
+            return None
+        return snapshot
+
+    def put(self, token: str, user: models.User, token_exp: float) -> None:
+        snapshot = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+        now = time.time()
+        with self._lock:
+            self._entries[token] = (snapshot, min(now + self.ttl, token_exp), now)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        清除某个用户的全部缓存条目，并使变更之前签发的内嵌声明失效。
+        变更时间保留到此前签发的令牌全部过期为止。
+        """
+        with self._lock:
+            for token in [t for t, (snapshot, _, _) in self._entries.items() if snapshot["id"] == user_id]:
+                del self._entries[token]
+        self.store.set(f"user-changed:{user_id}", time.time(), ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+    def changed_since(self, user_id: int, issued_at: float) -> bool:
+        changed_at = self.store.get(f"user-changed:{user_id}")
+        return changed_at is not None and issued_at <= changed_at
+
+principal_cache = PrincipalCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
 def verify_password(plain_password, hashed_password):
     """
     验证明文密码与哈希密码是否匹配。
@@ -27,6 +96,20 @@ def get_password_hash(password):
     """
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """
+    在密码哈希线程池中验证密码，供异步接口使用。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    """
+    在密码哈希线程池中生成密码哈希，供异步接口使用。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """
     创建 JWT 访问令牌，设置过期时间。
@@ -36,14 +119,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": int(time.time())})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def token_claims(user: models.User) -> dict:
+    """
+    生成令牌声明。开启 AUTH_EMBED_CLAIMS 时额外写入用户 ID 与角色。
+    """
+    claims = {"sub": user.username}
+    if AUTH_EMBED_CLAIMS:
+        claims.update({"uid": user.id, "role": user.role})
+    return claims
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     """
     依赖项：从 Token 中获取当前用户。
-    验证 Token 有效性并查找用户。
+    验证 Token 有效性并查找用户。依次尝试：令牌缓存、令牌内嵌的用户 ID 与角色、数据库查询。
+    前两种情况返回的是未绑定会话的用户快照，需要修改用户信息的接口应重新从数据库加载。
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -58,9 +151,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = {"username": username}
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == token_data["username"]).first()
+
+    if AUTH_CACHE_ENABLED:
+        snapshot = principal_cache.get(token)
+        if snapshot is not None:
+            return models.User(**snapshot)
+    uid, role = payload.get("uid"), payload.get("role")
+    if AUTH_EMBED_CLAIMS and uid is not None and role is not None and not principal_cache.changed_since(uid, payload.get("iat", 0)):
+        return models.User(id=uid, username=token_data["username"], role=role)
+
+    result = await db.execute(select(models.User).where(models.User.username == token_data["username"]))
+    user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    if AUTH_CACHE_ENABLED:
+        principal_cache.put(token, user, payload["exp"])
     return user
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
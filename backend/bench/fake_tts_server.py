@@ -0,0 +1,234 @@
+"""
+模拟的 IndexTTS2 Gradio 服务：实现 gradio_client 调用 /gen_single 所需的最小协议
+(config、info、upload、queue/join、queue/data SSE、file=)，用于在没有 GPU 的环境下做压测。
+
+可配置推理延迟 (固定部分 + 按字数增长部分 + 随机抖动)、失败率 (或总是失败的文本)、输出音频时长与同时推理数 (模拟 GPU 槽位)。
+输出为指定时长的单声道 16 位 WAV (低音量正弦波)。
+
+用法 (在 backend 目录下运行)：
+    python bench/fake_tts_server.py --port 7860 --latency 0.5 --latency-per-char 0.01 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+import uuid
+import wave
+from array import array
+
+# /gen_single 的参数，顺序即请求 data 数组的顺序
+PARAMETERS = [
+    "prompt", "text", "emo_control_method", "emo_ref_path", "emo_weight",
+    "vec1", "vec2", "vec3", "vec4", "vec5", "vec6", "vec7", "vec8",
+    "emo_text", "emo_random", "max_text_tokens_per_segment",
+    "param_16", "param_17", "param_18", "param_19", "param_20", "param_21", "param_22", "param_23",
+]
+FILE_PARAMETERS = ("prompt", "emo_ref_path")
+REQUIRED_PARAMETERS = ("prompt", "text")
+
+# gradio 文件类型组件的 JSON Schema (gradio_client 据此判断参数是否为文件)
+FILE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "path": {"type": "string"},
+        "url": {"type": "string"},
+        "orig_name": {"type": "string"},
+        "meta": {"type": "object", "properties": {"_type": {"type": "string", "const": "gradio.FileData"}}},
+    },
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="模拟 IndexTTS2 /gen_single 接口的 Gradio 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--latency", type=float, default=0.5, help="每次推理的固定耗时 (秒)")
+    parser.add_argument("--latency-per-char", type=float, default=0.01, help="每个字增加的推理耗时 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="推理耗时的随机抖动比例 (0.1 表示 ±10%%)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="推理失败的概率 (0~1)")
+    parser.add_argument("--fail-text", default=None, help="文本包含该字符串的请求总是推理失败 (模拟有问题的分段)")
+    parser.add_argument("--seconds-per-char", type=float, default=0.25, help="输出音频每个字对应的时长 (秒)")
+    parser.add_argument("--sample-rate", type=int, default=22050, help="输出音频采样率")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时推理的请求数 (模拟 GPU 槽位)，其余请求排队")
+    parser.add_argument("--workdir", default=None, help="上传与输出文件目录，默认使用临时目录")
+    return parser.parse_args(argv)
+
+def build_config() -> dict:
+    components = [
+        {"id": index + 1, "type": "audio" if name in FILE_PARAMETERS else "textbox", "props": {"label": name},
+         "api_info": FILE_SCHEMA if name in FILE_PARAMETERS else {"type": "string"}}
+        for index, name in enumerate(PARAMETERS)
+    ]
+    output_id = len(PARAMETERS) + 1
+    components.append({"id": output_id, "type": "audio", "props": {"label": "output"}, "api_info": FILE_SCHEMA})
+    return {
+        "version": "5.0.0",
+        "protocol": "sse_v3",
+        "api_prefix": "/gradio_api",
+        "connect_heartbeat": False,
+        "components": components,
+        "dependencies": [{
+            "id": 0,
+            "api_name": "gen_single",
+            "inputs": [component["id"] for component in components[:-1]],
+            "outputs": [output_id],
+            "backend_fn": True,
+            "queue": True,
+            "cancels": [],
+        }],
+    }
+
+def build_api_info() -> dict:
+    parameters = [
+        {
+            "parameter_name": name,
+            "parameter_has_default": name not in REQUIRED_PARAMETERS,
+            "parameter_default": None,
+            "label": name,
+            "component": "Audio" if name in FILE_PARAMETERS else "Textbox",
+            "type": FILE_SCHEMA if name in FILE_PARAMETERS else {"type": "string"},
+            "python_type": {"type": "filepath" if name in FILE_PARAMETERS else "str", "description": ""},
+        }
+        for name in PARAMETERS
+    ]
+    returns = [{"label": "output", "component": "Audio", "type": FILE_SCHEMA, "python_type": {"type": "filepath", "description": ""}}]
+    return {"named_endpoints": {"/gen_single": {"parameters": parameters, "returns": returns}}, "unnamed_endpoints": {}}
+
+def write_tone(path: str, seconds: float, sample_rate: int) -> None:
+    """
+    写入指定时长的 220Hz 低音量正弦波。先生成一秒的采样再重复，避免逐点计算长音频。
+    """
+    one_second = array("h", (int(3000 * math.sin(2 * math.pi * 220 * i / sample_rate)) for i in range(sample_rate)))
+    frames = int(seconds * sample_rate)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        while frames > 0:
+            chunk = one_second[:min(frames, sample_rate)]
+            wav.writeframes(chunk.tobytes())
+            frames -= len(chunk)
+
+def create_app(args):
+    from fastapi import FastAPI, Request, UploadFile, File
+    from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+    from typing import List
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="fake-tts-")
+    os.makedirs(workdir, exist_ok=True)
+    app = FastAPI()
+    config = build_config()
+    api_info = build_api_info()
+    # 每个会话 (session_hash) 一个消息队列与未完成的事件集合，queue/data 的 SSE 连接从队列中读取
+    sessions = {}
+    pending = {}
+    slots = asyncio.Semaphore(max(args.concurrency, 1))
+    stats = {"requests": 0, "failures": 0, "uploads": 0, "in_flight": 0}
+
+    def session_queue(session_hash: str) -> asyncio.Queue:
+        if session_hash not in sessions:
+            sessions[session_hash] = asyncio.Queue()
+            pending[session_hash] = set()
+        return sessions[session_hash]
+
+    @app.get("/config")
+    async def get_config():
+        return config
+
+    @app.get("/gradio_api/info")
+    async def get_info():
+        return api_info
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/gradio_api/upload")
+    async def upload(files: List[UploadFile] = File(...)):
+        paths = []
+        for upload_file in files:
+            path = os.path.join(workdir, f"upload-{uuid.uuid4().hex}-{os.path.basename(upload_file.filename or 'file')}")
+            with open(path, "wb") as f:
+                f.write(await upload_file.read())
+            paths.append(path)
+            stats["uploads"] += 1
+        return paths
+
+    async def process(event_id: str, session_hash: str, data: list) -> None:
+        queue = session_queue(session_hash)
+        text = data[PARAMETERS.index("text")] if len(data) > 1 else ""
+        async with slots:
+            stats["in_flight"] += 1
+            await queue.put({"msg": "process_starts", "event_id": event_id})
+            delay = args.latency + args.latency_per_char * len(text or "")
+            delay *= 1 + random.uniform(-args.jitter, args.jitter)
+            await asyncio.sleep(max(delay, 0))
+            stats["in_flight"] -= 1
+        stats["requests"] += 1
+        if random.random() < args.failure_rate or (args.fail_text and args.fail_text in (text or "")):
+            stats["failures"] += 1
+            await queue.put({
+                "msg": "process_completed", "event_id": event_id, "success": False,
+                "output": {"error": "模拟的推理失败"},
+            })
+            return
+        path = os.path.join(workdir, f"{uuid.uuid4().hex}.wav")
+        seconds = max(len(text or "") * args.seconds_per_char, 0.2)
+        await asyncio.to_thread(write_tone, path, seconds, args.sample_rate)
+        await queue.put({
+            "msg": "process_completed", "event_id": event_id, "success": True,
+            "output": {"data": [{"path": path, "orig_name": os.path.basename(path), "meta": {"_type": "gradio.FileData"}}]},
+        })
+
+    @app.post("/gradio_api/queue/join")
+    async def queue_join(request: Request):
+        body = await request.json()
+        event_id = uuid.uuid4().hex
+        session_hash = body.get("session_hash") or uuid.uuid4().hex
+        session_queue(session_hash)
+        pending[session_hash].add(event_id)
+        asyncio.get_running_loop().create_task(process(event_id, session_hash, body.get("data") or []))
+        return {"event_id": event_id}
+
+    @app.get("/gradio_api/queue/data")
+    async def queue_data(session_hash: str):
+        queue = session_queue(session_hash)
+
+        async def events():
+            # 与 Gradio 一致：会话内的事件全部完成后发送 close_stream 并结束连接，客户端下次提交时重新连接
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    message = {"msg": "heartbeat"}
+                yield f"data: {json.dumps(message, ensure_ascii=False)}\n\n"
+                if message["msg"] == "process_completed":
+                    pending[session_hash].discard(message["event_id"])
+                    if not pending[session_hash]:
+                        yield f"data: {json.dumps({'msg': 'close_stream'})}\n\n"
+                        return
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/gradio_api/file={path:path}")
+    async def get_file(path: str):
+        path = os.path.abspath(path if path.startswith("/") else "/" + path)
+        if os.path.commonpath([path, os.path.abspath(workdir)]) != os.path.abspath(workdir) or not os.path.isfile(path):
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+        return FileResponse(path, media_type="audio/wav")
+
+    @app.post("/gradio_api/cancel")
+    async def cancel():
+        return {"success": True}
+
+    return app
+
+def main(argv=None):
+    import uvicorn
+    args = parse_args(argv)
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+压测套件：在独立进程中启动模拟的 IndexTTS2 服务 (bench/fake_tts_server.py)，在本进程内运行应用并执行脚本化场景，
+输出各操作的吞吐与延迟分位数、事件循环延迟、各阶段平均耗时与模拟服务统计 (JSON)，便于在不同版本之间对比。
+
+场景：
+    login       并发登录
+    synthesize  并发 /audio/synthesize (同步等待合成结果)
+    churn       合成 -> 保存 -> 列表 -> 删除 循环
+    chapter     长章节合成 (/audio/jobs 提交后轮询)，额外统计实时率
+    all         依次执行以上全部场景
+
+数据库与输出目录均使用临时目录，不影响正式数据。加 --tts-url 时不启动模拟服务，直接压测指定的 TTS 服务。
+
+用法 (在 backend 目录下运行)：
+    python bench/load_bench.py --scenario synthesize --requests 50 --concurrency 8
+    python bench/load_bench.py --scenario all --tts-latency 0.2 --tts-failure-rate 0.05 --output result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+SCENARIOS = ("login", "synthesize", "churn", "chapter")
+
+# 生成测试文本使用的句子
+SENTENCE = "清晨的薄雾笼罩着小镇，街道两旁的店铺陆续开门。"
+
+PASSWORD = "bench-password"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="有声书服务压测 (模拟 TTS 服务)")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all", help="要执行的场景")
+    parser.add_argument("--requests", type=int, default=40, help="login/synthesize/churn 场景的请求 (循环) 总数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发的虚拟用户数，每个虚拟用户使用独立账号")
+    parser.add_argument("--text-chars", type=int, default=60, help="synthesize/churn 场景每次合成的字数")
+    parser.add_argument("--chapters", type=int, default=2, help="chapter 场景同时合成的章节数")
+    parser.add_argument("--chapter-chars", type=int, default=3000, help="chapter 场景每章的字数")
+    parser.add_argument("--workers", type=int, default=None, help="合成工作线程数 (SYNTH_WORKER_COUNT)，默认使用配置值")
+    parser.add_argument("--cache", action="store_true", help="启用合成结果缓存 (默认关闭，每次请求都调用 TTS)")
+    parser.add_argument("--lag-interval", type=float, default=0.05, help="事件循环延迟的采样间隔 (秒)")
+    parser.add_argument("--tts-url", default=None, help="使用已有的 TTS 服务地址，不启动模拟服务")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="模拟服务：每次推理的固定耗时 (秒)")
+    parser.add_argument("--tts-latency-per-char", type=float, default=0.002, help="模拟服务：每个字增加的推理耗时 (秒)")
+    parser.add_argument("--tts-jitter", type=float, default=0.1, help="模拟服务：推理耗时的随机抖动比例")
+    parser.add_argument("--tts-failure-rate", type=float, default=0.0, help="模拟服务：推理失败的概率")
+    parser.add_argument("--tts-seconds-per-char", type=float, default=0.25, help="模拟服务：输出音频每个字对应的时长 (秒)")
+    parser.add_argument("--tts-concurrency", type=int, default=2, help="模拟服务：同时推理的请求数 (GPU 槽位)")
+    parser.add_argument("--output", default=None, help="结果 JSON 写入的文件，默认输出到标准输出")
+    return parser.parse_args()
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def summarize(latencies, elapsed):
+    """
+    延迟列表 (秒) 的分位数汇总 (毫秒)。
+    """
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+def make_text(index, chars):
+    # 每段文本以序号开头，避免启用缓存时命中
+    text = f"第{index}段。"
+    while len(text) < chars:
+        text += SENTENCE
+    return text[:chars]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_server(args, workdir):
+    """
+    在子进程中启动模拟服务 (不与被测应用共享 GIL 与事件循环)，等待 /config 可访问后返回 (进程, 地址)。
+    """
+    import httpx
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "fake_tts_server.py"),
+        "--port", str(port),
+        "--latency", str(args.tts_latency),
+        "--latency-per-char", str(args.tts_latency_per_char),
+        "--jitter", str(args.tts_jitter),
+        "--failure-rate", str(args.tts_failure_rate),
+        "--seconds-per-char", str(args.tts_seconds_per_char),
+        "--concurrency", str(args.tts_concurrency),
+        "--workdir", os.path.join(workdir, "fake-tts"),
+    ]
+    process = subprocess.Popen(command)
+    url = f"http://127.0.0.1:{port}/"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "config", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("模拟 TTS 服务启动超时")
+
+def configure(args, workdir, tts_url):
+    """
+    在导入应用模块之前改写配置：临时数据库与输出目录、TTS 服务地址、关闭后台清理与转码。
+    """
+    import config
+    config.DATABASE_URL = "sqlite+aiosqlite:///" + os.path.join(workdir, "bench.db")
+    config.DATABASE_SYNC_URL = None
+    config.OUTPUT_DIR = os.path.join(workdir, "output")
+    config.TEMP_DIR = os.path.join(config.OUTPUT_DIR, "temp")
+    config.DATA_DIR = os.path.join(config.OUTPUT_DIR, "data")
+    config.SYNTH_CACHE_DIR = os.path.join(config.TEMP_DIR, "cache")
+    config.SYNTH_CACHE_ENABLED = args.cache
+    if args.workers:
+        config.SYNTH_WORKER_COUNT = args.workers
+        config.TTS_CLIENT_POOL_SIZE = args.workers
+    config.TTS_BACKENDS = [{"url": tts_url, "weight": 1, "max_concurrency": config.TTS_CLIENT_POOL_SIZE}]
+    # 每个虚拟用户同一时间只有一个请求在途，队列上限不应成为瓶颈
+    config.SYNTH_QUEUE_MAX = max(config.SYNTH_QUEUE_MAX, args.concurrency * 4)
+    config.STORAGE_REAPER_ENABLED = False
+    config.TRANSCODE_ENABLED = False
+    config.USER_QUOTA_BYTES = None
+    config.TRACE_LOG_ENABLED = False
+
+class Recorder:
+    """
+    按操作名记录延迟与状态码。
+    """
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.extra = {}
+
+    def add(self, op, status, elapsed, success):
+        # 延迟分位数只统计成功的请求，失败按状态码计数
+        statuses = self.statuses.setdefault(op, {})
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if success:
+            self.latencies.setdefault(op, []).append(elapsed)
+
+    async def request(self, op, send):
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except Exception as e:
+            self.add(op, e.__class__.__name__, time.perf_counter() - start, False)
+            return None
+        self.add(op, response.status_code, time.perf_counter() - start, response.is_success)
+        return response
+
+    def report(self, elapsed):
+        return {
+            op: dict(summarize(self.latencies.get(op, []), elapsed), statuses=statuses)
+            for op, statuses in self.statuses.items()
+        }
+
+class LoopLagMonitor:
+    """
+    周期性 sleep 并记录实际唤醒时间与预期的差值，衡量事件循环被阻塞的程度。
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - start - self.interval, 0.0))
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if not self.samples:
+            return {}
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round(percentile(self.samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.samples, 99) * 1000, 2),
+            "max_ms": round(max(self.samples) * 1000, 2),
+        }
+
+async def run_workers(count, total, worker):
+    """
+    count 个虚拟用户并发执行，共执行 total 次 worker(用户序号, 迭代序号)。
+    """
+    counter = iter(range(total))
+
+    async def loop(user_index):
+        for iteration in counter:
+            await worker(user_index, iteration)
+
+    await asyncio.gather(*[loop(i) for i in range(count)])
+
+async def scenario_login(client, users, recorder, args):
+    async def worker(user_index, iteration):
+        username = users[user_index]["username"]
+        await recorder.request("login", lambda: client.post("/token", data={"username": username, "password": PASSWORD}))
+
+    await run_workers(len(users), args.requests, worker)
+
+async def scenario_synthesize(client, users, recorder, args):
+    async def worker(user_index, iteration):
+        data = {"text": make_text(iteration, args.text_chars), "emo_type": "0"}
+        await recorder.request("synthesize", lambda: client.post("/audio/synthesize", data=data, headers=users[user_index]["headers"]))
+
+    await run_workers(len(users), args.requests, worker)
+
+async def scenario_churn(client, users, recorder, args):
+    async def worker(user_index, iteration):
+        headers = users[user_index]["headers"]
+        data = {"text": make_text(iteration, args.text_chars), "emo_type": "0"}
+        response = await recorder.request("synthesize", lambda: client.post("/audio/synthesize", data=data, headers=headers))
+        if response is None or not response.is_success:
+            return
+        save_data = {"emo_type": "0", "audio_path": response.json()["audio_path"]}
+        response = await recorder.request("save", lambda: client.post("/audio/save", data=save_data, headers=headers))
+        await recorder.request("list", lambda: client.get("/audio/", params={"limit": 20}, headers=headers))
+        if response is not None and response.is_success:
+            audio_id = response.json()["id"]
+            await recorder.request("delete", lambda: client.delete(f"/audio/{audio_id}", headers=headers))
+
+    await run_workers(len(users), args.requests, worker)
+
+async def scenario_chapter(client, users, recorder, args):
+    """
+    每个章节通过 /audio/jobs 提交后轮询至结束，记录端到端耗时与实时率 (RTF，合成耗时 / 音频时长，越小越快)。
+    """
+    from storage import resolve_output_path_to_abs_path
+    from wav_utils import wav_duration
+    factors = []
+
+    async def worker(user_index, iteration):
+        headers = users[user_index]["headers"]
+        data = {"text": make_text(iteration, args.chapter_chars), "emo_type": "0"}
+        start = time.perf_counter()
+        response = await client.post("/audio/jobs", data=data, headers=headers)
+        if response.status_code != 202:
+            recorder.add("chapter", response.status_code, time.perf_counter() - start, False)
+            return
+        job_id = response.json()["job_id"]
+
+        async def wait_job():
+            while True:
+                status = await client.get(f"/audio/jobs/{job_id}", headers=headers)
+                if status.json()["status"] in ("succeeded", "failed", "cancelled"):
+                    return await client.get(f"/audio/jobs/{job_id}/result", headers=headers)
+                await asyncio.sleep(0.2)
+
+        result = await recorder.request("chapter", wait_job)
+        if result is not None and result.is_success:
+            audio_seconds = wav_duration(resolve_output_path_to_abs_path(result.json()["audio_path"]))
+            if audio_seconds > 0:
+                factors.append((time.perf_counter() - start) / audio_seconds)
+
+    await run_workers(min(len(users), args.chapters), args.chapters, worker)
+    if factors:
+        recorder.extra = {"realtime_factor": {"mean": round(sum(factors) / len(factors), 3), "max": round(max(factors), 3)}}
+
+def stage_snapshot():
+    import metrics
+    return metrics.STAGE_SECONDS.totals()
+
+def stage_report(before, after):
+    """
+    场景执行期间各阶段的次数与平均耗时 (毫秒)。
+    """
+    report = {}
+    for key, (count, total) in after.items():
+        prev_count, prev_total = before.get(key, (0, 0.0))
+        if count > prev_count:
+            report[key[0]] = {"count": count - prev_count, "mean_ms": round((total - prev_total) / (count - prev_count) * 1000, 2)}
+    return report
+
+async def run(args, tts_url):
+    import httpx
+    import main
+    from routers import auth as auth_router
+    from database import async_engine
+
+    for limiter in (auth_router.login_ip_limiter, auth_router.login_failure_limiter, auth_router.register_ip_limiter):
+        limiter.limit = float("inf")
+
+    runner = {
+        "login": scenario_login,
+        "synthesize": scenario_synthesize,
+        "churn": scenario_churn,
+        "chapter": scenario_chapter,
+    }
+    names = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            users = []
+            for i in range(args.concurrency):
+                username = f"bench-{i}"
+                await client.post("/register", json={"username": username, "password": PASSWORD})
+                response = await client.post("/token", data={"username": username, "password": PASSWORD})
+                users.append({"username": username, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}})
+
+            for name in names:
+                recorder = Recorder()
+                monitor = LoopLagMonitor(args.lag_interval)
+                before = stage_snapshot()
+                tts_before = await fetch_tts_stats(tts_url)
+                monitor.start()
+                started = time.perf_counter()
+                await runner[name](client, users, recorder, args)
+                elapsed = time.perf_counter() - started
+                result = {
+                    "scenario": name,
+                    "elapsed_seconds": round(elapsed, 3),
+                    "ops": recorder.report(elapsed),
+                    "event_loop_lag": await monitor.stop(),
+                    "stages": stage_report(before, stage_snapshot()),
+                }
+                result.update(recorder.extra)
+                tts_after = await fetch_tts_stats(tts_url)
+                if tts_before is not None and tts_after is not None:
+                    result["tts_server"] = {key: tts_after[key] - tts_before[key] for key in ("requests", "failures", "uploads")}
+                results.append(result)
+    await async_engine.dispose()
+    return results
+
+async def fetch_tts_stats(tts_url):
+    # 仅模拟服务提供 /stats
+    import httpx
+    try:
+        async with httpx.AsyncClient() as client:
+            response = await client.get(tts_url + "stats", timeout=5)
+        return response.json() if response.status_code == 200 else None
+    except (httpx.HTTPError, ValueError):
+        return None
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="load-bench-")
+    process = None
+    if args.tts_url is None:
+        process, tts_url = start_fake_server(args, workdir)
+    else:
+        tts_url = args.tts_url if args.tts_url.endswith("/") else args.tts_url + "/"
+    try:
+        configure(args, workdir, tts_url)
+        results = asyncio.run(run(args, tts_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        "params": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+登录延迟基准测试：在进程内启动应用，持续提交合成任务的同时并发登录，输出登录延迟分位数 (JSON)。
+
+合成任务由模拟函数代替 (sleep + 纯 Python 计算，占用 GIL 与工作线程)，无需启动 IndexTTS。
+加 --inline 时在事件循环中直接计算密码哈希 (旧实现)，便于对比。
+
+用法 (在 backend 目录下运行)：
+    python bench/login_bench.py --logins 200 --concurrency 20
+    python bench/login_bench.py --logins 200 --concurrency 20 --inline
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="并发合成负载下的登录延迟基准测试")
+    parser.add_argument("--logins", type=int, default=200, help="登录请求总数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同时进行的登录请求数")
+    parser.add_argument("--jobs", type=int, default=20, help="测试期间提交的合成任务数")
+    parser.add_argument("--job-seconds", type=float, default=0.5, help="单个模拟合成任务的耗时 (秒)")
+    parser.add_argument("--inline", action="store_true", help="在事件循环中直接计算密码哈希 (旧实现)")
+    return parser.parse_args()
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def fake_synthesize(job_seconds):
+    def synthesize_audio(text, emo_type, job=None, **kwargs):
+        # 一半时间模拟等待 TTS 服务，一半时间模拟音频拼接等 CPU 工作
+        time.sleep(job_seconds / 2)
+        deadline = time.perf_counter() + job_seconds / 2
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        return None
+    return synthesize_audio
+
+async def run(args):
+    import httpx
+    import auth, main, tts_service, transcoder
+    from routers import auth as auth_router
+    from database import engine, async_engine
+    import models
+
+    tts_service.synthesize_audio = fake_synthesize(args.job_seconds)
+    tts_service.init_client_pool = lambda: None
+    transcoder.start = lambda: None
+    # 基准测试需要反复登录，放开限流
+    for limiter in (auth_router.login_ip_limiter, auth_router.login_failure_limiter, auth_router.register_ip_limiter):
+        limiter.limit = float("inf")
+    if args.inline:
+        async def verify_inline(plain, hashed):
+            return auth.verify_password(plain, hashed)
+        auth.verify_password_async = verify_inline
+    models.Base.metadata.create_all(bind=engine)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/register", json={"username": "bench", "password": "bench-password"})
+            response = await client.post("/token", data={"username": "bench", "password": "bench-password"})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            async def submit_jobs():
+                for _ in range(args.jobs):
+                    await client.post("/audio/jobs", data={"text": "基准测试文本。", "emo_type": "0"}, headers=headers)
+                    await asyncio.sleep(args.job_seconds / 4)
+
+            latencies = []
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def login():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.post("/token", data={"username": "bench", "password": "bench-password"})
+                    latencies.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(submit_jobs(), *[login() for _ in range(args.logins)])
+            elapsed = time.perf_counter() - started
+    await async_engine.dispose()
+
+    return {
+        "mode": "inline" if args.inline else "executor",
+        "logins": len(latencies),
+        "concurrency": args.concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "logins_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+def main():
+    args = parse_args()
+    # 使用临时数据库，避免写入正式数据
+    workdir = tempfile.mkdtemp(prefix="login-bench-")
+    import config
+    config.DATABASE_URL = "sqlite+aiosqlite:///" + os.path.join(workdir, "bench.db")
+    config.DATABASE_SYNC_URL = None
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import os
+from datetime import datetime
+from typing import List, Tuple
+import models, tts_service, transcoder, reaper
+from database import SessionLocal
+from jobs import Job, JobCancelled, job_manager
+from storage import resolve_output_path_to_abs_path, move_file, touch_promoted, sharded_path, output_url
+from wav_utils import wav_duration
+from config import DATA_DIR, BOOK_ESTIMATED_BYTES_PER_CHAR
+
+class ChapterProgress:
+    """
+    将单章的合成进度折算为整本书的进度，并把取消检查转交给书籍任务。
+    作为 job 参数传给 tts_service.synthesize_audio。
+    """
+    def __init__(self, job: Job, done_chars: int, chapter_chars: int, total_chars: int):
+        self.job = job
+        self.done_chars = done_chars
+        self.chapter_chars = chapter_chars
+        self.total_chars = max(total_chars, 1)
+        self._progress = 0.0
+
+    @property
+    def progress(self) -> float:
+        return self._progress
+
+    @progress.setter
+    def progress(self, value: float) -> None:
+        self._progress = value
+        self.job.progress = (self.done_chars + value * self.chapter_chars) / self.total_chars
+
+    def check_cancelled(self) -> None:
+        self.job.check_cancelled()
+
+def estimate_output_bytes(chars: int) -> int:
+    """
+    按字数估算合成输出 (WAV) 的大小，用于在合成前检查存储配额。
+    """
+    return chars * BOOK_ESTIMATED_BYTES_PER_CHAR
+
+def create_book(db, user_id: int, title: str, emo_type: int, chapters: List[Tuple[str, str]]) -> models.Book:
+    """
+    创建书籍与章节记录 (不提交事务)。chapters 为 (章节标题, 正文) 列表，按顺序编号。
+    路由中通过 AsyncSession.run_sync 调用。
+    """
+    book = models.Book(
+        user_id=user_id,
+        title=title,
+        emo_type=emo_type,
+        total_chars=sum(len(text) for _, text in chapters),
+    )
+    db.add(book)
+    db.flush()
+    for seq, (chapter_title, text) in enumerate(chapters, start=1):
+        db.add(models.Chapter(
+            book_id=book.id,
+            seq=seq,
+            title=chapter_title,
+            text=text,
+            char_count=len(text),
+        ))
+    db.flush()
+    return book
+
+def run_book(book_id: int, job: Job = None) -> str:
+    """
+    在工作线程中按顺序合成书籍的各章节 (章节内的分段并行合成)。
+    每完成一章即移动到持久目录并创建音频记录，无需用户再次保存。
+    每章开始前按估算的输出大小重新检查存储配额，超出时停止合成 (已完成的章节保留，其余章节保持未开始)。
+    返回值为书籍状态，供任务结果使用。
+    """
+    db = SessionLocal()
+    try:
+        book = db.query(models.Book).filter(models.Book.id == book_id).first()
+        user = db.query(models.User).filter(models.User.id == book.user_id).first()
+        chapters = (
+            db.query(models.Chapter)
+            .filter(models.Chapter.book_id == book_id, models.Chapter.status != "succeeded")
+            .order_by(models.Chapter.seq)
+            .all()
+        )
+        book.status = "running"
+        book.start_time = datetime.now()
+        db.commit()
+
+        failed = 0
+        for chapter in chapters:
+            if user is not None and reaper.quota_exceeded(user, estimate_output_bytes(chapter.char_count)):
+                book.status = "failed"
+                book.error = "存储空间已达上限，剩余章节未合成"
+                book.finish_time = datetime.now()
+                db.commit()
+                return book.status
+            try:
+                _run_chapter(db, book, chapter, job)
+            except JobCancelled:
+                chapter.status = "cancelled"
+                book.status = "cancelled"
+                book.finish_time = datetime.now()
+                db.commit()
+                raise
+            except Exception as e:
+                db.rollback()
+                chapter.status = "failed"
+                chapter.error = str(e) or e.__class__.__name__
+                chapter.finish_time = datetime.now()
+                book.status = "failed"
+                book.error = chapter.error
+                book.finish_time = datetime.now()
+                db.commit()
+                raise
+            if chapter.status == "failed":
+                failed += 1
+
+        book.status = "failed" if failed else "succeeded"
+        book.error = f"{failed} 个章节合成失败" if failed else None
+        book.finish_time = datetime.now()
+        db.commit()
+        return book.status
+    finally:
+        db.close()
+
+def _run_chapter(db, book: models.Book, chapter: models.Chapter, job: Job) -> None:
+    chapter.status = "running"
+    chapter.start_time = datetime.now()
+    db.commit()
+
+    progress = ChapterProgress(job, book.done_chars, chapter.char_count, book.total_chars) if job else None
+    try:
+        temp_url = tts_service.synthesize_audio(chapter.text, book.emo_type, job=progress)
+    except tts_service.SynthesisError as e:
+        # 单个章节合成失败不影响其他章节，失败原因记录在章节上
+        chapter.status = "failed"
+        chapter.error = str(e)
+        chapter.finish_time = datetime.now()
+        db.commit()
+        return
+
+    # 直接移动到持久目录 (本任务独占该临时文件，同一文件系统内为 O(1) 重命名)
+    temp_path = resolve_output_path_to_abs_path(temp_url)
+    data_path = sharded_path(DATA_DIR, os.path.basename(temp_path))
+    move_file(temp_path, data_path)
+    touch_promoted(data_path)
+    audio = models.Audio(
+        user_id=book.user_id,
+        audio_path=output_url(data_path),
+        emo_type=book.emo_type,
+    )
+    db.add(audio)
+    db.flush()
+
+    chapter.audio_id = audio.id
+    chapter.audio_seconds = wav_duration(data_path)
+    reaper.storage_usage.add(book.user_id, os.path.getsize(data_path))
+    chapter.status = "succeeded"
+    chapter.error = None
+    chapter.finish_time = datetime.now()
+    book.done_chars += chapter.char_count
+    book.audio_seconds += chapter.audio_seconds
+    db.commit()
+    transcoder.schedule_transcode(audio.id, audio.audio_path)
+
+def book_progress(book: models.Book, chapters: List[models.Chapter], job: Job = None) -> dict:
+    """
+    汇总书籍进度与吞吐：字数进度、每秒合成字数，以及实时率 (合成耗时 / 音频时长，小于 1 表示快于实时)。
+    """
+    progress = job.progress if job is not None and not job.finished else (
+        book.done_chars / book.total_chars if book.total_chars else 0.0
+    )
+    elapsed = None
+    if book.start_time:
+        end = book.finish_time or datetime.now()
+        elapsed = max((end - book.start_time).total_seconds(), 0.001)
+    return {
+        "progress": round(progress, 4),
+        "chapters_total": len(chapters),
+        "chapters_done": sum(1 for c in chapters if c.status == "succeeded"),
+        "chapters_failed": sum(1 for c in chapters if c.status == "failed"),
+        "elapsed_seconds": round(elapsed, 3) if elapsed else None,
+        "chars_per_second": round(book.done_chars / elapsed, 3) if elapsed else None,
+        "real_time_factor": round(elapsed / book.audio_seconds, 4) if elapsed and book.audio_seconds else None,
+    }
+
+def recover_interrupted() -> int:
+    """
+    服务重启后，上次未结束的书籍任务已随进程终止，将其标记为失败，用户可重新提交。
+    多进程部署时，任务仍在其他工作进程中执行 (共享状态中有未过期的任务快照) 的书籍保持不变。
+    返回标记为失败的书籍数。
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        interrupted = []
+        for book in db.query(models.Book).filter(models.Book.status.in_(["pending", "running"])).all():
+            job = job_manager.get(book.job_id) if book.job_id else None
+            if job is not None and not job.finished:
+                continue
+            book.status = "failed"
+            book.error = "服务重启，任务中断"
+            book.finish_time = now
+            interrupted.append(book.id)
+        if interrupted:
+            db.query(models.Chapter).filter(
+                models.Chapter.book_id.in_(interrupted), models.Chapter.status == "running"
+            ).update({"status": "failed", "error": "服务重启，任务中断"}, synchronize_session=False)
+        db.commit()
+        return len(interrupted)
+    finally:
+        db.close()
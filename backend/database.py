@@ -1,24 +1,88 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config import DATABASE_PATH
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+import time
+import tracing
+from config import (
+    DATABASE_PATH,
+    DATABASE_URL,
+    DATABASE_SYNC_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_SYNCHRONOUS,
+)
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+# 异步驱动与同步驱动的对应关系，用于由异步连接串推导工作线程使用的同步连接串
+SYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql+psycopg2",
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+ASYNC_DATABASE_URL = DATABASE_URL or f"sqlite+aiosqlite:///{DATABASE_PATH}"
+
+def _sync_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return SYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+SQLALCHEMY_DATABASE_URL = DATABASE_SYNC_URL or _sync_url(ASYNC_DATABASE_URL)
+
+IS_SQLITE = ASYNC_DATABASE_URL.startswith("sqlite")
+
+def _engine_options() -> dict:
+    options = {"pool_pre_ping": True}
+    if IS_SQLITE:
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    新建 SQLite 连接时开启 WAL (读写互不阻塞)，并设置写锁等待时间与同步级别。
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+# 异步引擎：供各路由使用，查询不阻塞事件循环
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options())
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# 同步引擎：供合成任务、转码回调等工作线程以及建表/迁移使用
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+def _commit_started(session) -> None:
+    session.info["commit_started"] = time.perf_counter()
+
+def _commit_finished(session) -> None:
+    """
+    记录提交耗时 (含提交前的 flush 与 SQLite 写锁等待)，同步会话与异步会话内部的同步会话都会触发。
+    """
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        tracing.record_stage("db_commit", time.perf_counter() - started)
+
+def _commit_aborted(session) -> None:
+    session.info.pop("commit_started", None)
+
+event.listen(Session, "before_commit", _commit_started)
+event.listen(Session, "after_commit", _commit_finished)
+event.listen(Session, "after_rollback", _commit_aborted)
+
 Base = declarative_base()
 
-def get_db():
+async def get_db():
     """
-    获取数据库会话生成器。
+    获取异步数据库会话。
     每个请求创建一个新的会话，请求结束后关闭。
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,180 @@
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from text_utils import join_sentences, split_sentences
+from config import EMOTION_SAMPLE_DIR, EMOTION_DEFAULT
+
+# 自动情感模式：按句识别情感，对应前端的 "自动" 选项
+EMO_AUTO = -1
+
+# 情感名称与编号 (与 tts_service.EMO_MAP 一致)，样本文件以情感名称命名，如 input/喜.txt
+EMOTION_NAMES = {"喜": 0, "怒": 1, "哀": 2, "惧": 3}
+
+# 内置情感词典：词 -> 权重。样本文件中学到的 n-gram 在此基础上叠加
+SEED_LEXICON = {
+    0: {"开心": 2, "高兴": 2, "快乐": 2, "欢喜": 2, "兴奋": 2, "幸福": 2, "喜欢": 1, "笑": 1, "哈哈": 2, "嘻嘻": 2, "太好了": 2, "啦啦": 1, "得意": 1, "庆祝": 1},
+    1: {"生气": 2, "愤怒": 2, "恼火": 2, "可恶": 2, "混蛋": 2, "该死": 2, "滚": 2, "闭嘴": 2, "怒": 1, "骂": 1, "吼": 1, "气死": 2, "岂有此理": 2, "放肆": 2},
+    2: {"伤心": 2, "难过": 2, "悲伤": 2, "痛苦": 2, "哭": 1, "泪": 1, "呜呜": 2, "失望": 2, "孤独": 1, "绝望": 2, "心碎": 2, "遗憾": 1, "叹息": 1, "可怜": 1},
+    3: {"害怕": 2, "恐惧": 2, "可怕": 2, "惊恐": 2, "颤抖": 2, "发抖": 2, "救命": 2, "慌": 1, "吓": 1, "怕": 1, "恐怖": 2, "紧张": 1, "不敢": 1, "鬼": 1},
+}
+
+# 否定词：紧邻情感词之前出现时忽略该词 (如 "不开心" 不计入喜)
+NEGATIONS = ("不", "没", "别", "无")
+
+# 从样本学习的 n-gram 长度与单个 n-gram 的权重
+SAMPLE_NGRAM_SIZES = (2, 3)
+SAMPLE_NGRAM_WEIGHT = 1
+
+# n-gram 至少在该情感样本的这么多个句子中出现才加入词典 (文档频率下限)，只出现一次的多为偶然搭配
+SAMPLE_MIN_DOC_FREQ = 2
+
+# 停用字：语气词、代词、虚词与常见句首 (如 "今天我好")。n-gram 中除停用字外至少要有两个字，
+# "啊啊"、"我好害" 这类由语气词或句首成分构成的片段不加入词典
+SAMPLE_STOP_CHARS = frozenset("啊呀吧呢哦噢嗯哼唉呃嘛啦哇哎呐的了着过是在有和与就都也还又很好太真我你他她它们这那今天")
+SAMPLE_MIN_CONTENT_CHARS = 2
+
+class LexiconEmotionClassifier:
+    """
+    基于词典的轻量情感分类器 (纯 CPU、无外部依赖)。
+    词典由内置情感词与样本文件 (input/喜.txt 等) 中各情感独有的 n-gram 组成，
+    句子得分为命中词权重之和，无命中时返回 None 由调用方决定默认情感。
+    """
+    def __init__(self, lexicon: Dict[int, Dict[str, float]]):
+        self.lexicon = lexicon
+
+    @classmethod
+    def from_samples(cls, sample_dir: str) -> "LexiconEmotionClassifier":
+        """
+        以内置词典为基础，加入样本文件中仅出现在某一种情感里的 n-gram (多情感共有的如 "今天" 被剔除)。
+        n-gram 还需在该情感样本中至少 SAMPLE_MIN_DOC_FREQ 个句子里出现，且不能主要由停用字组成 (见 SAMPLE_STOP_CHARS)。
+        """
+        lexicon = {emo: dict(words) for emo, words in SEED_LEXICON.items()}
+        grams = {}
+        if os.path.isdir(sample_dir):
+            for name, emo in EMOTION_NAMES.items():
+                path = os.path.join(sample_dir, f"{name}.txt")
+                if not os.path.isfile(path):
+                    continue
+                with open(path, "rb") as f:
+                    content = f.read()
+                try:
+                    text = content.decode("utf-8-sig")
+                except UnicodeDecodeError:
+                    text = content.decode("gb18030", errors="ignore")
+                # 各 n-gram 出现在多少个句子中
+                doc_freq = defaultdict(int)
+                for sentence in split_sentences(text):
+                    for gram in _ngrams(sentence):
+                        doc_freq[gram] += 1
+                grams[emo] = doc_freq
+        counts = defaultdict(int)
+        for emo_grams in grams.values():
+            for gram in emo_grams:
+                counts[gram] += 1
+        for emo, emo_grams in grams.items():
+            for gram, freq in emo_grams.items():
+                if counts[gram] == 1 and freq >= SAMPLE_MIN_DOC_FREQ and _informative(gram):
+                    lexicon[emo].setdefault(gram, SAMPLE_NGRAM_WEIGHT)
+        return cls(lexicon)
+
+    def scores(self, sentence: str) -> Dict[int, float]:
+        """
+        计算句子在各情感上的得分。
+        """
+        result = defaultdict(float)
+        for emo, words in self.lexicon.items():
+            for word, weight in words.items():
+                start = sentence.find(word)
+                while start != -1:
+                    if not (start > 0 and sentence[start - 1] in NEGATIONS):
+                        result[emo] += weight
+                    start = sentence.find(word, start + len(word))
+        return result
+
+    def classify(self, sentence: str) -> Optional[int]:
+        """
+        返回得分最高的情感编号，没有命中任何情感词时返回 None。
+        """
+        scores = self.scores(sentence)
+        if not scores:
+            return None
+        best = max(scores.values())
+        if best <= 0:
+            return None
+        # 同分时取编号较小的情感，保证结果稳定
+        return min(emo for emo, score in scores.items() if score == best)
+
+def _ngrams(text: str) -> set:
+    text = "".join(ch for ch in text if ch.isalnum())
+    return {text[i:i + n] for n in SAMPLE_NGRAM_SIZES for i in range(len(text) - n + 1)}
+
+def _informative(gram: str) -> bool:
+    return sum(1 for ch in gram if ch not in SAMPLE_STOP_CHARS) >= SAMPLE_MIN_CONTENT_CHARS
+
+def smooth_labels(labels: List[Optional[int]], default: int) -> List[int]:
+    """
+    为未识别出情感的句子补全标签：夹在两个相同情感之间的句子沿用该情感
+    (如同一段对话中间的旁白)，其余使用默认情感。这样相邻句子更容易合并为同一批次。
+    """
+    # 预先计算每个位置之前/之后最近的已识别情感，避免逐句回看
+    prev_labels, last = [], None
+    for label in labels:
+        prev_labels.append(last)
+        if label is not None:
+            last = label
+    next_labels, last = [], None
+    for label in reversed(labels):
+        next_labels.append(last)
+        if label is not None:
+            last = label
+    next_labels.reverse()
+
+    result = []
+    for label, prev_label, next_label in zip(labels, prev_labels, next_labels):
+        if label is None:
+            label = prev_label if prev_label is not None and prev_label == next_label else default
+        result.append(label)
+    return result
+
+def tag_sentences(text: str, default: int = EMOTION_DEFAULT) -> List[Tuple[int, str]]:
+    """
+    将文本切分为句子并逐句标注情感，返回 (情感编号, 句子) 列表。
+    """
+    sentences = split_sentences(text)
+    classifier = get_classifier()
+    labels = smooth_labels([classifier.classify(s) for s in sentences], default)
+    return list(zip(labels, sentences))
+
+def merge_runs(tagged: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """
+    把情感相同的连续句子合并为一段，返回 (情感编号, 文本) 列表。英文句子之间补回空格。
+    """
+    runs = []
+    for label, sentence in tagged:
+        if runs and runs[-1][0] == label:
+            runs[-1][1].append(sentence)
+        else:
+            runs.append((label, [sentence]))
+    return [(label, join_sentences(sentences)) for label, sentences in runs]
+
+def group_runs(text: str, default: int = EMOTION_DEFAULT) -> List[Tuple[int, str]]:
+    """
+    逐句识别情感并合并相同情感的连续句子。
+    每段之后再按长度上限分段合成，TTS 调用次数取决于情感切换次数而不是句子数。
+    """
+    return merge_runs(tag_sentences(text, default))
+
+_classifier: Optional[LexiconEmotionClassifier] = None
+_classifier_lock = threading.Lock()
+
+def get_classifier() -> LexiconEmotionClassifier:
+    """
+    首次使用时从样本目录构建分类器，之后复用。
+    """
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                _classifier = LexiconEmotionClassifier.from_samples(EMOTION_SAMPLE_DIR)
+    return _classifier
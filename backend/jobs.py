@@ -0,0 +1,606 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, Optional, Union
+import metrics
+import scheduler
+import tracing
+from state_store import StateStore, state_store, instance_id
+from config import (
+    SYNTH_WORKER_COUNT,
+    SYNTH_QUEUE_MAX,
+    SYNTH_QUEUE_PER_USER_MAX,
+    SYNTH_BATCH_MAX_RUNNING,
+    JOB_RESULT_TTL_SECONDS,
+    SYNTH_COALESCE_ENABLED,
+    IDEMPOTENCY_TTL_SECONDS,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_HEARTBEAT_TTL_SECONDS,
+)
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# 等待其他进程中的任务结束时查询快照的间隔 (秒)
+REMOTE_POLL_SECONDS = 0.5
+
+JOBS_FINISHED = metrics.counter("audiobook_jobs_finished_total", "已结束的任务数 (按类型与状态)", ["kind", "status"])
+JOBS_DEDUPLICATED = metrics.counter(
+    "audiobook_jobs_deduplicated_total", "未新建任务、直接返回已有任务的提交次数 (coalesced: 合并重复提交，replayed: 幂等键重试)", ["kind", "reason"]
+)
+
+class QueueFullError(Exception):
+    """
+    队列已满 (全局或单用户上限) 时抛出，由路由层转换为 429。
+    """
+    pass
+
+class IdempotencyConflict(Exception):
+    """
+    同一幂等键被用于内容不同的请求时抛出，由路由层转换为 422。
+    """
+    pass
+
+class JobCancelled(Exception):
+    """
+    任务执行过程中检测到取消请求时抛出，用于提前结束长任务。
+    """
+    pass
+
+class Job:
+    """
+    一个待执行的合成任务。
+    func 在工作线程中执行，其返回值作为任务结果；执行时会把任务自身作为 job 关键字参数传入，
+    便于长任务在分段之间调用 job.check_cancelled() 响应取消。
+    requester 决定任务及其分段的调度优先级与权重，chars 为任务的字数 (用于估算等待时间)。
+    """
+    def __init__(self, user_id: int, func: Callable, args: tuple, kwargs: dict, kind: str = "synthesize", dedup_key: Optional[str] = None,
+                 requester: Optional[scheduler.Requester] = None, chars: int = 0):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.dedup_key = dedup_key
+        self.requester = requester or scheduler.Requester(user_id)
+        self.chars = chars
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JOB_PENDING
+        self.result = None
+        self.error: Optional[str] = None
+        self.progress = 0.0
+        self.create_time = time.time()
+        self.start_time: Optional[float] = None
+        self.finish_time: Optional[float] = None
+        self.cancel_requested = False
+        # 提交时的关联 ID，工作线程执行任务时恢复，使任务内的追踪日志能与发起请求对应
+        self.request_id = tracing.current_request_id()
+        self._done = threading.Event()
+        # 快照的生成与写入在同一把锁内，先生成的快照不会覆盖后生成的
+        self._publish_lock = threading.Lock()
+        self._waiters = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def check_cancelled(self) -> None:
+        """
+        供任务函数在安全点调用：若已请求取消则抛出 JobCancelled。
+        """
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        阻塞等待任务结束 (仅供线程中使用，协程请使用 JobManager.wait_async)。
+        """
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        """
+        任务状态的对外表示，用于状态查询接口。
+        """
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.requester.priority,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "error": self.error,
+            "create_time": self.create_time,
+            "start_time": self.start_time,
+            "finish_time": self.finish_time,
+        }
+
+    def snapshot(self) -> dict:
+        """
+        写入共享状态的任务快照：对外状态、所属用户、结果与所属进程。
+        """
+        return {"job": self.to_dict(), "user_id": self.user_id, "result": self.result, "owner": instance_id()}
+
+class RemoteJob:
+    """
+    其他工作进程 (或节点) 中的任务，由共享状态中的快照构造。
+    状态查询、结果获取与等待和本地任务一致；取消时写入取消标记，由所属进程在心跳时处理。
+    """
+    def __init__(self, snapshot: dict):
+        self.id = snapshot["job"]["job_id"]
+        self.update(snapshot)
+
+    def update(self, snapshot: dict) -> None:
+        self.user_id = snapshot["user_id"]
+        self.kind = snapshot["job"]["kind"]
+        self.status = snapshot["job"]["status"]
+        self.progress = snapshot["job"]["progress"]
+        self.error = snapshot["job"]["error"]
+        self.result = snapshot["result"]
+        self.owner = snapshot["owner"]
+        self._data = snapshot["job"]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        return dict(self._data, status=self.status, error=self.error)
+
+class JobManager:
+    """
+    有界工作线程池 + 任务队列。
+    - 全局排队数与单用户在途任务数均有上限，超出时 submit 抛出 QueueFullError (背压)；
+      不经过队列的流式试听通过 begin_stream / end_stream 按同样的规则准入并计入在途任务数。
+    - 工作线程优先取交互任务，同一优先级内优先取执行中任务最少的用户的任务 (其次按提交顺序)，
+      批量任务最多占用 max_batch_running 个工作线程，避免整书任务占满线程后交互任务无法开始。
+    - 同一用户内容相同的任务在执行中时重复提交会合并到已有任务；客户端可通过幂等键安全地重试提交。
+    - 任务在提交它的进程中执行。任务快照、合并与幂等记录保存在共享状态存储 (store) 中，
+      多个工作进程或节点部署时，任意进程都能查询、等待、取消其他进程中的任务，重复提交与重试也能找到已有任务；
+      所属进程每隔 heartbeat_interval 秒刷新执行中任务的快照 (进度) 并处理其他进程写入的取消标记。
+      排队数与单用户在途任务数上限按进程计算。
+    """
+    def __init__(self, worker_count: int, max_queued: int, max_per_user: int, result_ttl: float,
+                 coalesce: bool = True, idempotency_ttl: float = 0, max_batch_running: Optional[int] = None,
+                 store: StateStore = state_store, heartbeat_interval: float = JOB_HEARTBEAT_SECONDS,
+                 heartbeat_ttl: float = JOB_HEARTBEAT_TTL_SECONDS):
+        self.worker_count = worker_count
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.max_batch_running = max_batch_running or worker_count
+        self.result_ttl = result_ttl
+        self.coalesce = coalesce
+        self.idempotency_ttl = idempotency_ttl
+        self.store = store
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        self._jobs: Dict[str, Job] = {}
+        # 用户 ID -> 进行中的流式试听数
+        self._streams: Dict[int, int] = {}
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopping = False
+        self._heartbeat_stop = threading.Event()
+
+    def start(self) -> None:
+        """
+        启动工作线程与心跳线程，重复调用无副作用。
+        """
+        with self._cond:
+            if self._workers:
+                return
+            self._stopping = False
+            self._heartbeat_stop.clear()
+            for i in range(self.worker_count):
+                worker = threading.Thread(target=self._worker_loop, name=f"synth-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            heartbeat.start()
+            self._workers.append(heartbeat)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """
+        停止接收任务并通知工作线程退出；排队中的任务标记为已取消。
+        """
+        cancelled = []
+        with self._cond:
+            self._stopping = True
+            self._heartbeat_stop.set()
+            while self._queue:
+                job = self._queue.popleft()
+                self._finish(job, JOB_CANCELLED, error="服务关闭")
+                cancelled.append(job)
+            self._cond.notify_all()
+            workers, self._workers = self._workers, []
+        for job in cancelled:
+            self._publish(job)
+        for worker in workers:
+            worker.join(timeout)
+
+    def submit(self, user_id: int, func: Callable, *args, kind: str = "synthesize",
+               dedup_key: Optional[str] = None, idempotency_key: Optional[str] = None,
+               requester: Optional[scheduler.Requester] = None, chars: int = 0, **kwargs) -> Union[Job, RemoteJob]:
+        """
+        提交任务并立即返回 Job 对象 (合并或重放到其他进程中的任务时返回 RemoteJob)。requester 与 chars 见 Job。
+        dedup_key 为请求内容的指纹：同一用户已有相同指纹的未结束任务时直接返回该任务，不再重复合成。
+        idempotency_key 为客户端提供的幂等键：保留期内用同一键重试时返回首次提交的任务
+        (该任务已失败或取消时重新执行)；同一键对应的请求内容不同时抛出 IdempotencyConflict。
+        """
+        self.start()
+        if idempotency_key is not None:
+            existing = self._replay(user_id, idempotency_key, dedup_key)
+            if existing is not None:
+                JOBS_DEDUPLICATED.labels(kind=kind, reason="replayed").inc()
+                return existing
+        job = Job(user_id, func, args, kwargs, kind=kind, dedup_key=dedup_key, requester=requester, chars=chars)
+        # 先写入快照再登记指纹，其他进程查到登记时一定能查到对应的任务
+        self._publish(job)
+        existing = self._claim(job)
+        if existing is not None:
+            self.store.delete(_job_key(job.id))
+            JOBS_DEDUPLICATED.labels(kind=kind, reason="coalesced").inc()
+            self._remember(user_id, idempotency_key, existing.id, dedup_key)
+            return existing
+        try:
+            with self._cond:
+                self._prune_locked()
+                self._admit_locked(user_id)
+                self._jobs[job.id] = job
+                self._queue.append(job)
+                self._cond.notify()
+        except QueueFullError as e:
+            # 其他进程可能已合并到该任务，以失败结束并释放指纹登记
+            job.status = JOB_FAILED
+            job.error = str(e)
+            job.finish_time = time.time()
+            self._publish(job)
+            raise
+        self._remember(user_id, idempotency_key, job.id, dedup_key)
+        return job
+
+    def _admit_locked(self, user_id: int) -> None:
+        # 调用方需持有 self._cond；全局排队数或该用户的在途任务 (含流式试听) 达到上限时抛出 QueueFullError
+        if len(self._queue) >= self.max_queued:
+            raise QueueFullError("合成队列已满，请稍后重试")
+        active = sum(1 for j in self._jobs.values() if j.user_id == user_id and not j.finished)
+        if active + self._streams.get(user_id, 0) >= self.max_per_user:
+            raise QueueFullError("您的排队任务过多，请等待已有任务完成")
+
+    def check_admission(self, user_id: int) -> None:
+        """
+        按 submit 的准入规则检查是否还能为该用户开始新的合成，超出上限时抛出 QueueFullError。
+        """
+        with self._cond:
+            self._admit_locked(user_id)
+
+    def begin_stream(self, user_id: int) -> None:
+        """
+        流式试听不经过任务队列 (在请求线程中边合成边返回)，开始前按 submit 的规则准入，
+        执行期间计入该用户的在途任务数，结束后需调用 end_stream。超出上限时抛出 QueueFullError。
+        """
+        with self._cond:
+            self._admit_locked(user_id)
+            self._streams[user_id] = self._streams.get(user_id, 0) + 1
+
+    def end_stream(self, user_id: int) -> None:
+        with self._cond:
+            count = self._streams.get(user_id, 0) - 1
+            if count > 0:
+                self._streams[user_id] = count
+            else:
+                self._streams.pop(user_id, None)
+
+    def _claim(self, job: Job) -> Optional[Union[Job, RemoteJob]]:
+        """
+        登记内容指纹 (跨进程原子操作)。同一用户相同指纹的任务仍未结束时返回该任务，否则由 job 占用该指纹。
+        """
+        if not self.coalesce or job.dedup_key is None:
+            return None
+        key = _inflight_key(job.user_id, job.dedup_key)
+        if self.store.add(key, job.id, ttl=self.heartbeat_ttl):
+            return None
+        job_id = self.store.get(key)
+        existing = self.get(job_id) if job_id else None
+        if existing is not None and not existing.finished:
+            return existing
+        # 登记指向的任务已结束或已丢失，由新任务接替
+        self.store.set(key, job.id, ttl=self.heartbeat_ttl)
+        return None
+
+    def _unclaim(self, job: Job) -> None:
+        if self.coalesce and job.dedup_key is not None:
+            key = _inflight_key(job.user_id, job.dedup_key)
+            if self.store.get(key) == job.id:
+                self.store.delete(key)
+
+    def _replay(self, user_id: int, idempotency_key: str, dedup_key: Optional[str]) -> Optional[Union[Job, RemoteJob]]:
+        record = self.store.get(_idempotency_key(user_id, idempotency_key))
+        if record is None:
+            return None
+        if record["dedup_key"] != dedup_key:
+            raise IdempotencyConflict("该幂等键已用于内容不同的请求")
+        job = self.get(record["job_id"])
+        if job is None or job.status in (JOB_FAILED, JOB_CANCELLED):
+            return None
+        return job
+
+    def _remember(self, user_id: int, idempotency_key: Optional[str], job_id: str, dedup_key: Optional[str]) -> None:
+        if idempotency_key is not None and self.idempotency_ttl > 0:
+            self.store.set(
+                _idempotency_key(user_id, idempotency_key), {"job_id": job_id, "dedup_key": dedup_key}, ttl=self.idempotency_ttl
+            )
+
+    def get(self, job_id: str) -> Optional[Union[Job, RemoteJob]]:
+        """
+        查询任务：本进程中的任务返回 Job，其他进程中的任务返回由共享快照构造的 RemoteJob。
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        snapshot = self.store.get(_job_key(job_id))
+        return RemoteJob(snapshot) if snapshot is not None else None
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        取消任务：排队中的任务直接移除；执行中的任务设置取消标记，由任务函数在安全点退出。
+        其他进程中的任务写入取消标记，由所属进程在下一次心跳时按同样的方式处理。
+        返回 False 表示任务已结束，无法取消。
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if job.finished:
+                    return False
+                job.cancel_requested = True
+                if job.status == JOB_PENDING:
+                    try:
+                        self._queue.remove(job)
+                    except ValueError:
+                        pass
+                    self._finish(job, JOB_CANCELLED)
+        if job is not None:
+            if job.finished:
+                self._publish(job)
+            return True
+        remote = self.get(job_id)
+        if remote is None or remote.finished:
+            return False
+        self.store.set(_cancel_key(job_id), True, ttl=self.heartbeat_ttl)
+        return True
+
+    def cancel_user(self, user_id: int) -> int:
+        """
+        取消某个用户的全部未结束任务 (如删除用户时，包括其他进程中的任务)，返回请求取消的任务数。
+        """
+        job_ids = {
+            snapshot["job"]["job_id"] for snapshot in self.store.scan(JOB_KEY_PREFIX).values()
+            if snapshot["user_id"] == user_id and snapshot["job"]["status"] not in FINISHED_STATES
+        }
+        with self._cond:
+            job_ids.update(job.id for job in self._jobs.values() if job.user_id == user_id and not job.finished)
+        return sum(1 for job_id in job_ids if self.cancel(job_id))
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        """
+        返回任务在队列中的位置 (从 1 开始，按优先级与提交顺序)，不在队列中时返回 None。
+        """
+        with self._cond:
+            ordered = self._ordered_queue_locked()
+            for index, queued in enumerate(ordered):
+                if queued is job:
+                    return index + 1
+        return None
+
+    def estimate_wait(self, job: Job) -> Optional[float]:
+        """
+        估算排队中的任务还需等待多久开始 (秒)：排在前面的任务与执行中任务的剩余字数除以 TTS 的估算吞吐。
+        尚无吞吐样本或任务不在队列中时返回 None。
+        """
+        throughput = scheduler.tts_scheduler.throughput()
+        if throughput is None:
+            return None
+        with self._cond:
+            ordered = self._ordered_queue_locked()
+            if job not in ordered:
+                return None
+            ahead = sum(queued.chars for queued in ordered[:ordered.index(job)])
+            ahead += sum(
+                j.chars * (1 - j.progress) for j in self._jobs.values()
+                if j.status == JOB_RUNNING and scheduler.PRIORITY_RANK[j.requester.priority] <= scheduler.PRIORITY_RANK[job.requester.priority]
+            )
+        return round(ahead / throughput, 1)
+
+    def _ordered_queue_locked(self) -> list:
+        # 调用方需持有 self._cond；按优先级、提交顺序排列 (用户间轮转由 _next_job_locked 在出队时决定)
+        return sorted(self._queue, key=lambda j: (scheduler.PRIORITY_RANK[j.requester.priority], j.create_time))
+
+    def _next_job_locked(self) -> Optional[Job]:
+        # 调用方需持有 self._cond；批量任务达到执行上限时跳过，只取交互任务
+        running = [j for j in self._jobs.values() if j.status == JOB_RUNNING]
+        batch_running = sum(1 for j in running if j.requester.priority == scheduler.PRIORITY_BATCH)
+        candidates = [
+            j for j in self._queue
+            if j.requester.priority != scheduler.PRIORITY_BATCH or batch_running < self.max_batch_running
+        ]
+        if not candidates:
+            return None
+        running_per_user = {}
+        for j in running:
+            running_per_user[j.user_id] = running_per_user.get(j.user_id, 0) + 1
+        return min(candidates, key=lambda j: (
+            scheduler.PRIORITY_RANK[j.requester.priority], running_per_user.get(j.user_id, 0), j.create_time,
+        ))
+
+    async def wait_async(self, job: Union[Job, RemoteJob]) -> Union[Job, RemoteJob]:
+        """
+        在协程中等待任务结束，不阻塞事件循环。
+        其他进程中的任务定期查询快照；快照过期 (所属进程已退出) 时按失败处理。
+        """
+        if isinstance(job, RemoteJob):
+            while not job.finished:
+                await asyncio.sleep(REMOTE_POLL_SECONDS)
+                snapshot = self.store.get(_job_key(job.id))
+                if snapshot is None:
+                    job.status = JOB_FAILED
+                    job.error = "任务所在的服务进程已退出"
+                else:
+                    job.update(snapshot)
+            return job
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if job.finished:
+                return job
+            job._waiters.append((loop, future))
+        await future
+        return job
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    job = self._next_job_locked()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                self._queue.remove(job)
+                job.status = JOB_RUNNING
+                job.start_time = time.time()
+            self._publish(job)
+            with tracing.bind(job.request_id, job.id), scheduler.bind(job.requester):
+                tracing.record_stage("queue_wait", job.start_time - job.create_time, kind=job.kind)
+                self._run(job)
+
+    def _run(self, job: Job) -> None:
+        try:
+            result = job.func(*job.args, job=job, **job.kwargs)
+        except JobCancelled:
+            with self._cond:
+                self._finish(job, JOB_CANCELLED)
+        except Exception as e:
+            with self._cond:
+                self._finish(job, JOB_FAILED, error=str(e) or e.__class__.__name__)
+        else:
+            with self._cond:
+                job.result = result
+                job.progress = 1.0
+                self._finish(job, JOB_SUCCEEDED)
+        self._publish(job)
+        tracing.event(
+            "job_finished",
+            kind=job.kind,
+            status=job.status,
+            error=job.error,
+            run_ms=round((job.finish_time - job.start_time) * 1000, 2),
+        )
+
+    def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        # 调用方需持有 self._cond
+        job.status = status
+        job.error = error
+        job.finish_time = time.time()
+        JOBS_FINISHED.labels(kind=job.kind, status=status).inc()
+        job._done.set()
+        for loop, future in job._waiters:
+            loop.call_soon_threadsafe(_resolve_future, future)
+        job._waiters.clear()
+        # 批量任务结束后可能有等待执行名额的批量任务
+        self._cond.notify_all()
+
+    def _publish(self, job: Job) -> None:
+        """
+        将任务快照写入共享状态 (调用方不得持有 self._cond)。未结束的任务快照在心跳超时后过期，
+        结束后保留 result_ttl 秒并释放内容指纹的登记。共享存储不可用时只记录日志，不影响任务本身。
+        """
+        try:
+            with job._publish_lock:
+                finished = job.finished
+                self.store.set(_job_key(job.id), job.snapshot(), ttl=self.result_ttl if finished else self.heartbeat_ttl)
+            if finished:
+                self._unclaim(job)
+                self.store.delete(_cancel_key(job.id))
+        except Exception as e:
+            tracing.event("job_publish_failed", job_id=job.id, error=str(e))
+
+    def _heartbeat_loop(self) -> None:
+        while not self._heartbeat_stop.wait(self.heartbeat_interval):
+            with self._cond:
+                jobs = [job for job in self._jobs.values() if not job.finished]
+            for job in jobs:
+                try:
+                    if not job.cancel_requested and self.store.get(_cancel_key(job.id)):
+                        self.cancel(job.id)
+                except Exception as e:
+                    tracing.event("job_cancel_check_failed", job_id=job.id, error=str(e))
+                if not job.finished:
+                    self._publish(job)
+                    self._refresh_claim(job)
+
+    def _refresh_claim(self, job: Job) -> None:
+        # 延长执行中任务的指纹登记，所属进程退出后登记随心跳超时过期
+        if self.coalesce and job.dedup_key is not None:
+            try:
+                self.store.set(_inflight_key(job.user_id, job.dedup_key), job.id, ttl=self.heartbeat_ttl)
+            except Exception as e:
+                tracing.event("job_claim_refresh_failed", job_id=job.id, error=str(e))
+
+    def counts(self) -> dict:
+        """
+        各状态的在途任务数 (供监控指标采集)。
+        """
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job.status == JOB_RUNNING)
+            return {(JOB_PENDING,): len(self._queue), (JOB_RUNNING,): running}
+
+    def _prune_locked(self) -> None:
+        # 清理超过保留时长的已结束任务，避免任务表无限增长
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finish_time > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+# 共享状态中的键：任务快照、取消标记、内容指纹登记与幂等记录
+JOB_KEY_PREFIX = "job:"
+
+def _job_key(job_id: str) -> str:
+    return f"{JOB_KEY_PREFIX}{job_id}"
+
+def _cancel_key(job_id: str) -> str:
+    return f"job-cancel:{job_id}"
+
+def _inflight_key(user_id: int, dedup_key: str) -> str:
+    return f"job-inflight:{user_id}:{dedup_key}"
+
+def _idempotency_key(user_id: int, idempotency_key: str) -> str:
+    return f"idempotency:{user_id}:{idempotency_key}"
+
+def _resolve_future(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+job_manager = JobManager(
+    worker_count=SYNTH_WORKER_COUNT,
+    max_queued=SYNTH_QUEUE_MAX,
+    max_per_user=SYNTH_QUEUE_PER_USER_MAX,
+    result_ttl=JOB_RESULT_TTL_SECONDS,
+    coalesce=SYNTH_COALESCE_ENABLED,
+    idempotency_ttl=IDEMPOTENCY_TTL_SECONDS,
+    max_batch_running=SYNTH_BATCH_MAX_RUNNING,
+)
+
+JOBS_IN_FLIGHT = metrics.gauge("audiobook_jobs_in_flight", "排队中与执行中的任务数", ["status"], collect=job_manager.counts)
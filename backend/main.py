@@ -1,28 +1,57 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
-from database import engine, Base
-from routers import auth, users, audio
+from database import engine, async_engine, Base
+from routers import auth, users, audio, jobs, media, books, texts, voices, metrics
+from jobs import job_manager
+from migrations import migrate
+import tts_service, transcoder, postprocess, synthesis_cache
+from reaper import storage_reaper
+import books as book_service
+from tracing import RequestTraceMiddleware
+from functools import lru_cache
+from typing import Optional
 import os
 from config import OUTPUT_DIR, VOICE_DIR, FRONTEND_DIST_DIR, TEMP_DIR, DATA_DIR
 
-# 创建必要的目录
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
-if not os.path.exists(VOICE_DIR):
-    os.makedirs(VOICE_DIR)
+def prepare_storage() -> None:
+    """
+    创建必要的目录 (可重复执行，多个工作进程同时启动也不会冲突)。
+    """
+    for directory in (OUTPUT_DIR, TEMP_DIR, DATA_DIR, VOICE_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期：启动时创建目录、加载合成缓存索引、建表与迁移 (在迁移锁内，多进程部署时依次执行)，
+    预热 TTS 客户端连接池、拉起合成任务工作线程、转码与后处理进程池、存储清理线程，关闭时停止。
+    上次运行中断的书籍合成任务在启动时标记为失败。
+    """
+    prepare_storage()
+    synthesis_cache.init()
+    migrate(engine, Base.metadata)
+    book_service.recover_interrupted()
+    tts_service.init_client_pool()
+    job_manager.start()
+    transcoder.start()
+    postprocess.start()
+    storage_reaper.start()
+    yield
+    storage_reaper.shutdown()
+    job_manager.shutdown()
+    transcoder.shutdown()
+    postprocess.shutdown()
+    await async_engine.dispose()
 
-Base.metadata.create_all(bind=engine)
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# 为每个请求分配关联 ID 并记录请求耗时，合成任务与分段线程中的追踪日志沿用同一 ID
+app.add_middleware(RequestTraceMiddleware)
 
-# 挂载输出目录 (用于访问生成的音频文件)
-app.mount("/output", StaticFiles(directory=OUTPUT_DIR), name="output")
-app.mount("/voice", StaticFiles(directory=VOICE_DIR), name="voice")
+# 目录在启动时 (lifespan) 创建，挂载时不检查
+app.mount("/voice", StaticFiles(directory=VOICE_DIR, check_dir=False), name="voice")
 
 # 挂载前端静态资源
 if os.path.exists(os.path.join(FRONTEND_DIST_DIR, "assets")):
@@ -30,7 +59,28 @@ if os.path.exists(os.path.join(FRONTEND_DIST_DIR, "assets")):
 
 app.include_router(auth.router)
 app.include_router(users.router)
+app.include_router(jobs.router)
 app.include_router(audio.router)
+app.include_router(books.router)
+app.include_router(texts.router)
+app.include_router(voices.router)
+app.include_router(metrics.router)
+# 输出目录 (生成的音频文件) 由 media 路由分发，支持 Range 与条件请求
+app.include_router(media.router)
+
+@lru_cache(maxsize=1024)
+def find_dist_file(full_path: str) -> Optional[str]:
+    """
+    查找 dist 中对应的静态文件，结果缓存，避免每个请求都访问文件系统。
+    构建产物只在部署时变化，重启服务即可刷新。
+    """
+    dist_dir_abs = os.path.abspath(FRONTEND_DIST_DIR)
+    file_path = os.path.abspath(os.path.join(dist_dir_abs, full_path))
+    if os.path.commonpath([file_path, dist_dir_abs]) != dist_dir_abs:
+        return None
+    if os.path.isfile(file_path):
+        return file_path
+    return None
 
 @app.get("/{full_path:path}")
 async def serve_spa(full_path: str):
@@ -39,8 +89,8 @@ async def serve_spa(full_path: str):
     如果路径对应的文件存在，则返回该文件；否则返回 index.html 以支持前端路由。
     """
     # 检查 dist 中是否存在文件 (例如 favicon.ico)
-    file_path = os.path.join(FRONTEND_DIST_DIR, full_path)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
+    file_path = find_dist_file(full_path)
+    if file_path:
         return FileResponse(file_path)
     
     # 否则返回 index.html 以支持 SPA 路由
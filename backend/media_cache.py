@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from email.utils import formatdate
+from config import MEDIA_CACHE_MAX_ENTRIES, MEDIA_CACHE_REVALIDATE_SECONDS
+
+# 支持 pread 的平台 (Linux/macOS) 缓存打开的文件描述符，多个请求可并发按偏移读取；
+# Windows 没有 pread，且打开的文件无法被删除，因此只缓存元数据，每次读取时重新打开文件
+CACHE_FILE_DESCRIPTORS = hasattr(os, "pread")
+
+class CachedFile:
+    """
+    热点文件的缓存条目：文件元数据、ETag，以及 (可选) 打开的文件描述符。
+    """
+    __slots__ = ("path", "fd", "size", "mtime", "etag", "last_modified", "checked_at", "readers", "evicted")
+
+    def __init__(self, path: str, stat: os.stat_result, fd):
+        self.path = path
+        self.fd = fd
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        # 文件名为 UUID 且内容不变，由 inode/大小/修改时间构成的 ETag 可作为强校验值
+        self.etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.checked_at = time.time()
+        self.readers = 0
+        self.evicted = False
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return self.etag == f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+class FileHandleCache:
+    """
+    最近播放文件的 LRU 缓存，避免每次请求都 stat/open。
+    条目被借出期间 (readers > 0) 即使被淘汰也不会关闭文件描述符，直到最后一个读者归还。
+    """
+    def __init__(self, max_entries: int, revalidate_seconds: float):
+        self.max_entries = max_entries
+        self.revalidate_seconds = revalidate_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire_cached(self, path: str) -> Optional[CachedFile]:
+        """
+        只查内存：条目存在且在重新校验间隔内时借出并返回，否则返回 None (不做任何文件操作，可在事件循环中调用)。
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and time.time() - entry.checked_at < self.revalidate_seconds:
+                self._entries.move_to_end(path)
+                entry.readers += 1
+                return entry
+        return None
+
+    def acquire(self, path: str) -> CachedFile:
+        """
+        借出文件条目，使用完毕后必须调用 release。文件不存在时抛出 FileNotFoundError。
+        未命中时需要 stat/open 文件，在协程中应放到线程池执行 (先用 acquire_cached 查内存)。
+        """
+        now = time.time()
+        entry = self.acquire_cached(path)
+        if entry is not None:
+            return entry
+        with self._lock:
+            entry = self._entries.get(path)
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            raise
+        if entry is not None and entry.matches(stat):
+            with self._lock:
+                if self._entries.get(path) is entry:
+                    entry.checked_at = now
+                    self._entries.move_to_end(path)
+                    entry.readers += 1
+                    return entry
+
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0)) if CACHE_FILE_DESCRIPTORS else None
+        new_entry = CachedFile(path, stat, fd)
+        new_entry.readers = 1
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._retire_locked(old)
+            self._entries[path] = new_entry
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._retire_locked(evicted)
+        return new_entry
+
+    def release(self, entry: CachedFile) -> None:
+        with self._lock:
+            entry.readers -= 1
+            if entry.evicted and entry.readers == 0:
+                self._close(entry)
+
+    def invalidate(self, path: str) -> None:
+        """
+        文件被删除或替换时调用，使缓存条目立即失效。
+        """
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._retire_locked(entry)
+
+    def read(self, entry: CachedFile, offset: int, length: int) -> bytes:
+        """
+        从指定偏移读取数据，可在多个线程中并发调用。
+        """
+        if entry.fd is not None:
+            return os.pread(entry.fd, length, offset)
+        with open(entry.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _retire_locked(self, entry: CachedFile) -> None:
+        entry.evicted = True
+        if entry.readers == 0:
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry: CachedFile) -> None:
+        if entry.fd is not None:
+            os.close(entry.fd)
+            entry.fd = None
+
+media_cache = FileHandleCache(MEDIA_CACHE_MAX_ENTRIES, MEDIA_CACHE_REVALIDATE_SECONDS)
@@ -0,0 +1,255 @@
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# 默认的耗时分桶 (秒)：覆盖从毫秒级的文件操作到分钟级的长文本合成
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# 实时率 (RTF，合成耗时 / 音频时长，小于 1 表示快于实时) 的分桶
+REALTIME_FACTOR_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0, 10.0)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    """
+    指标基类：按标签值组合保存子序列，线程安全。
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """
+        返回指定标签值对应的子序列 (首次访问时创建)。
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = self._new_series()
+        return series
+
+    def _default(self):
+        # 无标签指标直接在自身上调用 inc/observe 等方法
+        if self.labelnames:
+            raise ValueError(f"指标 {self.name} 需要指定标签")
+        return self.labels()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = float(value)
+
+class Counter(_Metric):
+    """
+    单调递增计数器。
+    """
+    kind = "counter"
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._series.items())
+        return [("", self.labelnames, key, series.value) for key, series in items]
+
+class Gauge(_Metric):
+    """
+    可增可减的瞬时值。
+    指定 collect 时在每次采集时调用它获取当前值：无标签指标返回数值，
+    有标签指标返回 {标签值元组: 数值}，用于队列长度、在途请求数等已由其他组件维护的状态。
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), collect: Optional[Callable] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default().dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default().set(value)
+
+    def _samples(self):
+        if self.collect is not None:
+            values = self.collect()
+            if not self.labelnames:
+                return [("", (), (), float(values))]
+            return [("", self.labelnames, tuple(str(v) for v in key), float(value)) for key, value in values.items()]
+        with self._lock:
+            items = list(self._series.items())
+        return [("", self.labelnames, key, series.value) for key, series in items]
+
+class _HistogramSeries:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class Histogram(_Metric):
+    """
+    分桶直方图，输出累计桶计数、总和与次数 (与 Prometheus histogram 格式一致)。
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """
+        各标签组合的 (次数, 总和)，供基准测试等进程内汇总使用。
+        """
+        with self._lock:
+            items = list(self._series.items())
+        totals = {}
+        for key, series in items:
+            _, total, count = series.snapshot()
+            totals[key] = (count, total)
+        return totals
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._series.items())
+        samples = []
+        names = self.labelnames + ("le",)
+        for key, series in items:
+            counts, total, count = series.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", names, key + (_format_value(bound),), cumulative))
+            samples.append(("_sum", self.labelnames, key, total))
+            samples.append(("_count", self.labelnames, key, count))
+        return samples
+
+class Registry:
+    """
+    指标注册表，负责输出 Prometheus 文本格式 (0.0.4)。
+    """
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标重复注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = (), collect: Optional[Callable] = None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, collect))
+
+def histogram(name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+# 各阶段耗时：queue_wait (排队)、backend_wait (等待 TTS 服务并发名额)、gradio_connect (创建 Gradio 客户端)、
+# reference_upload (上传参考音频)、predict (TTS 推理)、concat (分段拼接)、postprocess (响度归一化、静音裁剪与拼接)、
+# file_copy (文件链接/复制/移动)、db_commit (数据库提交)
+STAGE_SECONDS = histogram("audiobook_stage_duration_seconds", "合成流程各阶段耗时 (秒)", ["stage"])
+
+# HTTP 请求
+HTTP_REQUEST_SECONDS = histogram(
+    "audiobook_http_request_duration_seconds", "HTTP 请求耗时 (至响应头发出，秒)", ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = gauge("audiobook_http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+# 合成结果
+SYNTHESIS_REALTIME_FACTOR = histogram(
+    "audiobook_synthesis_realtime_factor", "实时率 (RTF)：合成耗时 / 音频时长，小于 1 表示快于实时", ["mode"], REALTIME_FACTOR_BUCKETS
+)
+SYNTHESIS_AUDIO_SECONDS = counter("audiobook_synthesis_audio_seconds_total", "累计生成的音频时长 (秒)", ["mode"])
+SYNTHESIS_WALL_SECONDS = counter("audiobook_synthesis_wall_seconds_total", "累计合成耗时 (秒)", ["mode"])
+SYNTHESIS_FAILURES = counter("audiobook_synthesis_failures_total", "合成失败次数 (按原因)", ["mode", "cause"])
+
+# TTS 服务调用
+TTS_BACKEND_ERRORS = counter("audiobook_tts_backend_errors_total", "TTS 服务调用失败次数 (按服务与原因)", ["backend", "cause"])
@@ -0,0 +1,109 @@
+"""
+输出目录分片迁移工具 (一次性执行，服务运行期间也可执行)。
+
+1. 把直接位于 output/data 与 output/temp 下的音频文件移动到分片子目录 (同一文件系统内为原子重命名)；
+2. 把 audios 表中仍为平铺路径的 audio_path/flac_path/lossy_path 改写为分片路径，按批提交。
+
+迁移过程中旧链接始终可用：文件移动后、记录更新前，平铺路径由 resolve_output_path_to_abs_path
+与媒体分发接口自动解析到分片位置。中断后可重复执行，已迁移的文件与记录会被跳过。
+
+用法 (在 backend 目录下运行)：
+    python migrate_storage.py --dry-run
+    python migrate_storage.py
+"""
+import argparse
+import json
+import os
+import models
+from database import SessionLocal
+from reaper import AUDIO_EXTENSIONS
+from storage import SHARDED_DIRS, sharded_path, output_url, path_candidates, literal_output_path, move_file
+from config import STORAGE_SHARD_LEVELS
+
+# 每批更新的记录数
+BATCH_SIZE = 500
+
+# audios 表中保存文件路径的列
+PATH_COLUMNS = ("audio_path", "flac_path", "lossy_path")
+
+def move_flat_files(dry_run: bool) -> dict:
+    """
+    将 data/temp 目录顶层的音频文件移动到分片子目录，返回各目录移动的文件数与字节数。
+    """
+    stats = {}
+    for directory in SHARDED_DIRS:
+        moved = moved_bytes = 0
+        if os.path.isdir(directory):
+            with os.scandir(directory) as entries:
+                flat = [
+                    entry for entry in entries
+                    if entry.name.lower().endswith(AUDIO_EXTENSIONS) and entry.is_file(follow_symlinks=False)
+                ]
+            for entry in flat:
+                size = entry.stat().st_size
+                if not dry_run:
+                    move_file(entry.path, sharded_path(directory, entry.name))
+                moved += 1
+                moved_bytes += size
+        stats[os.path.basename(directory)] = {"files_moved": moved, "bytes_moved": moved_bytes}
+    return stats
+
+def rewrite_rows(dry_run: bool) -> dict:
+    """
+    按 ID 分批改写 audios 表中的平铺路径。只有分片位置上已存在文件时才改写，
+    文件缺失的记录保持原样 (由存储清理任务按悬空记录处理)。
+    """
+    rewritten = missing = 0
+    last_id = 0
+    db = SessionLocal()
+    try:
+        while True:
+            rows = (
+                db.query(models.Audio)
+                .filter(models.Audio.id > last_id)
+                .order_by(models.Audio.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+            for audio in rows:
+                changed = False
+                for column in PATH_COLUMNS:
+                    url_path = getattr(audio, column)
+                    if not url_path:
+                        continue
+                    candidates = path_candidates(literal_output_path(url_path))
+                    if len(candidates) == 1:
+                        # 已经是分片路径，或不在 data/temp 目录下
+                        continue
+                    # 试运行时文件尚未移动，原位置存在即视为可迁移
+                    if os.path.exists(candidates[0]) or (dry_run and os.path.exists(candidates[1])):
+                        setattr(audio, column, output_url(candidates[0]))
+                        changed = True
+                    else:
+                        missing += 1
+                rewritten += changed
+            last_id = rows[-1].id
+            if dry_run:
+                db.rollback()
+            else:
+                db.commit()
+    finally:
+        db.close()
+    return {"rows_rewritten": rewritten, "paths_missing": missing}
+
+def main():
+    parser = argparse.ArgumentParser(description="将输出目录迁移为分片布局")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不移动文件、不修改数据库")
+    args = parser.parse_args()
+    if not STORAGE_SHARD_LEVELS:
+        print("STORAGE_SHARD_LEVELS 为 0，未启用分片，无需迁移")
+        return
+    report = {"files": move_flat_files(args.dry_run)}
+    report["rows"] = rewrite_rows(args.dry_run)
+    report["dry_run"] = args.dry_run
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+
+# Base.metadata.create_all 只会创建缺失的表，不会修改已有表。
+# 新版本给已有表增加的列登记在这里，启动时为旧数据库补齐: (表名, 列名, 列定义)
+ADDED_COLUMNS = [
+    ("audios", "flac_path", "TEXT"),
+    ("audios", "lossy_path", "TEXT"),
+    ("audios", "lossy_format", "VARCHAR"),
+    ("audios", "transcode_status", "VARCHAR"),
+]
+
+# 新版本为已有表增加的索引: (索引名, 表名, 索引列定义)
+ADDED_INDEXES = [
+    ("ix_audios_user_id_create_time", "audios", "user_id, create_time DESC, id DESC"),
+]
+
+# PostgreSQL advisory lock 的键 (任意固定的 64 位整数)
+MIGRATION_LOCK_KEY = 0x61756469
+
+@contextmanager
+def migration_lock(engine):
+    """
+    跨进程的建表/迁移锁：多个工作进程 (uvicorn --workers) 或节点同时启动时依次执行，
+    后获得锁的进程看到表与列均已存在，直接跳过。
+    PostgreSQL 使用会话级 advisory lock；SQLite 对数据库文件旁的锁文件加 flock (SQLite 只在单节点上使用)。
+    不支持 flock 的平台 (Windows) 与其他数据库不加锁。
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+    database = engine.url.database
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:" or fcntl is None:
+        yield
+        return
+    with open(f"{database}.migrate.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def migrate(engine, metadata) -> None:
+    """
+    在迁移锁内创建缺失的表并补齐新增列与索引，由应用启动时 (lifespan) 调用。
+    """
+    with migration_lock(engine):
+        metadata.create_all(bind=engine)
+        run_migrations(engine)
+
+def run_migrations(engine) -> None:
+    """
+    为旧数据库补齐新增列与索引，已存在的直接跳过，可重复执行。
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        for name, table, columns in ADDED_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Index
 from datetime import datetime
 from database import Base
 
@@ -27,5 +27,104 @@ class Audio(Base):
     user_id = Column(Integer, index=True, nullable=False) # 关联的用户ID
     audio_path = Column(Text, nullable=False) # 音频文件存储路径
     emo_type = Column(Integer, default=0) # 情感类型: 0:喜, 1:怒, 2:哀, 3:惧 
+    flac_path = Column(Text) # 无损 FLAC 母版路径
+    lossy_path = Column(Text) # 轻量格式 (Opus/MP3) 路径
+    lossy_format = Column(String) # 轻量格式: 'opus' 或 'mp3'
+    transcode_status = Column(String, default="pending") # 转码状态: 'pending', 'done', 'failed'
     create_time = Column(DateTime, default=datetime.now) # 创建时间
     update_time = Column(DateTime, default=datetime.now, onupdate=datetime.now) # 更新时间
+
+    # 历史列表按用户、创建时间倒序分页，复合索引使翻页查询无需排序
+    __table_args__ = (
+        Index("ix_audios_user_id_create_time", user_id, create_time.desc(), id.desc()),
+    )
+
+class Book(Base):
+    """
+    批量合成的书籍 (一组章节)
+    """
+    __tablename__ = "books"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, index=True, nullable=False) # 关联的用户ID
+    title = Column(String, nullable=False) # 书名
+    emo_type = Column(Integer, default=0) # 情感类型
+    status = Column(String, default="pending") # 状态: 'pending', 'running', 'succeeded', 'failed', 'cancelled'
+    job_id = Column(String) # 对应的合成任务 ID
+    total_chars = Column(Integer, default=0) # 总字数
+    done_chars = Column(Integer, default=0) # 已完成章节的字数
+    audio_seconds = Column(Float, default=0) # 已生成音频总时长 (秒)
+    error = Column(Text) # 失败原因
+    create_time = Column(DateTime, default=datetime.now) # 创建时间
+    start_time = Column(DateTime) # 开始合成时间
+    finish_time = Column(DateTime) # 结束时间
+
+class Chapter(Base):
+    """
+    书籍中的单个章节
+    """
+    __tablename__ = "chapters"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    book_id = Column(Integer, index=True, nullable=False) # 关联的书籍ID
+    seq = Column(Integer, nullable=False) # 章节序号 (从 1 开始)
+    title = Column(String) # 章节标题
+    text = Column(Text, nullable=False) # 章节正文
+    char_count = Column(Integer, default=0) # 字数
+    status = Column(String, default="pending") # 状态: 'pending', 'running', 'succeeded', 'failed', 'cancelled'
+    audio_id = Column(Integer) # 合成完成后对应的音频记录ID
+    audio_seconds = Column(Float, default=0) # 音频时长 (秒)
+    error = Column(Text) # 失败原因
+    start_time = Column(DateTime) # 开始合成时间
+    finish_time = Column(DateTime) # 结束时间
+
+class TextDocument(Base):
+    """
+    服务端保存的上传文本 (按章节拆分存储)
+    """
+    __tablename__ = "text_documents"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, index=True, nullable=False) # 关联的用户ID
+    filename = Column(String) # 原始文件名
+    encoding = Column(String) # 识别出的文本编码
+    char_count = Column(Integer, default=0) # 总字数
+    chapter_count = Column(Integer, default=0) # 章节数
+    create_time = Column(DateTime, default=datetime.now) # 上传时间
+
+class TextChapter(Base):
+    """
+    上传文本中的单个章节
+    """
+    __tablename__ = "text_chapters"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    document_id = Column(Integer, index=True, nullable=False) # 关联的文本ID
+    seq = Column(Integer, nullable=False) # 章节序号 (从 1 开始)
+    title = Column(String) # 章节标题
+    text = Column(Text, nullable=False) # 规范化后的章节正文
+    char_count = Column(Integer, default=0) # 字数
+
+class Voice(Base):
+    """
+    音色库中的参考音频 (上传后已统一采样率、响度并裁剪)
+    """
+    __tablename__ = "voices"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False) # 上传者的用户ID
+    name = Column(String, nullable=False) # 音色名称
+    emo_type = Column(Integer) # 情感标签 (可选): 0:喜, 1:怒, 2:哀, 3:惧
+    content_hash = Column(String, index=True, nullable=False) # 处理后音频内容的 SHA-256，同内容文件只存一份
+    audio_path = Column(Text, nullable=False) # 处理后音频的 URL 路径 (/voice/library/...)
+    duration = Column(Float, default=0.0) # 处理后时长 (秒)
+    sample_rate = Column(Integer) # 处理后采样率
+    original_bytes = Column(Integer, default=0) # 上传文件大小
+    stored_bytes = Column(Integer, default=0) # 处理后文件大小
+    create_time = Column(DateTime, default=datetime.now) # 上传时间
+
+    # 音色列表按用户、上传时间倒序查询；同一用户重复上传相同内容时直接返回已有记录
+    __table_args__ = (
+        Index("ix_voices_user_id_create_time", user_id, create_time.desc()),
+        Index("ix_voices_user_id_content_hash", user_id, content_hash, unique=True),
+    )
@@ -0,0 +1,378 @@
+import math
+import os
+import struct
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from config import (
+    POSTPROCESS_WORKERS,
+    POSTPROCESS_TARGET_RMS_DBFS,
+    POSTPROCESS_TARGET_LUFS,
+    POSTPROCESS_PEAK_DBFS,
+    POSTPROCESS_MAX_GAIN_DB,
+    POSTPROCESS_SILENCE_DBFS,
+    POSTPROCESS_EDGE_PAD_MS,
+    POSTPROCESS_JOIN_MAX_MS,
+    TTS_SEGMENT_GAP_MS,
+)
+
+NORMALIZE_MODES = ("rms", "lufs")
+JOIN_MODES = ("gap", "crossfade")
+
+# 各采样宽度对应的 PCM 数据类型与满幅值 (8 位 PCM 为无符号格式)
+SAMPLE_DTYPES = {1: (np.uint8, 128.0), 2: (np.dtype("<i2"), 32768.0), 4: (np.dtype("<i4"), 2147483648.0)}
+
+# 逐块处理的帧数：内存占用只与块大小有关，与音频时长无关
+CHUNK_FRAMES = 256 * 1024
+
+# 静音检测的分析帧长 (毫秒)
+TRIM_FRAME_MS = 10
+
+# 响度测量 (ITU-R BS.1770)：100ms 子块，4 个子块组成一个 400ms 测量块 (75% 重叠)
+SUBBLOCK_MS = 100
+SUBBLOCKS_PER_BLOCK = 4
+LUFS_ABSOLUTE_GATE = -70.0
+LUFS_RELATIVE_GATE = -10.0
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+class PostProcessOptions:
+    """
+    合成结果的后处理参数，随任务传入进程池 (需可序列化)。
+    normalize 为 None / "rms" / "lufs"，target_level 为对应的目标电平 (dBFS 或 LUFS)；
+    trim_silence 时裁掉每个分段首尾低于 silence_db 的静音；join 为分段之间插入静音 ("gap") 或交叉淡化 ("crossfade")。
+    """
+    def __init__(self, normalize: Optional[str] = None, target_level: Optional[float] = None, trim_silence: bool = False,
+                 silence_db: float = POSTPROCESS_SILENCE_DBFS, join: str = "gap", join_ms: int = TTS_SEGMENT_GAP_MS):
+        self.normalize = normalize
+        self.target_level = target_level
+        self.trim_silence = trim_silence
+        self.silence_db = silence_db
+        self.join = join
+        self.join_ms = join_ms
+
+    def cache_params(self) -> dict:
+        """
+        纳入合成缓存键的参数。
+        """
+        return {
+            "normalize": self.normalize,
+            "target_level": self.target_level,
+            "trim_silence": self.trim_silence,
+            "silence_db": self.silence_db,
+            "join": self.join,
+            "join_ms": self.join_ms,
+        }
+
+def parse_options(normalize: Optional[str], target_level: Optional[float], trim_silence: bool,
+                  silence_threshold: Optional[float], join: Optional[str], join_ms: Optional[int]) -> Optional[PostProcessOptions]:
+    """
+    校验合成请求中的后处理参数。都未指定时返回 None，合成结果按原方式直接拼接。
+    """
+    if not normalize and not trim_silence and not join and join_ms is None:
+        return None
+    if normalize and normalize not in NORMALIZE_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的响度归一化方式: {normalize}")
+    if join and join not in JOIN_MODES:
+        raise HTTPException(status_code=400, detail=f"不支持的分段拼接方式: {join}")
+    if join_ms is not None and not 0 <= join_ms <= POSTPROCESS_JOIN_MAX_MS:
+        raise HTTPException(status_code=400, detail=f"拼接时长需在 0 到 {POSTPROCESS_JOIN_MAX_MS} 毫秒之间")
+    if target_level is not None and not -60 <= target_level <= 0:
+        raise HTTPException(status_code=400, detail="目标电平需在 -60 到 0 之间")
+    if silence_threshold is not None and not -90 <= silence_threshold <= -10:
+        raise HTTPException(status_code=400, detail="静音阈值需在 -90 到 -10 dBFS 之间")
+    if target_level is None and normalize:
+        target_level = POSTPROCESS_TARGET_LUFS if normalize == "lufs" else POSTPROCESS_TARGET_RMS_DBFS
+    return PostProcessOptions(
+        normalize=normalize or None,
+        target_level=target_level if normalize else None,
+        trim_silence=trim_silence,
+        silence_db=POSTPROCESS_SILENCE_DBFS if silence_threshold is None else silence_threshold,
+        join=join or "gap",
+        join_ms=TTS_SEGMENT_GAP_MS if join_ms is None else join_ms,
+    )
+
+class _Segment:
+    """
+    以内存映射方式打开的 WAV 分段：samples 为 (帧数, 声道数) 的只读数组，按需由操作系统分页读入。
+    """
+    def __init__(self, path: str):
+        with wave.open(path, "rb") as reader:
+            if reader.getcomptype() != "NONE":
+                raise ValueError(f"不支持的 WAV 编码: {path}")
+            self.params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+            frames = reader.getnframes()
+        channels, sampwidth, _ = self.params
+        if sampwidth not in SAMPLE_DTYPES:
+            raise ValueError(f"不支持的采样宽度: {sampwidth * 8} 位")
+        offset = _data_offset(path)
+        frames = min(frames, (os.path.getsize(path) - offset) // (channels * sampwidth))
+        dtype, self.scale = SAMPLE_DTYPES[sampwidth]
+        if frames > 0:
+            self.samples = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, channels))
+        else:
+            self.samples = np.zeros((0, channels), dtype=dtype)
+        self.start = 0
+        self.end = frames
+        self.gain = 1.0
+
+    @property
+    def rate(self) -> int:
+        return self.params[2]
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """
+        读取 [start, end) 帧并转换为 [-1, 1) 的 float32。
+        """
+        block = self.samples[start:end].astype(np.float32)
+        if self.params[1] == 1:
+            block -= 128.0
+        return block / self.scale
+
+def _data_offset(path: str) -> int:
+    """
+    查找 WAV 文件中 data 块的起始偏移 (跳过 LIST 等附加块)。
+    """
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"不是有效的 WAV 文件: {path}")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"WAV 文件缺少 data 块: {path}")
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"data":
+                return f.tell()
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+def _to_pcm(block: np.ndarray, sampwidth: int) -> bytes:
+    dtype, scale = SAMPLE_DTYPES[sampwidth]
+    block = np.clip(block * scale, -scale, scale - 1)
+    if sampwidth == 1:
+        block += 128.0
+    return np.rint(block).astype(dtype).tobytes()
+
+def _trim_bounds(segment: _Segment, silence_db: float) -> Tuple[int, int]:
+    """
+    按 10ms 帧的能量找出首尾静音，返回保留区间 [start, end) (前后各留 POSTPROCESS_EDGE_PAD_MS)。
+    整段都低于阈值时不裁剪。
+    """
+    frame = max(segment.rate * TRIM_FRAME_MS // 1000, 1)
+    threshold = 10 ** (silence_db / 10)
+    first = last = None
+    chunk = CHUNK_FRAMES // frame * frame
+    for pos in range(0, segment.end, chunk):
+        block = segment.read(pos, min(pos + chunk, segment.end))
+        count = -(-len(block) // frame)
+        power = np.square(block).mean(axis=1)
+        power = np.pad(power, (0, count * frame - len(power))).reshape(count, frame).mean(axis=1)
+        voiced = np.flatnonzero(power > threshold)
+        if len(voiced):
+            if first is None:
+                first = pos + int(voiced[0]) * frame
+            last = pos + (int(voiced[-1]) + 1) * frame
+    if first is None:
+        return 0, segment.end
+    pad = segment.rate * POSTPROCESS_EDGE_PAD_MS // 1000
+    return max(first - pad, 0), min(last + pad, segment.end)
+
+def _biquad_power(b: Tuple[float, float, float], a: Tuple[float, float, float], freqs: np.ndarray, rate: int) -> np.ndarray:
+    z = np.exp(-2j * np.pi * freqs / rate)
+    return np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+
+def _k_weighting(n: int, rate: int) -> np.ndarray:
+    """
+    BS.1770 K 加权 (高频搁架 + 高通) 在 n 点 rfft 各频点上的功率响应。
+    在频域按子块加权求能量，无需逐采样运行 IIR 滤波器。
+    """
+    freqs = np.fft.rfftfreq(n, 1.0 / rate)
+    gain, q, fc = 10 ** (4.0 / 40), 1 / math.sqrt(2), 1500.0
+    w0 = 2 * math.pi * fc / rate
+    alpha = math.sin(w0) / (2 * q)
+    root = 2 * math.sqrt(gain) * alpha
+    shelf = _biquad_power(
+        (gain * ((gain + 1) + (gain - 1) * math.cos(w0) + root),
+         -2 * gain * ((gain - 1) + (gain + 1) * math.cos(w0)),
+         gain * ((gain + 1) + (gain - 1) * math.cos(w0) - root)),
+        ((gain + 1) - (gain - 1) * math.cos(w0) + root,
+         2 * ((gain - 1) - (gain + 1) * math.cos(w0)),
+         (gain + 1) - (gain - 1) * math.cos(w0) - root),
+        freqs, rate,
+    )
+    q, fc = 0.5, 38.0
+    w0 = 2 * math.pi * fc / rate
+    alpha = math.sin(w0) / (2 * q)
+    high_pass = _biquad_power(
+        ((1 + math.cos(w0)) / 2, -(1 + math.cos(w0)), (1 + math.cos(w0)) / 2),
+        (1 + alpha, -2 * math.cos(w0), 1 - alpha),
+        freqs, rate,
+    )
+    return shelf * high_pass
+
+def _subblock_powers(segment: _Segment, weighted: bool) -> np.ndarray:
+    """
+    保留区间内各 100ms 子块的均方功率。weighted 时先做 K 加权并按 BS.1770 对各声道求和，否则取各声道平均。不足一个子块的尾部忽略。
+    """
+    n = segment.rate * SUBBLOCK_MS // 1000
+    weights = None
+    if weighted:
+        # Parseval：rfft 中除直流与奈奎斯特频点外，每个频点代表正负两个频率
+        weights = np.full(n // 2 + 1, 2.0)
+        weights[0] = 1.0
+        if n % 2 == 0:
+            weights[-1] = 1.0
+        weights *= _k_weighting(n, segment.rate) / (n * n)
+    powers = []
+    chunk = CHUNK_FRAMES // n * n
+    for pos in range(segment.start, segment.end - n + 1, chunk):
+        block = segment.read(pos, min(pos + chunk, segment.end))
+        count = len(block) // n
+        block = block[:count * n].reshape(count, n, block.shape[1])
+        if weights is None:
+            powers.append(np.square(block).mean(axis=(1, 2)))
+        else:
+            spectrum = np.fft.rfft(block, axis=1)
+            powers.append((np.square(np.abs(spectrum)) * weights[None, :, None]).sum(axis=(1, 2)))
+    return np.concatenate(powers) if powers else np.zeros(0)
+
+def _gated_level(powers: np.ndarray, absolute_gate: float, relative_gate: Optional[float], offset: float) -> Optional[float]:
+    """
+    由子块功率计算 400ms 块的门限平均电平 (dB)：先去掉低于绝对门限的块，再去掉比平均值低 relative_gate 以上的块。
+    不足一个完整块时按所有子块的平均值计算。
+    """
+    if len(powers) == 0:
+        return None
+    if len(powers) < SUBBLOCKS_PER_BLOCK:
+        blocks = np.array([powers.mean()])
+    else:
+        blocks = np.convolve(powers, np.full(SUBBLOCKS_PER_BLOCK, 1.0 / SUBBLOCKS_PER_BLOCK), mode="valid")
+    with np.errstate(divide="ignore"):
+        levels = offset + 10 * np.log10(blocks)
+    gated = blocks[levels > absolute_gate]
+    if len(gated) == 0:
+        return None
+    if relative_gate is not None:
+        threshold = offset + 10 * math.log10(gated.mean()) + relative_gate
+        gated = blocks[(levels > absolute_gate) & (levels > threshold)]
+    return offset + 10 * math.log10(gated.mean())
+
+def _peak(segment: _Segment) -> float:
+    peak = 0.0
+    for pos in range(segment.start, segment.end, CHUNK_FRAMES):
+        block = segment.read(pos, min(pos + CHUNK_FRAMES, segment.end))
+        peak = max(peak, float(np.abs(block).max(initial=0.0)))
+    return peak
+
+def _segment_gain(segment: _Segment, options: PostProcessOptions) -> float:
+    """
+    计算分段的归一化增益：把门限平均电平调整到目标值，增益不超过 ±POSTPROCESS_MAX_GAIN_DB，且峰值不超过 POSTPROCESS_PEAK_DBFS。
+    """
+    if options.normalize == "lufs":
+        level = _gated_level(_subblock_powers(segment, True), LUFS_ABSOLUTE_GATE, LUFS_RELATIVE_GATE, -0.691)
+    else:
+        level = _gated_level(_subblock_powers(segment, False), options.silence_db, None, 0.0)
+    if level is None:
+        return 1.0
+    gain_db = max(min(options.target_level - level, POSTPROCESS_MAX_GAIN_DB), -POSTPROCESS_MAX_GAIN_DB)
+    gain = 10 ** (gain_db / 20)
+    peak = _peak(segment)
+    if peak > 0:
+        gain = min(gain, 10 ** (POSTPROCESS_PEAK_DBFS / 20) / peak)
+    return gain
+
+def render(segment_paths: List[str], output_path: str, options: PostProcessOptions) -> dict:
+    """
+    在进程池中执行：逐个分段裁剪静音、归一化响度，再按 join 方式拼接写入 output_path。
+    分段以内存映射方式读取、逐块处理，内存占用与音频总时长无关。
+    输出先写入 .part 文件再原子替换；返回处理统计 (供追踪日志使用)。
+    """
+    segments = []
+    for path in segment_paths:
+        segment = _Segment(path)
+        if segments and segment.params != segments[0].params:
+            raise ValueError(f"分段音频格式不一致: {segment.params} != {segments[0].params}")
+        if options.trim_silence:
+            segment.start, segment.end = _trim_bounds(segment, options.silence_db)
+        if options.normalize:
+            segment.gain = _segment_gain(segment, options)
+        segments.append(segment)
+    if not segments:
+        raise ValueError("没有可拼接的音频分段")
+
+    channels, sampwidth, rate = segments[0].params
+    join_frames = rate * options.join_ms // 1000
+    crossfade = options.join == "crossfade" and join_frames > 0
+    part_path = output_path + ".part"
+    written = 0
+    try:
+        with wave.open(part_path, "wb") as writer:
+            writer.setnchannels(channels)
+            writer.setsampwidth(sampwidth)
+            writer.setframerate(rate)
+
+            def write(block: np.ndarray) -> None:
+                nonlocal written
+                if len(block):
+                    writer.writeframes(_to_pcm(block, sampwidth))
+                    written += len(block)
+
+            # 交叉淡化时每个分段末尾 join_frames 帧暂不写出，与下一分段开头按等功率曲线混合
+            tail = None
+            for index, segment in enumerate(segments):
+                head = 0
+                if index > 0 and crossfade and tail is not None:
+                    overlap = min(len(tail), segment.end - segment.start)
+                    write(tail[:len(tail) - overlap])
+                    t = (np.arange(overlap, dtype=np.float32) + 0.5) / max(overlap, 1) * (np.pi / 2)
+                    mixed = tail[len(tail) - overlap:] * np.cos(t)[:, None]
+                    mixed += segment.read(segment.start, segment.start + overlap) * segment.gain * np.sin(t)[:, None]
+                    write(mixed)
+                    head = overlap
+                elif index > 0 and not crossfade:
+                    for pos in range(0, join_frames, CHUNK_FRAMES):
+                        write(np.zeros((min(CHUNK_FRAMES, join_frames - pos), channels), dtype=np.float32))
+                last = index == len(segments) - 1
+                hold = min(join_frames, segment.end - segment.start - head) if crossfade and not last else 0
+                stop = segment.end - hold
+                for pos in range(segment.start + head, stop, CHUNK_FRAMES):
+                    write(segment.read(pos, min(pos + CHUNK_FRAMES, stop)) * segment.gain)
+                tail = segment.read(stop, segment.end) * segment.gain if hold else None
+        os.replace(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    gains = [20 * math.log10(segment.gain) for segment in segments]
+    return {
+        "segments": len(segments),
+        "input_seconds": round(sum(len(segment.samples) for segment in segments) / rate, 3),
+        "output_seconds": round(written / rate, 3),
+        "gain_db_min": round(min(gains), 2),
+        "gain_db_max": round(max(gains), 2),
+    }
+
+def start() -> None:
+    """
+    创建后处理进程池。POSTPROCESS_WORKERS 为 0 时不创建，后处理在合成线程中直接执行。
+    """
+    global _executor
+    if POSTPROCESS_WORKERS > 0 and _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=POSTPROCESS_WORKERS)
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def process(segment_paths: List[str], output_path: str, options: PostProcessOptions) -> dict:
+    """
+    对分段执行后处理并写入 output_path (在工作线程中调用，阻塞至处理完成)。
+    进程池未启动时直接在当前线程处理。
+    """
+    if _executor is None:
+        return render(segment_paths, output_path, options)
+    return _executor.submit(render, segment_paths, output_path, options).result()
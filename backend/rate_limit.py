@@ -0,0 +1,43 @@
+import time
+from typing import Optional
+from state_store import StateStore, state_store
+
+class SlidingWindowLimiter:
+    """
+    滑动窗口计数限流器，事件记录在共享状态存储中，多个工作进程或节点共同计数。
+    check 判断某个键是否已达上限，add 记录一次事件；达到上限时返回需要等待的秒数。
+    name 区分不同的限流器 (各自独立计数)。
+    """
+    def __init__(self, name: str, limit: int, window: float, store: StateStore = state_store):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.store = store
+
+    def check(self, key: str) -> Optional[float]:
+        """
+        已达上限时返回距离最早一次事件过期的秒数，否则返回 None。
+        """
+        now = time.time()
+        events = self.store.events(self._key(key), now - self.window)
+        if len(events) < self.limit:
+            return None
+        return max(events[0] + self.window - now, 0.0)
+
+    def add(self, key: str) -> None:
+        self.store.record_event(self._key(key), time.time(), self.window)
+
+    def hit(self, key: str) -> Optional[float]:
+        """
+        检查并记录一次事件，已达上限时不记录并返回需要等待的秒数。
+        """
+        retry_after = self.check(key)
+        if retry_after is None:
+            self.add(key)
+        return retry_after
+
+    def reset(self, key: str) -> None:
+        self.store.clear_events(self._key(key))
+
+    def _key(self, key: str) -> str:
+        return f"ratelimit:{self.name}:{key}"
@@ -0,0 +1,350 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, update
+import models
+from database import SessionLocal
+from storage import resolve_output_path_to_abs_path, temp_files, is_shard_dir_name
+from media_cache import media_cache
+from state_store import StateStore, state_store, instance_id
+from config import (
+    OUTPUT_DIR,
+    TEMP_DIR,
+    DATA_DIR,
+    STORAGE_REAPER_ENABLED,
+    STORAGE_REAPER_INTERVAL_SECONDS,
+    TEMP_MAX_AGE_SECONDS,
+    TEMP_MAX_BYTES,
+    TEMP_MIN_AGE_SECONDS,
+    ORPHAN_GRACE_SECONDS,
+    USER_QUOTA_BYTES,
+)
+
+# 清理器只处理音频文件与转码中断留下的 .part 文件，目录中的其他文件 (如说明文件、缓存目录) 保持不变
+AUDIO_EXTENSIONS = (".wav", ".flac", ".opus", ".mp3")
+PART_SUFFIX = ".part"
+
+# 批量删除记录时每条语句包含的 ID 数
+DELETE_BATCH_SIZE = 500
+
+def _is_managed_file(name: str) -> bool:
+    name = name.lower()
+    return name.endswith(AUDIO_EXTENSIONS) or name.endswith(PART_SUFFIX)
+
+def scan_files(directory: str, files: Optional[Dict[str, Tuple[int, float]]] = None) -> Dict[str, Tuple[int, float]]:
+    """
+    用 os.scandir 遍历目录及其分片子目录，返回 {绝对路径: (大小, 修改时间)}。
+    目录项自带类型信息，十万级文件也只需逐目录读取一次加逐个 stat；cache 等非分片子目录不进入。
+    """
+    files = {} if files is None else files
+    if not os.path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if is_shard_dir_name(entry.name):
+                        scan_files(entry.path, files)
+                    continue
+                if not _is_managed_file(entry.name) or not entry.is_file(follow_symlinks=False):
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                # 扫描期间被删除
+                continue
+            files[os.path.abspath(entry.path)] = (stat.st_size, stat.st_mtime)
+    return files
+
+def remove_file(path: str) -> int:
+    """
+    删除文件并返回释放的字节数，文件已不存在时返回 0；其他错误 (如权限不足) 向上抛出。
+    """
+    try:
+        size = os.stat(path).st_size
+        os.remove(path)
+    except FileNotFoundError:
+        size = 0
+    media_cache.invalidate(path)
+    return size
+
+def audio_file_paths(audio) -> List[str]:
+    """
+    音频记录引用的全部文件 (原始文件与各转码副本) 的绝对路径，只返回输出目录内的路径。
+    audio 可以是 ORM 对象或包含 audio_path/flac_path/lossy_path 的行。
+    """
+    output_dir_abs = os.path.abspath(OUTPUT_DIR)
+    paths = []
+    for url_path in (audio.audio_path, audio.flac_path, audio.lossy_path):
+        if not url_path:
+            continue
+        path = resolve_output_path_to_abs_path(url_path)
+        if path and os.path.commonpath([path, output_dir_abs]) == output_dir_abs and path not in paths:
+            paths.append(path)
+    return paths
+
+def remove_audio_files(paths: Iterable[str]) -> Tuple[int, List[str]]:
+    """
+    删除一组音频文件，返回 (释放的字节数, 删除失败的路径)。
+    单个文件失败不影响其余文件，由调用方决定如何处理失败。
+    """
+    freed = 0
+    failed = []
+    for path in paths:
+        try:
+            freed += remove_file(path)
+        except OSError as e:
+            print(f"Failed to remove {path}: {e}")
+            failed.append(path)
+    return freed, failed
+
+class StorageUsage:
+    """
+    各用户持久存储占用 (字节)，保存在共享状态中，多个工作进程看到同一份数据。
+    每次对账时按实际文件大小整体刷新，两次对账之间由保存/删除接口增量更新，
+    配额检查因此无需逐个 stat 用户的全部文件。
+    """
+    KEY_PREFIX = "storage-usage:"
+
+    def __init__(self, store: StateStore = state_store):
+        self.store = store
+
+    def replace(self, usage: Dict[int, int]) -> None:
+        for key in self.store.scan(self.KEY_PREFIX):
+            if int(key[len(self.KEY_PREFIX):]) not in usage:
+                self.store.delete(key)
+        for user_id, used in usage.items():
+            self.store.set(self._key(user_id), used)
+
+    def add(self, user_id: int, delta: int) -> None:
+        self.store.incr(self._key(user_id), delta)
+
+    def remove_user(self, user_id: int) -> None:
+        self.store.delete(self._key(user_id))
+
+    def get(self, user_id: int) -> int:
+        # 增量更新与对账交错时可能短暂为负，按 0 计
+        return max(self.store.get(self._key(user_id)) or 0, 0)
+
+    def snapshot(self) -> Dict[int, int]:
+        return {
+            int(key[len(self.KEY_PREFIX):]): max(used, 0)
+            for key, used in self.store.scan(self.KEY_PREFIX).items()
+        }
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}{user_id}"
+
+storage_usage = StorageUsage()
+
+def quota_for(user: models.User) -> Optional[int]:
+    """
+    用户的存储配额，None 表示不限制。
+    """
+    if user.role == "admin":
+        return None
+    return USER_QUOTA_BYTES
+
+def quota_exceeded(user: models.User, extra_bytes: int = 0) -> bool:
+    """
+    判断写入 extra_bytes 后是否超出用户配额。
+    """
+    quota = quota_for(user)
+    return quota is not None and storage_usage.get(user.id) + extra_bytes > quota
+
+def reap_temp(now: Optional[float] = None) -> dict:
+    """
+    清理临时目录中未保存的音频：先删除超过 TEMP_MAX_AGE_SECONDS 的文件，
+    总大小仍超过 TEMP_MAX_BYTES 时从最旧的文件开始删除 (跳过 TEMP_MIN_AGE_SECONDS 内生成的文件)。
+    合成缓存位于子目录中，由缓存自身按 LRU 管理，这里不做处理。
+    """
+    now = now or time.time()
+    files = scan_files(TEMP_DIR)
+    removed = reclaimed = failed = 0
+    total = sum(size for size, _ in files.values())
+    # 从最旧的文件开始：过期的一律删除，未过期的仅在总大小超限时删除
+    for path, (size, mtime) in sorted(files.items(), key=lambda item: item[1][1]):
+        age = now - mtime
+        if age <= TEMP_MAX_AGE_SECONDS and (total <= TEMP_MAX_BYTES or age < TEMP_MIN_AGE_SECONDS):
+            continue
+        try:
+            reclaimed += remove_file(path)
+        except OSError as e:
+            print(f"Failed to remove {path}: {e}")
+            failed += 1
+            continue
+        temp_files.release(path)
+        removed += 1
+        total -= size
+    return {
+        "files_scanned": len(files),
+        "files_removed": removed,
+        "bytes_reclaimed": reclaimed,
+        "bytes_remaining": total,
+        "failed": failed,
+    }
+
+def reconcile_data(now: Optional[float] = None) -> dict:
+    """
+    持久目录与 audios 表双向对账：
+    - 记录引用的文件全部不存在，或所属用户已删除的记录：删除记录 (后者连同文件)；
+    - 目录中没有任何记录引用、且超过 ORPHAN_GRACE_SECONDS 的文件：删除文件。
+    同时按实际文件大小刷新各用户的存储占用。
+    """
+    now = now or time.time()
+    files = scan_files(DATA_DIR)
+    referenced = set()
+    usage: Dict[int, int] = {}
+    dangling_ids = []
+    orphan_user_rows = []
+    db = SessionLocal()
+    try:
+        user_ids = {user_id for (user_id,) in db.query(models.User.id)}
+        # 记录创建时间晚于该时刻的不判定为悬空 (文件可能正由转码回调替换)
+        row_cutoff = datetime.now() - timedelta(seconds=ORPHAN_GRACE_SECONDS)
+        rows = db.query(
+            models.Audio.id, models.Audio.user_id, models.Audio.audio_path,
+            models.Audio.flac_path, models.Audio.lossy_path, models.Audio.create_time,
+        ).yield_per(1000)
+        for row in rows:
+            paths = audio_file_paths(row)
+            referenced.update(paths)
+            if row.user_id not in user_ids:
+                orphan_user_rows.append((row.id, paths))
+                continue
+            sizes = [files[p][0] if p in files else _size_outside_scan(p) for p in paths]
+            existing = [s for s in sizes if s is not None]
+            if not existing and row.create_time and row.create_time < row_cutoff:
+                dangling_ids.append(row.id)
+                continue
+            usage[row.user_id] = usage.get(row.user_id, 0) + sum(existing)
+
+        deleted_user_bytes = 0
+        for _, paths in orphan_user_rows:
+            deleted_user_bytes += remove_audio_files(paths)[0]
+        stale_ids = dangling_ids + [row_id for row_id, _ in orphan_user_rows]
+        for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+            batch = stale_ids[start:start + DELETE_BATCH_SIZE]
+            db.execute(update(models.Chapter).where(models.Chapter.audio_id.in_(batch)).values(audio_id=None))
+            db.execute(delete(models.Audio).where(models.Audio.id.in_(batch)))
+        db.commit()
+    finally:
+        db.close()
+
+    orphan_paths = [
+        path for path, (_, mtime) in files.items()
+        if path not in referenced and now - mtime > ORPHAN_GRACE_SECONDS
+    ]
+    orphan_bytes, failed = remove_audio_files(orphan_paths)
+    storage_usage.replace(usage)
+    return {
+        "files_scanned": len(files),
+        "orphan_files_removed": len(orphan_paths) - len(failed),
+        "orphan_bytes_reclaimed": orphan_bytes,
+        "dangling_rows_removed": len(dangling_ids),
+        "deleted_user_rows_removed": len(orphan_user_rows),
+        "deleted_user_bytes_reclaimed": deleted_user_bytes,
+        "failed": len(failed),
+    }
+
+def _size_outside_scan(path: str) -> Optional[int]:
+    # 旧记录可能引用持久目录以外的文件，逐个 stat
+    data_dir_abs = os.path.abspath(DATA_DIR)
+    if os.path.commonpath([path, data_dir_abs]) == data_dir_abs:
+        return None
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+def users_over_quota() -> List[dict]:
+    """
+    当前超出配额的用户及其占用，供管理员查看。
+    """
+    if USER_QUOTA_BYTES is None:
+        return []
+    db = SessionLocal()
+    try:
+        admins = {user_id for (user_id,) in db.query(models.User.id).filter(models.User.role == "admin")}
+    finally:
+        db.close()
+    return [
+        {"user_id": user_id, "used_bytes": used, "quota_bytes": USER_QUOTA_BYTES}
+        for user_id, used in sorted(storage_usage.snapshot().items())
+        if used > USER_QUOTA_BYTES and user_id not in admins
+    ]
+
+class StorageReaper:
+    """
+    后台存储清理线程：按固定周期清理临时目录并对账持久目录，保留最近一次的清理报告。
+    多个工作进程或节点部署时，每个周期由抢到共享状态中清理锁的一个进程执行，报告保存在共享状态中。
+    """
+    LOCK_KEY = "storage-reaper:lock"
+    REPORT_KEY = "storage-reaper:last-report"
+
+    def __init__(self, interval: float = STORAGE_REAPER_INTERVAL_SECONDS, store: StateStore = state_store):
+        self.interval = interval
+        self.store = store
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        启动清理线程，重复调用无副作用。启动后立即执行一次，以便尽快得到各用户的存储占用。
+        """
+        if not STORAGE_REAPER_ENABLED or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-reaper", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    @property
+    def last_report(self) -> Optional[dict]:
+        return self.store.get(self.REPORT_KEY)
+
+    def run_once(self) -> dict:
+        """
+        执行一次清理并返回报告。与后台线程互斥，不会同时运行两次。
+        """
+        with self._run_lock:
+            started = time.time()
+            report = {
+                "started_at": datetime.fromtimestamp(started).isoformat(timespec="seconds"),
+                "temp": reap_temp(started),
+                "data": reconcile_data(started),
+            }
+            report["users_over_quota"] = users_over_quota()
+            report["bytes_reclaimed"] = (
+                report["temp"]["bytes_reclaimed"]
+                + report["data"]["orphan_bytes_reclaimed"]
+                + report["data"]["deleted_user_bytes_reclaimed"]
+            )
+            report["duration_seconds"] = round(time.time() - started, 3)
+            self.store.set(self.REPORT_KEY, report)
+        if report["bytes_reclaimed"] or report["data"]["dangling_rows_removed"]:
+            print(
+                f"Storage reaper reclaimed {report['bytes_reclaimed']} bytes, "
+                f"removed {report['data']['dangling_rows_removed']} dangling rows "
+                f"in {report['duration_seconds']}s"
+            )
+        return report
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                # 清理锁在一个周期后过期，执行者退出后由其他进程接替
+                if self.store.add(self.LOCK_KEY, instance_id(), ttl=self.interval):
+                    self.run_once()
+            except Exception as e:
+                print(f"Storage reaper failed: {e}")
+            self._stop.wait(self.interval)
+
+storage_reaper = StorageReaper()
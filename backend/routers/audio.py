@@ -1,82 +1,189 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from typing import List
-import models, schemas, database, auth, tts_service
-from config import DATA_DIR, OUTPUT_DIR, PROJECT_ROOT, TEMP_DIR
-import shutil, os
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, FileResponse
+from sqlalchemy import select, func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64, itertools, json, uuid
+import models, schemas, database, auth, tts_service, transcoder, text_store, emotion, reaper, voice_library, postprocess, scheduler, tracing
+from jobs import job_manager, QueueFullError, JOB_SUCCEEDED
+from routers.jobs import submit_synthesis, postprocess_options, idempotency_key_header
+from routers.users import ensure_admin
+from synthesis_cache import synthesis_cache
+from state_store import state_store
+from tts_backends import balancer
+from storage import resolve_output_path_to_abs_path, promote_file, temp_files, sharded_path, output_url
+from config import DATA_DIR, TEMP_DIR, STREAM_TICKET_TTL_SECONDS, AUDIO_PAGE_DEFAULT_LIMIT, AUDIO_PAGE_MAX_LIMIT
+import os
 
 router = APIRouter(prefix="/audio", tags=["Audio"])
 
-def resolve_output_path_to_abs_path(path_or_url: str) -> str:
+def encode_cursor(audio: models.Audio) -> str:
     """
-    将音频路径统一解析为磁盘绝对路径。
-    
-    说明：
-    - 推荐输入：以 /output/... 开头的 URL 路径（后端返回/数据库存储的标准格式）。
-    - 兼容输入：允许字符串中包含 /output/... 片段，以及旧版 ../output/... 
-    - 该函数仅负责“解析”，不负责鉴权与目录边界校验；调用方需自行做白名单目录校验。
+    以最后一条记录的 (创建时间, ID) 生成下一页游标。
     """
-    if not path_or_url:
-        # 空值直接返回空字符串，便于上层做统一错误处理
-        return ""
-
-    # 统一路径分隔符，避免 Windows 反斜杠导致解析逻辑失效
-    candidate = path_or_url.replace("\\", "/").strip()
-
-    if candidate.startswith("/output/"):
-        # 标准情况：前端/数据库存的是 /output/... 形式的 URL 路径
-        relative = candidate[len("/output/"):].lstrip("/")
-        return os.path.abspath(os.path.join(OUTPUT_DIR, *relative.split("/")))
+    payload = json.dumps([audio.create_time.isoformat(), audio.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
 
-    output_index = candidate.find("/output/")
-    if output_index != -1:
-        # 兼容情况：字符串中包含 /output/... 片段
-        relative = candidate[output_index + 1 :].lstrip("/")
-        return os.path.abspath(os.path.join(PROJECT_ROOT, *relative.split("/")))
-
-    candidate = candidate.lstrip("./")
-    if candidate.startswith("../"):
-        # 兼容情况：../output/... 这种基于项目根目录的相对路径
-        return os.path.abspath(os.path.join(PROJECT_ROOT, *candidate.lstrip("./").split("/")))
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        create_time, audio_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(create_time), int(audio_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
 
-    # 兜底：当作相对项目根目录的路径处理
-    return os.path.abspath(os.path.join(PROJECT_ROOT, *candidate.split("/")))
+def audio_filters(user_id: int, emo_type: Optional[int], start_time: Optional[datetime], end_time: Optional[datetime]) -> list:
+    """
+    历史列表与计数接口共用的筛选条件。
+    """
+    conditions = [models.Audio.user_id == user_id]
+    if emo_type is not None:
+        conditions.append(models.Audio.emo_type == emo_type)
+    if start_time is not None:
+        conditions.append(models.Audio.create_time >= start_time)
+    if end_time is not None:
+        conditions.append(models.Audio.create_time < end_time)
+    return conditions
 
 @router.post("/upload_text")
-async def upload_text(file: UploadFile = File(...), current_user: models.User = Depends(auth.get_current_active_user)):
+async def upload_text(file: UploadFile = File(...), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
-    上传文本文件并读取其内容。
-    支持 .txt 格式，自动尝试 UTF-8 和 GBK 编码解码。
+    上传文本文件并保存到服务端文本库。
+    流式读取并增量解码 (自动识别 UTF-8/UTF-16/GB18030 编码)，边读边按 "第X章" 拆分章节。
+    之后的合成请求可直接传 chapter_id，无需再次上传正文；短文本同时返回全文供前端编辑。
     """
     if not file.filename.endswith(".txt"):
         raise HTTPException(status_code=400, detail="仅支持 .txt 文件")
-    
-    content = await file.read()
-    # 优先按 utf-8 解码，失败则回退到 gbk
-    try:
-        text = content.decode("utf-8")
-    except UnicodeDecodeError:
-        try:
-            text = content.decode("gbk")
-        except:
-            raise HTTPException(status_code=400, detail="文件解码失败")
-            
-    return {"filename": file.filename, "content": text}
+
+    document, content = await text_store.ingest_upload(db, current_user.id, file)
+    chapters = await text_store.list_chapters(db, document.id)
+    return {
+        "filename": file.filename,
+        "document_id": document.id,
+        "encoding": document.encoding,
+        "char_count": document.char_count,
+        "chapters": [
+            {"id": c.id, "seq": c.seq, "title": c.title, "char_count": c.char_count}
+            for c in chapters
+        ],
+        "content": content,
+    }
 
 @router.post("/synthesize")
-async def synthesize(text: str = Form(...), emo_type: int = Form(...), current_user: models.User = Depends(auth.get_current_active_user)):
+async def synthesize(
+    text: Optional[str] = Form(None),
+    emo_type: int = Form(...),
+    chapter_id: Optional[int] = Form(None),
+    voice_id: Optional[int] = Form(None),
+    emo_voice_id: Optional[int] = Form(None),
+    postprocessing: Optional[postprocess.PostProcessOptions] = Depends(postprocess_options),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
     """
-    接收文本和情感类型，调用 TTS 服务生成音频。
+    接收文本 (或文本库中的章节 ID) 和情感类型，调用 TTS 服务生成音频。
+    可选 voice_id (音色库中的音色) 与 emo_voice_id (音色库中的情感参考音频)，
+    以及响度归一化、静音裁剪与分段拼接方式等后处理参数 (见 routers.jobs.postprocess_options)。
+    合成在任务队列的工作线程中执行，这里仅异步等待结果，不阻塞事件循环。
+    内容相同的合成正在执行时 (重复点击、超时重试) 等待同一任务的结果；携带 Idempotency-Key 重试时返回首次提交的结果。
+    需要立即返回任务 ID 的场景请使用 /audio/jobs 接口。
     """
-    # 调用 TTS 服务
-    audio_path = tts_service.synthesize_audio(text, emo_type)
-    if not audio_path:
-        raise HTTPException(status_code=500, detail="语音合成服务失败")
+    text = await text_store.resolve_text(db, text, chapter_id, current_user)
+    voice_path = await voice_library.resolve_voice_path(db, voice_id, current_user)
+    emo_voice_path = await voice_library.resolve_voice_path(db, emo_voice_id, current_user)
+    # 等待合成期间不占用数据库连接
+    await db.close()
+    job = submit_synthesis(current_user, text, emo_type, voice_path, emo_voice_path, postprocessing, idempotency_key)
+    await job_manager.wait_async(job)
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=500, detail=job.error or "语音合成服务失败")
     
-    return {"audio_path": audio_path}
+    return {"audio_path": job.result}
+
+@router.post("/stream")
+async def create_stream(
+    text: Optional[str] = Form(None),
+    emo_type: int = Form(...),
+    chapter_id: Optional[int] = Form(None),
+    voice_id: Optional[int] = Form(None),
+    emo_voice_id: Optional[int] = Form(None),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    创建流式试听地址。
+    <audio> 标签无法携带 Authorization 头，因此先凭登录态换取一个随机的短期播放地址，该地址只能播放一次。
+    流式试听与合成任务共用单用户在途任务数与全局排队数上限，超出时返回 429。
+    """
+    try:
+        job_manager.check_admission(current_user.id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    text = await text_store.resolve_text(db, text, chapter_id, current_user)
+    voice_path = await voice_library.resolve_voice_path(db, voice_id, current_user)
+    emo_voice_path = await voice_library.resolve_voice_path(db, emo_voice_id, current_user)
+    requester = scheduler.requester_for(current_user, scheduler.PRIORITY_INTERACTIVE)
+    ticket = uuid.uuid4().hex
+    # 播放地址保存在共享状态中，多进程部署时换取与播放可由不同的工作进程处理
+    state_store.set(f"stream-ticket:{ticket}", {
+        "user_id": current_user.id,
+        "text": text,
+        "emo_type": emo_type,
+        "voice_path": voice_path,
+        "emo_voice_path": emo_voice_path,
+        # 流式试听始终按交互优先级调度
+        "requester": {"priority": requester.priority, "weight": requester.weight, "exempt": requester.exempt},
+    }, ttl=STREAM_TICKET_TTL_SECONDS)
+    return {"stream_url": f"/audio/stream/{ticket}"}
+
+def _end_stream_after(chunks, user_id: int):
+    """
+    包装流式合成的生成器：迭代结束、出错或客户端断开 (生成器被关闭) 时归还在途任务名额。
+    """
+    try:
+        yield from chunks
+    finally:
+        chunks.close()
+        job_manager.end_stream(user_id)
+
+@router.get("/stream/{ticket}")
+async def stream_audio(ticket: str):
+    """
+    边合成边返回 WAV 音频流，首个分段完成后即开始传输。
+    播放地址在首次请求时作废 (跨进程原子抢占)，重复请求不会再次合成；
+    合成期间计入该用户的在途任务数，超出上限时返回 429。
+    """
+    key = f"stream-ticket:{ticket}"
+    info = state_store.get(key)
+    if not info or not state_store.add(f"stream-claim:{ticket}", True, ttl=STREAM_TICKET_TTL_SECONDS):
+        raise HTTPException(status_code=404, detail="播放地址不存在或已过期")
+    state_store.delete(key)
+
+    user_id = info["user_id"]
+    try:
+        job_manager.begin_stream(user_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    requester = scheduler.Requester(user_id, **info["requester"])
+    chunks = _end_stream_after(
+        tts_service.stream_audio(info["text"], info["emo_type"], info["voice_path"], info["emo_voice_path"], requester), user_id
+    )
+    try:
+        # 先在线程池中取出文件头 (即等待首个分段完成)，合成失败时仍可返回正常的错误响应
+        header = await run_in_threadpool(next, chunks)
+    except Exception as e:
+        chunks.close()
+        # 追踪日志自动附带本次请求的关联 ID，与 tts_service 记录的 synthesis_failed 事件对应
+        cause = e.cause if isinstance(e, tts_service.SynthesisError) else tts_service.error_cause(e)
+        tracing.event("stream_failed", user_id=user_id, cause=cause, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e) if isinstance(e, tts_service.SynthesisError) else "语音合成服务失败")
+    return StreamingResponse(itertools.chain([header], chunks), media_type="audio/wav")
 
 @router.post("/save", response_model=schemas.Audio)
-async def save_audio(emo_type: int = Form(...), audio_path: str = Form(...), db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def save_audio(emo_type: int = Form(...), audio_path: str = Form(...), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
     将生成的临时音频文件保存到持久化存储目录，并在数据库中创建记录。
     """
@@ -91,56 +198,194 @@ async def save_audio(emo_type: int = Form(...), audio_path: str = Form(...), db:
         # 限制只能保存临时目录下的音频，避免路径穿越导致任意文件被复制到公开目录
         raise HTTPException(status_code=400, detail="非法的音频路径")
     
-    # 2. 定义目标路径 (数据文件)
-    filename = os.path.basename(src_abs_path)
-    dst_abs_path = os.path.join(DATA_DIR, filename)
+    owner_id = temp_files.owner(src_abs_path)
+    if owner_id is not None and owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="权限不足")
+
+    file_size = os.path.getsize(src_abs_path)
+    if reaper.quota_exceeded(current_user, file_size):
+        raise HTTPException(status_code=507, detail="存储空间已达上限，请先删除部分历史音频")
+
+    # 2. 定义目标路径 (数据文件，按分片布局存放)
+    dst_abs_path = sharded_path(DATA_DIR, os.path.basename(src_abs_path))
     
-    # 3. 复制文件
+    # 3. 提升文件：本人独占的临时文件直接重命名，其余情况 (如重启前生成的文件) 链接或复制
     try:
-        shutil.copy(src_abs_path, dst_abs_path)
+        await promote_file(src_abs_path, dst_abs_path, exclusive=owner_id == current_user.id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"保存音频文件失败: {e}")
+    temp_files.release(src_abs_path)
+    reaper.storage_usage.add(current_user.id, file_size)
         
     db_audio = models.Audio(
         user_id=current_user.id,
-        audio_path=f"/output/data/{filename}",
+        audio_path=output_url(dst_abs_path),
         emo_type=emo_type
     )
     db.add(db_audio)
-    db.commit()
-    db.refresh(db_audio)
+    await db.commit()
+    await db.refresh(db_audio)
+    # 后台转码为 FLAC 母版与轻量格式，不阻塞本次请求
+    transcoder.schedule_transcode(db_audio.id, db_audio.audio_path)
     return db_audio
 
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    管理员接口：查看合成结果缓存的命中率与占用情况。
+    """
+    ensure_admin(current_user)
+    if synthesis_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **synthesis_cache.stats()}
+
+@router.get("/storage")
+async def get_storage_usage(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    查看当前用户的持久存储占用与配额 (quota_bytes 为 null 表示不限制)。
+    """
+    return {"used_bytes": reaper.storage_usage.get(current_user.id), "quota_bytes": reaper.quota_for(current_user)}
+
+@router.get("/storage/report")
+async def get_storage_report(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    管理员接口：查看最近一次存储清理的报告 (回收字节数、孤儿文件、悬空记录、超出配额的用户)。
+    """
+    ensure_admin(current_user)
+    return {"report": reaper.storage_reaper.last_report}
+
+@router.post("/storage/reap")
+async def run_storage_reaper(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    管理员接口：立即执行一次存储清理并返回报告。
+    """
+    ensure_admin(current_user)
+    return {"report": await run_in_threadpool(reaper.storage_reaper.run_once)}
+
+@router.post("/emotions")
+async def tag_emotions(text: Optional[str] = Form(None), chapter_id: Optional[int] = Form(None), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    预览自动情感识别结果：逐句情感标签，以及合并相同情感的连续句子后的合成批次。
+    """
+    text = await text_store.resolve_text(db, text, chapter_id, current_user)
+    sentences = await run_in_threadpool(emotion.tag_sentences, text)
+    runs = emotion.merge_runs(sentences)
+    return {
+        "sentences": [{"emo_type": emo_type, "text": sentence} for emo_type, sentence in sentences],
+        "runs": [{"emo_type": emo_type, "text": run_text} for emo_type, run_text in runs],
+    }
+
+@router.get("/backends")
+async def get_backends(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    管理员接口：查看各 TTS 服务的健康、熔断与负载情况。
+    """
+    ensure_admin(current_user)
+    return balancer.status()
+
+@router.get("/scheduler")
+async def get_scheduler(current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    管理员接口：查看 TTS 调度器的名额占用、各优先级排队分段数、吞吐估算与各用户的配额余额。
+    """
+    ensure_admin(current_user)
+    return scheduler.tts_scheduler.snapshot()
+
 @router.get("/", response_model=List[schemas.Audio])
-async def list_audios(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
-    # 显示用户自己的音频
-    audios = db.query(models.Audio).filter(models.Audio.user_id == current_user.id).order_by(models.Audio.create_time.desc()).all()
+async def list_audios(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(AUDIO_PAGE_DEFAULT_LIMIT, ge=1, le=AUDIO_PAGE_MAX_LIMIT),
+    emo_type: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    分页获取当前用户的音频，按创建时间倒序，可按情感与时间范围 [start_time, end_time) 筛选。
+    使用键集分页：还有下一页时在 X-Next-Cursor 响应头中返回游标，下次请求携带 cursor 参数。
+    """
+    query = (
+        select(models.Audio)
+        .where(*audio_filters(current_user.id, emo_type, start_time, end_time))
+        .order_by(models.Audio.create_time.desc(), models.Audio.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        cursor_time, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            models.Audio.create_time < cursor_time,
+            and_(models.Audio.create_time == cursor_time, models.Audio.id < cursor_id),
+        ))
+    result = await db.execute(query)
+    audios = result.scalars().all()
+    if len(audios) > limit:
+        audios = audios[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(audios[-1])
     return audios
 
+@router.get("/count")
+async def count_audios(
+    emo_type: Optional[int] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    统计当前用户的音频数量 (筛选条件与列表接口一致)。
+    """
+    result = await db.execute(
+        select(func.count()).select_from(models.Audio).where(*audio_filters(current_user.id, emo_type, start_time, end_time))
+    )
+    return {"count": result.scalar_one()}
+
+@router.get("/{audio_id}/download")
+async def download_audio(audio_id: int, format: Optional[str] = None, accept: Optional[str] = Header(None), db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    下载音频，按 format 参数或 Accept 头选择格式 (wav/flac/opus/mp3)。
+    未指定时返回母版格式。仅限所有者或管理员操作。
+    """
+    audio = await db.get(models.Audio, audio_id)
+    if not audio:
+        raise HTTPException(status_code=404, detail="音频记录不存在")
+    if audio.user_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="权限不足")
+
+    available = transcoder.available_formats(audio)
+    fmt = transcoder.negotiate_format(available, format, accept)
+    if fmt is None:
+        raise HTTPException(status_code=404, detail="该格式尚未生成")
+    file_path = resolve_output_path_to_abs_path(available[fmt])
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="音频文件未找到")
+    ext, media_type = transcoder.AUDIO_FORMATS[fmt]
+    return FileResponse(
+        file_path,
+        media_type=media_type,
+        filename=f"audio_{audio.id}{ext}",
+        headers={"Vary": "Accept"},
+    )
+
 @router.delete("/{audio_id}")
-async def delete_audio(audio_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def delete_audio(audio_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
     根据 ID 删除指定的音频记录。
-    如果文件存在，也会尝试从磁盘删除。仅限所有者或管理员操作。
+    同时从磁盘删除音频文件及其转码副本，文件删除失败时返回 500 且保留记录。仅限所有者或管理员操作。
     """
-    audio = db.query(models.Audio).filter(models.Audio.id == audio_id).first()
+    audio = await db.get(models.Audio, audio_id)
     if not audio:
         raise HTTPException(status_code=404, detail="音频记录不存在")
     if audio.user_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="权限不足")
     
-    audio_abs_path = resolve_output_path_to_abs_path(audio.audio_path)
-    output_dir_abs = os.path.abspath(OUTPUT_DIR)
-    if (
-        audio_abs_path
-        and os.path.commonpath([audio_abs_path, output_dir_abs]) == output_dir_abs
-        and os.path.exists(audio_abs_path)
-    ):
-        try:
-            os.remove(audio_abs_path)
-        except Exception:
-            pass
-            
-    db.delete(audio)
-    db.commit()
+    # 原始文件与各转码副本一并删除；有文件删除失败时保留记录并报错，以便重试，不留下无记录的文件
+    freed, failed = await run_in_threadpool(reaper.remove_audio_files, reaper.audio_file_paths(audio))
+    reaper.storage_usage.add(audio.user_id, -freed)
+    if failed:
+        raise HTTPException(status_code=500, detail="删除音频文件失败，请稍后重试")
+
+    await db.delete(audio)
+    await db.commit()
     return {"message": "音频已删除"}
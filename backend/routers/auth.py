@@ -1,40 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from typing import Optional
+import math
 import auth, models, schemas, database
+from rate_limit import SlidingWindowLimiter
+from config import (
+    LOGIN_IP_MAX_ATTEMPTS, LOGIN_IP_WINDOW_SECONDS,
+    LOGIN_USER_MAX_FAILURES, LOGIN_USER_WINDOW_SECONDS,
+    REGISTER_IP_MAX_ATTEMPTS, REGISTER_IP_WINDOW_SECONDS,
+)
 
 router = APIRouter(tags=["Authentication"])
 
+# 登录/注册限流：密码哈希开销固定，先限流再哈希，避免暴力尝试占满哈希线程池 (计数保存在共享状态中，多进程部署时合并计算)
+login_ip_limiter = SlidingWindowLimiter("login_ip", LOGIN_IP_MAX_ATTEMPTS, LOGIN_IP_WINDOW_SECONDS)
+login_failure_limiter = SlidingWindowLimiter("login_failure", LOGIN_USER_MAX_FAILURES, LOGIN_USER_WINDOW_SECONDS)
+register_ip_limiter = SlidingWindowLimiter("register_ip", REGISTER_IP_MAX_ATTEMPTS, REGISTER_IP_WINDOW_SECONDS)
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+def _raise_throttled(retry_after: Optional[float], detail: str) -> None:
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
     """
     用户登录接口。
     验证用户名密码，返回 JWT 令牌。
+    同一 IP 的尝试次数与同一用户名的失败次数分别限流，超限返回 429 (附 Retry-After)。
     """
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.password):
+    _raise_throttled(login_ip_limiter.hit(_client_ip(request)), "登录尝试过于频繁，请稍后再试")
+    _raise_throttled(login_failure_limiter.check(form_data.username), "密码错误次数过多，请稍后再试")
+    result = await db.execute(select(models.User).where(models.User.username == form_data.username))
+    user = result.scalars().first()
+    if not user or not await auth.verify_password_async(form_data.password, user.password):
+        login_failure_limiter.add(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_failure_limiter.reset(form_data.username)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=auth.token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register_user(request: Request, user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
     """
     用户注册接口。
     检查用户名是否已存在，创建新用户。如果是 'admin' 用户名则自动赋予管理员权限。
     """
-    db_user = db.query(models.User).filter(models.User.username == user.username).first()
+    _raise_throttled(register_ip_limiter.hit(_client_ip(request)), "注册过于频繁，请稍后再试")
+    result = await db.execute(select(models.User).where(models.User.username == user.username))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="用户名已被注册")
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
  
     # 如果用户名是 "admin"，则设为 "admin" 角色。
     role = "admin" if user.username == "admin" else "user"
@@ -48,6 +81,6 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_d
         role=role
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
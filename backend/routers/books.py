@@ -0,0 +1,220 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Optional, Tuple
+import io, os, zipfile
+import models, schemas, database, auth, books, text_store, reaper, scheduler
+from jobs import job_manager, QueueFullError, JOB_RUNNING
+from routers.users import ensure_admin
+from text_utils import detect_encoding, natural_sort_key, IncrementalTextDecoder
+from config import INPUT_DIR, BOOK_MAX_CHAPTERS, BOOK_MAX_UPLOAD_BYTES, TEXT_UPLOAD_CHUNK_BYTES
+
+router = APIRouter(prefix="/books", tags=["Books"])
+
+def _decode_chapter(name: str, content: bytes) -> Tuple[str, str]:
+    """
+    解码章节文件，编码识别与回退规则与文本库上传相同 (按首块识别，UTF-8 中途失败时回退到 GB18030)。
+    """
+    try:
+        text = IncrementalTextDecoder(detect_encoding(content[:TEXT_UPLOAD_CHUNK_BYTES])).decode(content, final=True)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail=f"文件解码失败: {name}")
+    return os.path.splitext(os.path.basename(name))[0], text.strip()
+
+def _read_zip(content: bytes) -> List[Tuple[str, bytes]]:
+    """
+    读取 zip 中的全部 .txt 文件，按解压后大小限制总量，防止压缩炸弹。
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="zip 文件损坏")
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".txt")
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+    if sum(info.file_size for info in members) > BOOK_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="文本总大小超出限制")
+    return [(info.filename, archive.read(info)) for info in members]
+
+def _read_input_dir() -> List[Tuple[str, bytes]]:
+    """
+    读取服务端 input 目录中的全部 .txt 文件，总大小超出上限时返回 413。
+    """
+    if not os.path.isdir(INPUT_DIR):
+        raise HTTPException(status_code=404, detail="input 目录不存在")
+    collected = []
+    total_bytes = 0
+    for entry in os.scandir(INPUT_DIR):
+        if entry.is_file() and entry.name.lower().endswith(".txt"):
+            total_bytes += entry.stat().st_size
+            if total_bytes > BOOK_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="文本总大小超出限制")
+            with open(entry.path, "rb") as f:
+                collected.append((entry.name, f.read()))
+    return collected
+
+def _build_chapters(files: List[Tuple[str, bytes]]) -> List[Tuple[str, str]]:
+    """
+    按文件名自然排序生成章节列表，跳过空文件。
+    """
+    chapters = []
+    for name, content in sorted(files, key=lambda f: natural_sort_key(f[0])):
+        title, text = _decode_chapter(name, content)
+        if text:
+            chapters.append((title, text))
+    if not chapters:
+        raise HTTPException(status_code=400, detail="没有可合成的文本")
+    if len(chapters) > BOOK_MAX_CHAPTERS:
+        raise HTTPException(status_code=400, detail=f"章节数超出上限 ({BOOK_MAX_CHAPTERS})")
+    return chapters
+
+async def _submit_book(db: AsyncSession, user: models.User, title: str, emo_type: int, chapters: List[Tuple[str, str]]) -> models.Book:
+    """
+    创建书籍记录并提交合成任务。按字数估算的输出大小超出存储配额时返回 507，队列已满时撤销记录并返回 429。
+    """
+    estimated_bytes = books.estimate_output_bytes(sum(len(text) for _, text in chapters))
+    if reaper.quota_exceeded(user, estimated_bytes):
+        raise HTTPException(
+            status_code=507, detail=f"存储空间不足 (整本书预计占用 {estimated_bytes / 1024 / 1024:.0f} MB)，请先删除部分历史音频"
+        )
+    book = await db.run_sync(books.create_book, user.id, title, emo_type, chapters)
+    await db.commit()
+    try:
+        # 整书任务按批量优先级调度，不影响其他用户的试听与短文本合成
+        job = job_manager.submit(
+            user.id, books.run_book, book.id, kind="book",
+            requester=scheduler.requester_for(user, scheduler.PRIORITY_BATCH), chars=book.total_chars,
+        )
+    except QueueFullError as e:
+        await db.execute(delete(models.Chapter).where(models.Chapter.book_id == book.id))
+        await db.delete(book)
+        await db.commit()
+        raise HTTPException(status_code=429, detail=str(e))
+    book.job_id = job.id
+    await db.commit()
+    await db.refresh(book)
+    return book
+
+async def get_book_or_404(db: AsyncSession, book_id: int, current_user: models.User) -> models.Book:
+    book = await db.get(models.Book, book_id)
+    if not book or (book.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="书籍不存在")
+    return book
+
+@router.post("", response_model=schemas.Book, status_code=202)
+async def create_book(
+    files: List[UploadFile] = File(...),
+    title: Optional[str] = Form(None),
+    emo_type: int = Form(0),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    批量合成：上传多个 .txt 文件或一个 zip 包，每个文本文件为一章 (按文件名自然排序)。
+    章节依次合成，完成后直接保存到持久目录并生成音频记录，无需再调用保存接口。
+    """
+    collected = []
+    total_bytes = 0
+    for file in files:
+        content = await file.read()
+        total_bytes += len(content)
+        if total_bytes > BOOK_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="文本总大小超出限制")
+        name = file.filename or ""
+        if name.lower().endswith(".zip"):
+            collected.extend(await run_in_threadpool(_read_zip, content))
+        elif name.lower().endswith(".txt"):
+            collected.append((name, content))
+        else:
+            raise HTTPException(status_code=400, detail="仅支持 .txt 或 .zip 文件")
+    chapters = await run_in_threadpool(_build_chapters, collected)
+    if not title:
+        title = os.path.splitext(files[0].filename)[0] if len(files) == 1 else chapters[0][0]
+    return await _submit_book(db, current_user, title, emo_type, chapters)
+
+@router.post("/from_input", response_model=schemas.Book, status_code=202)
+async def create_book_from_input(
+    title: str = Form(...),
+    emo_type: int = Form(0),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    以服务端 input 目录中的全部 .txt 文件创建书籍 (仅限管理员)，文本无需经过浏览器中转。
+    """
+    ensure_admin(current_user)
+    # 目录扫描、文件读取与解码都在线程池中执行，不阻塞事件循环
+    collected = await run_in_threadpool(_read_input_dir)
+    chapters = await run_in_threadpool(_build_chapters, collected)
+    return await _submit_book(db, current_user, title, emo_type, chapters)
+
+@router.post("/from_document", response_model=schemas.Book, status_code=202)
+async def create_book_from_document(
+    document_id: int = Form(...),
+    title: Optional[str] = Form(None),
+    emo_type: int = Form(0),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    以文本库中已上传的文本创建书籍，沿用上传时识别出的章节，无需重新上传。
+    """
+    document = await text_store.get_document(db, document_id, current_user)
+    chapters = [(c.title, c.text) for c in await text_store.list_chapters(db, document.id)]
+    if len(chapters) > BOOK_MAX_CHAPTERS:
+        raise HTTPException(status_code=400, detail=f"章节数超出上限 ({BOOK_MAX_CHAPTERS})")
+    if not title:
+        title = os.path.splitext(document.filename or "")[0] or f"文本 {document.id}"
+    return await _submit_book(db, current_user, title, emo_type, chapters)
+
+@router.get("", response_model=List[schemas.Book])
+async def list_books(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取当前用户的书籍列表
+    """
+    result = await db.execute(select(models.Book).where(models.Book.user_id == current_user.id).order_by(models.Book.create_time.desc()))
+    return result.scalars().all()
+
+@router.get("/{book_id}", response_model=schemas.BookDetail)
+async def get_book(book_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    查询书籍详情：各章节状态、整体进度与吞吐 (每秒字数、实时率)。
+    """
+    book = await get_book_or_404(db, book_id, current_user)
+    job = job_manager.get(book.job_id) if book.job_id else None
+    if job is None and book.job_id and book.status in ("pending", "running"):
+        # 任务快照已过期：所属的工作进程已退出 (多进程部署时由其他进程重启)，按中断处理
+        await run_in_threadpool(books.recover_interrupted)
+        await db.refresh(book)
+    result = await db.execute(select(models.Chapter).where(models.Chapter.book_id == book.id).order_by(models.Chapter.seq))
+    chapters = result.scalars().all()
+    return {
+        "book": book,
+        "chapters": chapters,
+        **books.book_progress(book, chapters, job),
+    }
+
+@router.delete("/{book_id}")
+async def cancel_book(book_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    取消书籍合成。已完成的章节音频保留在历史记录中。
+    """
+    book = await get_book_or_404(db, book_id, current_user)
+    if book.status not in ("pending", "running"):
+        raise HTTPException(status_code=409, detail="书籍合成已结束")
+    if book.job_id and job_manager.cancel(book.job_id):
+        job = job_manager.get(book.job_id)
+        if job is not None and job.status == JOB_RUNNING:
+            # 执行中的任务 (包括其他工作进程中的任务) 在当前分段结束后退出，由任务自身更新书籍状态
+            return {"message": "已请求取消"}
+    # 排队中被移除 (其他进程中排队的任务由所属进程在心跳时移除) 或已不在任务表中的任务不会再执行，直接更新数据库状态
+    await db.refresh(book)
+    if book.status in ("pending", "running"):
+        book.status = "cancelled"
+        book.finish_time = datetime.now()
+        await db.commit()
+    return {"message": "已请求取消"}
@@ -0,0 +1,153 @@
+from fastapi import APIRouter, Depends, HTTPException, Form, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import hashlib, json
+import models, database, auth, tts_service, text_store, voice_library, postprocess, scheduler
+from jobs import job_manager, Job, QueueFullError, IdempotencyConflict, JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED
+from storage import resolve_output_path_to_abs_path, temp_files
+from text_utils import normalize_text
+from config import IDEMPOTENCY_KEY_MAX_LENGTH
+
+router = APIRouter(prefix="/audio/jobs", tags=["Jobs"])
+
+def run_synthesis(text: str, emo_type: int, voice_path: Optional[str] = None, emo_voice_path: Optional[str] = None,
+                  postprocessing: Optional[postprocess.PostProcessOptions] = None, job: Job = None) -> str:
+    """
+    在工作线程中执行的合成任务函数。
+    生成的临时文件登记在提交者名下，保存时可直接重命名而无需复制。
+    """
+    audio_path = tts_service.synthesize_audio(
+        text, emo_type, job=job, voice_path=voice_path, emo_voice_path=emo_voice_path, postprocessing=postprocessing
+    )
+    if audio_path and job is not None:
+        temp_files.register(resolve_output_path_to_abs_path(audio_path), job.user_id)
+    return audio_path
+
+def synthesis_fingerprint(text: str, emo_type: int, voice_path: Optional[str], emo_voice_path: Optional[str],
+                          postprocessing: Optional[postprocess.PostProcessOptions]) -> str:
+    """
+    合成请求的内容指纹：规范化后的文本、情感、音色与后处理参数都相同的请求视为同一请求。
+    音色库文件按内容哈希命名，路径相同即内容相同。
+    """
+    payload = json.dumps(
+        [normalize_text(text), emo_type, voice_path, emo_voice_path, postprocessing.cache_params() if postprocessing else None],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def submit_synthesis(user: models.User, text: str, emo_type: int, voice_path: Optional[str] = None, emo_voice_path: Optional[str] = None,
+                     postprocessing: Optional[postprocess.PostProcessOptions] = None, idempotency_key: Optional[str] = None) -> Job:
+    """
+    提交合成任务，队列已满时转换为 429，幂等键冲突时转换为 422。
+    内容相同的任务仍在执行时返回该任务 (重复点击或超时重试不会重复占用 GPU)。
+    短文本按交互优先级调度，长文本按批量优先级调度 (见 scheduler.priority_for_text)。
+    """
+    dedup_key = synthesis_fingerprint(text, emo_type, voice_path, emo_voice_path, postprocessing)
+    try:
+        return job_manager.submit(
+            user.id, run_synthesis, text, emo_type, voice_path, emo_voice_path, postprocessing,
+            dedup_key=dedup_key, idempotency_key=idempotency_key,
+            requester=scheduler.requester_for(user, scheduler.priority_for_text(text)), chars=len(text),
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def idempotency_key_header(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """
+    可选的 Idempotency-Key 请求头：客户端为一次提交生成唯一键，超时重试时携带同一键即可拿到同一任务的结果。
+    """
+    if idempotency_key is None:
+        return None
+    if not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH or not idempotency_key.isascii() or not idempotency_key.isprintable():
+        raise HTTPException(status_code=400, detail="无效的 Idempotency-Key")
+    return idempotency_key
+
+def postprocess_options(
+    normalize: Optional[str] = Form(None),
+    target_level: Optional[float] = Form(None),
+    trim_silence: bool = Form(False),
+    silence_threshold: Optional[float] = Form(None),
+    join: Optional[str] = Form(None),
+    join_ms: Optional[int] = Form(None),
+) -> Optional[postprocess.PostProcessOptions]:
+    """
+    合成请求的可选后处理参数：normalize ("rms" / "lufs") 与 target_level (目标电平)，
+    trim_silence 与 silence_threshold (静音阈值 dBFS)，join ("gap" / "crossfade") 与 join_ms (间隔或淡化时长)。
+    """
+    return postprocess.parse_options(normalize, target_level, trim_silence, silence_threshold, join, join_ms)
+
+def job_status(job: Job) -> dict:
+    """
+    任务状态与排队信息：queue_position 为队列中的位置，estimated_wait_seconds 为预计开始前的等待时间 (无法估算时为 None)。
+    """
+    data = job.to_dict()
+    data["queue_position"] = job_manager.queue_position(job)
+    data["estimated_wait_seconds"] = job_manager.estimate_wait(job)
+    return data
+
+def get_job_or_404(job_id: str, current_user: models.User) -> Job:
+    """
+    查询任务，不存在或无权访问时统一返回 404，避免泄露其他用户的任务是否存在。
+    """
+    job = job_manager.get(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("", status_code=202)
+async def create_job(
+    text: Optional[str] = Form(None),
+    emo_type: int = Form(...),
+    chapter_id: Optional[int] = Form(None),
+    voice_id: Optional[int] = Form(None),
+    emo_voice_id: Optional[int] = Form(None),
+    postprocessing: Optional[postprocess.PostProcessOptions] = Depends(postprocess_options),
+    idempotency_key: Optional[str] = Depends(idempotency_key_header),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    提交异步合成任务，立即返回任务 ID。
+    可传文本，或传 chapter_id 合成文本库中已上传的章节；
+    voice_id / emo_voice_id 可选用音色库中的音色与情感参考音频；后处理参数见 postprocess_options。
+    内容相同的任务仍在执行或携带了已使用过的 Idempotency-Key 时，返回已有任务。
+    """
+    text = await text_store.resolve_text(db, text, chapter_id, current_user)
+    voice_path = await voice_library.resolve_voice_path(db, voice_id, current_user)
+    emo_voice_path = await voice_library.resolve_voice_path(db, emo_voice_id, current_user)
+    job = submit_synthesis(current_user, text, emo_type, voice_path, emo_voice_path, postprocessing, idempotency_key)
+    return job_status(job)
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    查询任务状态。
+    """
+    job = get_job_or_404(job_id, current_user)
+    return job_status(job)
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    取消排队中或执行中的任务。
+    """
+    get_job_or_404(job_id, current_user)
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="任务已结束，无法取消")
+    return {"message": "任务已取消"}
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取已完成任务的合成结果。
+    """
+    job = get_job_or_404(job_id, current_user)
+    if job.status == JOB_SUCCEEDED:
+        return {"audio_path": job.result}
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=job.error or "语音合成服务失败")
+    if job.status == JOB_CANCELLED:
+        raise HTTPException(status_code=410, detail="任务已取消")
+    raise HTTPException(status_code=409, detail="任务尚未完成")
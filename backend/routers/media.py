@@ -0,0 +1,149 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+import mimetypes, os
+from config import OUTPUT_DIR, MEDIA_CACHE_MAX_AGE
+from media_cache import media_cache, CachedFile
+from storage import path_candidates
+
+router = APIRouter(tags=["Media"])
+
+# 单次读取的块大小
+READ_CHUNK_SIZE = 256 * 1024
+
+# 音频相关扩展名的 MIME 类型 (mimetypes 在部分系统上缺少这些映射)
+MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".opus": "audio/ogg",
+    ".mp3": "audio/mpeg",
+}
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 头，返回闭区间 (start, end)。
+    多段范围或格式不支持时返回 None (按完整内容响应)；范围无法满足时抛出 416。
+    """
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-N 表示最后 N 个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise ValueError
+            start = max(size - suffix, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="请求范围无效",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+def is_not_modified(request: Request, entry: CachedFile) -> bool:
+    """
+    条件请求判断：If-None-Match 优先，其次 If-Modified-Since。
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags or f"W/{entry.etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(entry.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def iter_file(entry: CachedFile, start: int, end: int):
+    """
+    按块产出文件的 [start, end] 区间，结束或客户端断开时归还缓存条目。
+    """
+    try:
+        position = start
+        while position <= end:
+            chunk = media_cache.read(entry, position, min(READ_CHUNK_SIZE, end - position + 1))
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+    finally:
+        media_cache.release(entry)
+
+def acquire_first(candidates: List[str]) -> Optional[CachedFile]:
+    """
+    依次尝试各候选路径 (需要 stat/open 文件，在线程池中执行)，返回第一个存在的文件的缓存条目。
+    """
+    for candidate in candidates:
+        try:
+            return media_cache.acquire(candidate)
+        except (FileNotFoundError, IsADirectoryError, PermissionError):
+            continue
+    return None
+
+@router.api_route("/output/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_output(file_path: str, request: Request):
+    """
+    音频文件分发接口 (替代 /output 静态目录挂载)。
+    支持 Range 断点/拖动播放、ETag 与 If-None-Match/If-Modified-Since 条件请求 (304)，
+    并对 UUID 命名的不可变文件返回长期缓存头。热点文件的元数据与句柄由 media_cache 缓存。
+    旧版平铺链接 (/output/data/<uuid>.wav) 先查找分片目录中的文件，再查找原位置。
+    """
+    output_dir_abs = os.path.abspath(OUTPUT_DIR)
+    abs_path = os.path.abspath(os.path.join(output_dir_abs, *file_path.split("/")))
+    if os.path.commonpath([abs_path, output_dir_abs]) != output_dir_abs or abs_path == output_dir_abs:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    # 热点文件直接命中内存中的条目；未命中时的 stat/open 放到线程池，不阻塞事件循环
+    candidates = path_candidates(abs_path)
+    entry = next(filter(None, map(media_cache.acquire_cached, candidates)), None)
+    if entry is None:
+        entry = await run_in_threadpool(acquire_first, candidates)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    abs_path = entry.path
+    ext = os.path.splitext(abs_path)[1].lower()
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified,
+        "Cache-Control": f"public, max-age={MEDIA_CACHE_MAX_AGE}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    media_type = MEDIA_TYPES.get(ext) or mimetypes.guess_type(abs_path)[0] or "application/octet-stream"
+
+    if is_not_modified(request, entry):
+        media_cache.release(entry)
+        return Response(status_code=304, headers=headers)
+
+    start, end = 0, entry.size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and entry.size > 0 and (if_range is None or if_range == entry.etag):
+        try:
+            byte_range = parse_range(range_header, entry.size)
+        except HTTPException:
+            media_cache.release(entry)
+            raise
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    if request.method == "HEAD":
+        media_cache.release(entry)
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file(entry, start, end), status_code=status_code, headers=headers, media_type=media_type)
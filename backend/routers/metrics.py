@@ -0,0 +1,25 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import Response
+from typing import Optional
+import hmac
+import metrics
+from config import METRICS_ENABLED, METRICS_TOKEN
+
+router = APIRouter(tags=["Metrics"])
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus 指标：各阶段耗时直方图、实时率、TTS 服务错误计数、在途请求与任务数等。
+    配置了 METRICS_TOKEN 时需携带 Authorization: Bearer <METRICS_TOKEN>。
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if METRICS_TOKEN is not None:
+        expected = f"Bearer {METRICS_TOKEN}"
+        if not authorization or not hmac.compare_digest(authorization.encode(), expected.encode()):
+            raise HTTPException(status_code=401, detail="无效的监控令牌")
+    return Response(content=metrics.registry.render(), media_type=CONTENT_TYPE)
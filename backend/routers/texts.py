@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import models, schemas, database, auth, text_store
+
+router = APIRouter(prefix="/texts", tags=["Texts"])
+
+@router.get("", response_model=List[schemas.TextDocument])
+async def list_documents(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取当前用户上传的文本列表
+    """
+    result = await db.execute(select(models.TextDocument).where(models.TextDocument.user_id == current_user.id).order_by(models.TextDocument.create_time.desc()))
+    return result.scalars().all()
+
+@router.get("/chapters/{chapter_id}", response_model=schemas.TextChapter)
+async def get_chapter(chapter_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取单个章节的正文
+    """
+    return await text_store.get_chapter(db, chapter_id, current_user)
+
+@router.get("/{document_id}", response_model=schemas.TextDocumentDetail)
+async def get_document(document_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取文本信息与章节目录 (不含正文)
+    """
+    document = await text_store.get_document(db, document_id, current_user)
+    return {"document": document, "chapters": await text_store.list_chapters(db, document.id)}
+
+@router.delete("/{document_id}")
+async def delete_document(document_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    删除上传的文本及其全部章节
+    """
+    document = await text_store.get_document(db, document_id, current_user)
+    await db.execute(delete(models.TextChapter).where(models.TextChapter.document_id == document.id))
+    await db.delete(document)
+    await db.commit()
+    return {"message": "删除成功"}
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-import models, schemas, database, auth
+import models, schemas, database, auth, reaper, voice_library
+from jobs import job_manager
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -13,12 +16,12 @@ def ensure_admin(current_user: models.User) -> None:
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="权限不足")
 
-def get_user_or_404(db: Session, user_id: int) -> models.User:
+async def get_user_or_404(db: AsyncSession, user_id: int) -> models.User:
     """
     根据用户 ID 查询用户，不存在则抛出 404。
     用于管理员相关接口，减少重复查询与重复的 404 处理。
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     return user
@@ -34,74 +37,100 @@ def apply_user_update(target_user: models.User, user_update: schemas.UserUpdate)
     target_user.gender = user_update.gender
 
 @router.get("/me", response_model=schemas.User)
-async def read_users_me(current_user: models.User = Depends(auth.get_current_active_user)):
+async def read_users_me(current_user: models.User = Depends(auth.get_current_active_user), db: AsyncSession = Depends(database.get_db)):
     """
     获取当前登录用户的个人信息。
     """
-    return current_user
+    return await get_user_or_404(db, current_user.id)
 
 @router.put("/me", response_model=schemas.User)
-async def update_user_me(user_update: schemas.UserUpdate, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(database.get_db)):
+async def update_user_me(user_update: schemas.UserUpdate, current_user: models.User = Depends(auth.get_current_active_user), db: AsyncSession = Depends(database.get_db)):
     """
     更新当前登录用户的个人信息。
     """
-    apply_user_update(current_user, user_update)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    user = await get_user_or_404(db, current_user.id)
+    apply_user_update(user, user_update)
+    await db.commit()
+    await db.refresh(user)
+    auth.principal_cache.invalidate_user(user.id)
+    return user
 
 @router.put("/me/password")
-async def update_password_me(old_password: str, new_password: str, current_user: models.User = Depends(auth.get_current_active_user), db: Session = Depends(database.get_db)):
+async def update_password_me(old_password: str, new_password: str, current_user: models.User = Depends(auth.get_current_active_user), db: AsyncSession = Depends(database.get_db)):
     """
     修改当前登录用户的密码。
     """
-    if not auth.verify_password(old_password, current_user.password):
+    user = await get_user_or_404(db, current_user.id)
+    if not await auth.verify_password_async(old_password, user.password):
         raise HTTPException(status_code=400, detail="旧密码错误")
-    current_user.password = auth.get_password_hash(new_password)
-    db.commit()
+    user.password = await auth.get_password_hash_async(new_password)
+    await db.commit()
+    auth.principal_cache.invalidate_user(user.id)
     return {"message": "密码修改成功"}
 
 # 管理员路由
 @router.get("/", response_model=List[schemas.User])
-async def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def read_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
     管理员接口：获取所有用户列表。
     """
     ensure_admin(current_user)
-    users = db.query(models.User).offset(skip).limit(limit).all()
+    result = await db.execute(select(models.User).offset(skip).limit(limit))
+    users = result.scalars().all()
     return users
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
-    管理员接口：删除指定用户。
+    管理员接口：删除指定用户，同时取消其未结束的任务，删除其音频 (含文件)、书籍、文本库与音色库记录。
+    个别文件删除失败时不影响删除用户，残留文件由存储清理任务按孤儿文件回收。
     """
     ensure_admin(current_user)
-    user = get_user_or_404(db, user_id)
-    db.delete(user)
-    db.commit()
-    return {"message": "用户已删除"}
+    user = await get_user_or_404(db, user_id)
+    job_manager.cancel_user(user_id)
+
+    result = await db.execute(select(models.Audio).where(models.Audio.user_id == user_id))
+    paths = [path for audio in result.scalars().all() for path in reaper.audio_file_paths(audio)]
+    book_ids = select(models.Book.id).where(models.Book.user_id == user_id)
+    document_ids = select(models.TextDocument.id).where(models.TextDocument.user_id == user_id)
+    await db.execute(delete(models.Chapter).where(models.Chapter.book_id.in_(book_ids)))
+    await db.execute(delete(models.Book).where(models.Book.user_id == user_id))
+    await db.execute(delete(models.TextChapter).where(models.TextChapter.document_id.in_(document_ids)))
+    await db.execute(delete(models.TextDocument).where(models.TextDocument.user_id == user_id))
+    await db.execute(delete(models.Audio).where(models.Audio.user_id == user_id))
+    voice_hashes = (await db.execute(select(models.Voice.content_hash).where(models.Voice.user_id == user_id))).scalars().all()
+    await db.execute(delete(models.Voice).where(models.Voice.user_id == user_id))
+    await db.delete(user)
+    await db.commit()
+    auth.principal_cache.invalidate_user(user_id)
+    await voice_library.remove_unreferenced_files(db, voice_hashes)
+
+    freed, failed = await run_in_threadpool(reaper.remove_audio_files, paths)
+    reaper.storage_usage.remove_user(user_id)
+    return {"message": "用户已删除", "files_removed": len(paths) - len(failed), "bytes_reclaimed": freed}
 
 @router.post("/{user_id}/reset_password")
-async def reset_password(user_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def reset_password(user_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     ensure_admin(current_user)
-    user = get_user_or_404(db, user_id)
+    user = await get_user_or_404(db, user_id)
     # 重置为 123456
-    user.password = auth.get_password_hash("123456")
-    db.commit()
+    user.password = await auth.get_password_hash_async("123456")
+    await db.commit()
+    auth.principal_cache.invalidate_user(user_id)
     return {"message": "密码已重置为 123456"}
 
 @router.put("/{user_id}", response_model=schemas.User)
-async def update_user(user_id: int, user_update: schemas.UserUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+async def update_user(user_id: int, user_update: schemas.UserUpdate, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
     """
     管理员接口：更新指定用户的信息。
     """
     ensure_admin(current_user)
     
-    db_user = get_user_or_404(db, user_id)
+    db_user = await get_user_or_404(db, user_id)
 
     apply_user_update(db_user, user_update)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    auth.principal_cache.invalidate_user(user_id)
     return db_user
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, UploadFile, File, Form
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import models, schemas, database, auth, voice_library
+
+router = APIRouter(prefix="/voices", tags=["Voices"])
+
+@router.post("", response_model=schemas.Voice)
+async def upload_voice(
+    file: UploadFile = File(...),
+    name: str = Form(...),
+    emo_type: Optional[int] = Form(None),
+    db: AsyncSession = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+):
+    """
+    上传参考音频到音色库。上传时统一转为单声道、重采样、去除首尾静音、裁剪并做响度归一化，
+    处理结果按内容哈希保存；合成时以 voice_id (音色) 与 emo_voice_id (情感参考) 选用。
+    """
+    return await voice_library.create_voice(db, current_user, name, emo_type, file)
+
+@router.get("", response_model=List[schemas.Voice])
+async def list_voices(db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取当前用户的音色列表
+    """
+    result = await db.execute(
+        select(models.Voice).where(models.Voice.user_id == current_user.id).order_by(models.Voice.create_time.desc())
+    )
+    return result.scalars().all()
+
+@router.get("/{voice_id}", response_model=schemas.Voice)
+async def get_voice(voice_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    获取单个音色的信息
+    """
+    return await voice_library.get_voice(db, voice_id, current_user)
+
+@router.delete("/{voice_id}")
+async def delete_voice(voice_id: int, db: AsyncSession = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_active_user)):
+    """
+    删除音色。没有其他记录使用相同音频时一并删除文件。
+    """
+    voice = await voice_library.get_voice(db, voice_id, current_user)
+    await voice_library.delete_voice(db, voice)
+    return {"message": "音色已删除"}
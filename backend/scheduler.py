@@ -0,0 +1,293 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import metrics
+import tracing
+from config import (
+    SCHED_SLOTS,
+    SCHED_ADMIN_WEIGHT,
+    SCHED_INTERACTIVE_MAX_CHARS,
+    SCHED_INTERACTIVE_RESERVED_SLOTS,
+    SCHED_USER_MAX_CONCURRENCY,
+    SCHED_USER_CHARS_PER_MINUTE,
+)
+from tts_backends import balancer
+
+# 优先级：交互 (试听、短文本合成) 优先于批量 (长文本、整书)
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITY_RANK = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+
+# 吞吐估算 (每秒字数) 的指数滑动平均系数
+THROUGHPUT_SMOOTHING = 0.2
+
+class Requester:
+    """
+    TTS 调用的发起方：用户、优先级、公平调度权重，以及是否受用户配额限制 (管理员不受限)。
+    """
+    def __init__(self, user_id: Optional[int], priority: str = PRIORITY_INTERACTIVE, weight: float = 1.0, exempt: bool = False):
+        self.user_id = user_id
+        self.priority = priority
+        self.weight = weight
+        self.exempt = exempt
+
+def requester_for(user, priority: str) -> Requester:
+    """
+    按用户角色生成发起方：管理员的权重为 SCHED_ADMIN_WEIGHT，且不受并发与字数配额限制。
+    """
+    admin = user.role == "admin"
+    return Requester(user.id, priority, SCHED_ADMIN_WEIGHT if admin else 1.0, exempt=admin)
+
+def priority_for_text(text: str) -> str:
+    """
+    按文本长度划分优先级：不超过 SCHED_INTERACTIVE_MAX_CHARS 的视为交互请求。
+    """
+    return PRIORITY_INTERACTIVE if len(text) <= SCHED_INTERACTIVE_MAX_CHARS else PRIORITY_BATCH
+
+# 当前线程/协程的发起方：任务工作线程执行任务时设置，分段线程池中通过 copy_context 继承
+requester_var: contextvars.ContextVar = contextvars.ContextVar("requester", default=None)
+
+@contextmanager
+def bind(requester: Optional[Requester]):
+    token = requester_var.set(requester)
+    try:
+        yield
+    finally:
+        requester_var.reset(token)
+
+def current_requester() -> Requester:
+    return requester_var.get() or Requester(None)
+
+class _Ticket:
+    def __init__(self, requester: Requester, chars: int, start_tag: float, seq: int, task: tuple):
+        self.requester = requester
+        self.chars = chars
+        self.start_tag = start_tag
+        self.seq = seq
+        # (executor, future, context, fn, args)：获得名额后提交执行
+        self.task = task
+        self.enqueue_time = time.perf_counter()
+        self.granted = False
+
+class _UserState:
+    def __init__(self, now: float, tokens: float):
+        self.running = 0
+        # 字数令牌桶：每分钟补充 chars_per_minute，余额为正即可发起下一个分段 (允许透支一个分段)
+        self.tokens = tokens
+        self.refill_time = now
+        # 各优先级上一次请求的虚拟结束标签
+        self.finish_tags: Dict[str, float] = {}
+
+class TTSScheduler:
+    """
+    TTS 分段调度器，位于负载均衡器之前，决定等待中的分段谁先占用 TTS 名额。
+    - 交互请求优先于批量请求；SCHED_INTERACTIVE_RESERVED_SLOTS 个名额只留给交互请求；
+    - 同一优先级内按用户做加权公平排队 (start-time fair queueing，以字数为代价、用户权重折算)，
+      大文本用户的分段不会挤占其他用户；
+    - 用户的并发分段数与每分钟字数超出配额时，其分段暂缓调度 (管理员不受限)。
+    每个分段单独排队，长任务在分段之间自然让出名额给新到的交互请求 (分段边界抢占)。
+    分段获得名额后才提交到线程池执行，等待名额的分段不占用线程。
+    """
+    def __init__(self, slots: int, reserved_interactive: int = 0, user_max_concurrency: Optional[int] = None,
+                 chars_per_minute: Optional[int] = None):
+        self.slots = max(slots, 1)
+        self.reserved_interactive = min(max(reserved_interactive, 0), self.slots - 1)
+        self.user_max_concurrency = user_max_concurrency
+        self.chars_per_minute = chars_per_minute
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._running: Dict[str, int] = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+        self._users: Dict[Optional[int], _UserState] = {}
+        # 各优先级的虚拟时间：最近一次放行分段的开始标签
+        self._virtual_time: Dict[str, float] = {PRIORITY_INTERACTIVE: 0.0, PRIORITY_BATCH: 0.0}
+        self._seq = 0
+        self._throughput: Optional[float] = None
+        self._ticker: Optional[threading.Thread] = None
+
+    def submit(self, executor: Executor, requester: Requester, chars: int, fn: Callable, *args) -> Future:
+        """
+        以 requester 的身份排队，获得 TTS 名额后才把 fn(*args) 提交到 executor 执行，结束后归还名额并更新吞吐估算。
+        排队期间不占用 executor 的线程 (executor 的线程数只需等于名额数)，被配额暂缓的分段不会堵住其他请求。
+        返回的 Future 在放行前被取消时直接出队。fn 在提交时的上下文 (关联 ID 与发起方) 中执行。
+        """
+        context = contextvars.copy_context()
+        context.run(requester_var.set, requester)
+        future = Future()
+        with self._cond:
+            now = time.time()
+            user = self._user_locked(requester.user_id, now)
+            # 开始标签取虚拟时间与该用户上一个分段结束标签的较大值：空闲用户不积累额度，繁忙用户按权重排在后面
+            start_tag = max(self._virtual_time[requester.priority], user.finish_tags.get(requester.priority, 0.0))
+            user.finish_tags[requester.priority] = start_tag + max(chars, 1) / requester.weight
+            self._seq += 1
+            ticket = _Ticket(requester, chars, start_tag, self._seq, (executor, future, context, fn, args))
+            self._waiting.append(ticket)
+            self._dispatch_locked()
+            if not ticket.granted:
+                future.add_done_callback(lambda f: self._discard(ticket) if f.cancelled() else None)
+                self._start_ticker_locked()
+                self._cond.notify_all()
+        return future
+
+    def _run(self, ticket: "_Ticket", future: Future, fn: Callable, args: tuple) -> None:
+        requester = ticket.requester
+        tracing.record_stage("sched_wait", time.perf_counter() - ticket.enqueue_time, priority=requester.priority)
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.release(requester, ticket.chars, time.perf_counter() - start)
+            future.set_exception(e)
+        else:
+            self.release(requester, ticket.chars, time.perf_counter() - start)
+            future.set_result(result)
+
+    def _discard(self, ticket: "_Ticket") -> None:
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+    def _start_ticker_locked(self) -> None:
+        if self._ticker is None:
+            self._ticker = threading.Thread(target=self._tick, name="tts-scheduler", daemon=True)
+            self._ticker.start()
+
+    def _tick(self) -> None:
+        # 字数配额随时间恢复：有等待中的分段时每秒重新检查一次
+        with self._cond:
+            while True:
+                if self._waiting:
+                    self._cond.wait(1.0)
+                    self._dispatch_locked()
+                else:
+                    self._cond.wait()
+
+    def release(self, requester: Requester, chars: int, seconds: float) -> None:
+        with self._cond:
+            if seconds > 0 and chars > 0:
+                rate = chars / seconds
+                self._throughput = rate if self._throughput is None else (
+                    THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * self._throughput
+                )
+            self._release_locked(requester)
+
+    def _release_locked(self, requester: Requester) -> None:
+        self._running[requester.priority] -= 1
+        self._users[requester.user_id].running -= 1
+        self._dispatch_locked()
+        self._cond.notify_all()
+
+    def _user_locked(self, user_id: Optional[int], now: float) -> _UserState:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserState(now, float(self.chars_per_minute or 0))
+        if self.chars_per_minute:
+            user.tokens = min(user.tokens + (now - user.refill_time) * self.chars_per_minute / 60, self.chars_per_minute)
+        user.refill_time = now
+        return user
+
+    def _eligible_locked(self, ticket: _Ticket, now: float) -> bool:
+        requester = ticket.requester
+        if requester.priority == PRIORITY_BATCH and self._running[PRIORITY_BATCH] >= self.slots - self.reserved_interactive:
+            return False
+        if requester.exempt:
+            return True
+        user = self._user_locked(requester.user_id, now)
+        if self.user_max_concurrency and user.running >= self.user_max_concurrency:
+            return False
+        if self.chars_per_minute and user.tokens <= 0:
+            return False
+        return True
+
+    def _dispatch_locked(self) -> None:
+        """
+        有空闲名额时按 (优先级, 开始标签, 到达顺序) 放行满足配额的分段。
+        """
+        now = time.time()
+        granted = False
+        while sum(self._running.values()) < self.slots:
+            candidates = [t for t in self._waiting if self._eligible_locked(t, now)]
+            if not candidates:
+                break
+            ticket = min(candidates, key=lambda t: (PRIORITY_RANK[t.requester.priority], t.start_tag, t.seq))
+            self._waiting.remove(ticket)
+            executor, future, context, fn, args = ticket.task
+            if not future.set_running_or_notify_cancel():
+                # 已被取消 (取消回调尚未执行)
+                continue
+            ticket.granted = True
+            granted = True
+            requester = ticket.requester
+            self._virtual_time[requester.priority] = max(self._virtual_time[requester.priority], ticket.start_tag)
+            self._running[requester.priority] += 1
+            user = self._users[requester.user_id]
+            user.running += 1
+            if self.chars_per_minute and not requester.exempt:
+                user.tokens -= ticket.chars
+            executor.submit(context.run, self._run, ticket, future, fn, args)
+        if granted:
+            self._cond.notify_all()
+        # 没有等待中与执行中的分段时清理用户状态 (配额余额会随时间补满，无需保留)
+        if not self._waiting and not any(self._running.values()):
+            self._users = {
+                user_id: user for user_id, user in self._users.items()
+                if self.chars_per_minute and user.tokens < self.chars_per_minute
+            }
+
+    def throughput(self) -> Optional[float]:
+        """
+        估算的总吞吐 (每秒字数)：单个名额的滑动平均速度乘以名额数，尚无样本时返回 None。
+        """
+        with self._cond:
+            return self._throughput * self.slots if self._throughput else None
+
+    def waiting_counts(self) -> Dict[Tuple[str], int]:
+        with self._cond:
+            return self._waiting_counts_locked()
+
+    def snapshot(self) -> dict:
+        """
+        调度器状态 (供管理员查看)：名额、各优先级等待与执行中的分段数、各用户的执行数与配额余额。
+        """
+        with self._cond:
+            now = time.time()
+            waiting = {}
+            for ticket in self._waiting:
+                waiting[ticket.requester.user_id] = waiting.get(ticket.requester.user_id, 0) + 1
+            users = []
+            for user_id, user in self._users.items():
+                self._user_locked(user_id, now)
+                users.append({
+                    "user_id": user_id,
+                    "running": user.running,
+                    "waiting": waiting.get(user_id, 0),
+                    "char_tokens": round(user.tokens, 1) if self.chars_per_minute else None,
+                })
+            return {
+                "slots": self.slots,
+                "reserved_interactive": self.reserved_interactive,
+                "running": dict(self._running),
+                "waiting": {priority: count for (priority,), count in self._waiting_counts_locked().items()},
+                "throughput_chars_per_second": round(self._throughput * self.slots, 2) if self._throughput else None,
+                "users": users,
+            }
+
+    def _waiting_counts_locked(self) -> Dict[Tuple[str], int]:
+        counts = {(priority,): 0 for priority in PRIORITY_RANK}
+        for ticket in self._waiting:
+            counts[(ticket.requester.priority,)] += 1
+        return counts
+
+tts_scheduler = TTSScheduler(
+    slots=SCHED_SLOTS or balancer.total_capacity,
+    reserved_interactive=SCHED_INTERACTIVE_RESERVED_SLOTS,
+    user_max_concurrency=SCHED_USER_MAX_CONCURRENCY,
+    chars_per_minute=SCHED_USER_CHARS_PER_MINUTE,
+)
+
+SCHED_WAITING = metrics.gauge(
+    "audiobook_sched_waiting_segments", "等待 TTS 名额的分段数 (按优先级)", ["priority"], collect=tts_scheduler.waiting_counts
+)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -63,6 +63,114 @@ class Audio(AudioBase):
     id: int
     user_id: int
     audio_path: str
+    flac_path: Optional[str] = None
+    lossy_path: Optional[str] = None
+    lossy_format: Optional[str] = None
+    transcode_status: Optional[str] = None
+    create_time: datetime
+    class Config:
+        orm_mode = True
+
+class Chapter(BaseModel):
+    """
+    章节响应模型 (不含正文)
+    """
+    id: int
+    seq: int
+    title: Optional[str] = None
+    char_count: int
+    status: str
+    audio_id: Optional[int] = None
+    audio_seconds: Optional[float] = None
+    error: Optional[str] = None
+    class Config:
+        orm_mode = True
+
+class Book(BaseModel):
+    """
+    书籍响应模型
+    """
+    id: int
+    user_id: int
+    title: str
+    emo_type: int
+    status: str
+    job_id: Optional[str] = None
+    total_chars: int
+    done_chars: int
+    audio_seconds: Optional[float] = None
+    error: Optional[str] = None
+    create_time: datetime
+    start_time: Optional[datetime] = None
+    finish_time: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+
+class BookDetail(BaseModel):
+    """
+    书籍详情响应模型：章节列表与整体进度、吞吐统计
+    """
+    book: Book
+    chapters: List[Chapter]
+    progress: float
+    chapters_total: int
+    chapters_done: int
+    chapters_failed: int
+    elapsed_seconds: Optional[float] = None
+    chars_per_second: Optional[float] = None
+    real_time_factor: Optional[float] = None
+
+class TextChapterSummary(BaseModel):
+    """
+    文本章节摘要 (不含正文)
+    """
+    id: int
+    seq: int
+    title: Optional[str] = None
+    char_count: int
+    class Config:
+        orm_mode = True
+
+class TextChapter(TextChapterSummary):
+    """
+    文本章节响应模型 (含正文)
+    """
+    document_id: int
+    text: str
+
+class TextDocument(BaseModel):
+    """
+    上传文本响应模型
+    """
+    id: int
+    filename: Optional[str] = None
+    encoding: Optional[str] = None
+    char_count: int
+    chapter_count: int
+    create_time: datetime
+    class Config:
+        orm_mode = True
+
+class TextDocumentDetail(BaseModel):
+    """
+    上传文本详情：文本信息与章节目录
+    """
+    document: TextDocument
+    chapters: List[TextChapterSummary]
+
+class Voice(BaseModel):
+    """
+    音色库响应模型
+    """
+    id: int
+    name: str
+    emo_type: Optional[int] = None
+    content_hash: str
+    audio_path: str
+    duration: float
+    sample_rate: Optional[int] = None
+    original_bytes: int
+    stored_bytes: int
     create_time: datetime
     class Config:
         orm_mode = True
@@ -0,0 +1,374 @@
+import json
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from config import (
+    STATE_BACKEND,
+    STATE_SQLITE_PATH,
+    STATE_REDIS_URL,
+    STATE_REDIS_PREFIX,
+    RATE_LIMIT_MAX_KEYS,
+    SQLITE_BUSY_TIMEOUT_MS,
+)
+
+# 清理过期键与事件的最小间隔 (秒)
+PURGE_INTERVAL_SECONDS = 60
+
+def instance_id() -> str:
+    """
+    当前工作进程的标识 (主机名:进程号)，用于标记任务的所属进程与后台任务的执行者。
+    每次调用时读取进程号，预先导入后再 fork 的工作进程也能得到正确的值。
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _decode(raw) -> Any:
+    return json.loads(raw)
+
+class StateStore:
+    """
+    多个工作进程 (uvicorn --workers) 或节点共用的状态存储：任务快照、幂等记录、限流事件、播放地址等。
+    值为可 JSON 序列化的对象，ttl 为有效期 (秒，None 表示不过期)；各实现的读写语义一致。
+    """
+    def get(self, key: str) -> Any:
+        """
+        返回键对应的值，不存在或已过期时返回 None。
+        """
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """
+        仅在键不存在 (或已过期) 时写入，返回是否写入成功。用于跨进程的抢占与去重。
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """
+        原子地为整数值加上 amount (键不存在时视为 0)，返回新值。
+        """
+        raise NotImplementedError
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        """
+        返回以 prefix 开头的全部未过期键值。
+        """
+        raise NotImplementedError
+
+    def record_event(self, key: str, at: float, window: float) -> None:
+        """
+        为滑动窗口计数记录一次事件，早于 at - window 的事件随之清理。
+        """
+        raise NotImplementedError
+
+    def events(self, key: str, since: float) -> List[float]:
+        """
+        返回晚于 since 的事件时间戳 (升序)。
+        """
+        raise NotImplementedError
+
+    def clear_events(self, key: str) -> None:
+        raise NotImplementedError
+
+class MemoryStateStore(StateStore):
+    """
+    进程内实现：单进程部署的默认选项，测试中也可代替共享存储。多个工作进程之间不共享。
+    """
+    def __init__(self, max_event_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_event_keys = max_event_keys
+        self._values = {}  # key -> (JSON 文本, 过期时间)
+        self._events = {}  # key -> (deque[时间戳], 窗口)
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            raw = self._get_locked(key, time.time())
+        return None if raw is None else _decode(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raw = _encode(value)
+        now = time.time()
+        with self._lock:
+            self._values[key] = (raw, now + ttl if ttl is not None else None)
+            self._purge_locked(now)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        raw = _encode(value)
+        now = time.time()
+        with self._lock:
+            if self._get_locked(key, now) is not None:
+                return False
+            self._values[key] = (raw, now + ttl if ttl is not None else None)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        now = time.time()
+        with self._lock:
+            raw = self._get_locked(key, now)
+            value = (_decode(raw) if raw is not None else 0) + amount
+            expire_time = self._values[key][1] if raw is not None else None
+            self._values[key] = (_encode(value), expire_time)
+            return value
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            items = [
+                (key, raw) for key, (raw, expire_time) in self._values.items()
+                if key.startswith(prefix) and (expire_time is None or expire_time > now)
+            ]
+        return {key: _decode(raw) for key, raw in items}
+
+    def record_event(self, key: str, at: float, window: float) -> None:
+        with self._lock:
+            entry = self._events.get(key)
+            if entry is None:
+                if len(self._events) >= self.max_event_keys:
+                    self._prune_events_locked(at)
+                entry = self._events[key] = (deque(), window)
+            events = entry[0]
+            while events and events[0] <= at - window:
+                events.popleft()
+            events.append(at)
+
+    def events(self, key: str, since: float) -> List[float]:
+        with self._lock:
+            entry = self._events.get(key)
+            if entry is None:
+                return []
+            events = entry[0]
+            while events and events[0] <= since:
+                events.popleft()
+            return list(events)
+
+    def clear_events(self, key: str) -> None:
+        with self._lock:
+            self._events.pop(key, None)
+
+    def _get_locked(self, key: str, now: float) -> Optional[str]:
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        raw, expire_time = entry
+        if expire_time is not None and expire_time <= now:
+            del self._values[key]
+            return None
+        return raw
+
+    def _purge_locked(self, now: float) -> None:
+        # 调用方需持有 self._lock：定期清理过期的键，未再访问的键不会一直占用内存
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL_SECONDS
+        for key in [k for k, (_, expire_time) in self._values.items() if expire_time is not None and expire_time <= now]:
+            del self._values[key]
+
+    def _prune_events_locked(self, now: float) -> None:
+        # 调用方需持有 self._lock：先清理已过期的键，仍超出上限时淘汰最早加入的键
+        for key in [k for k, (events, window) in self._events.items() if not events or events[-1] <= now - window]:
+            del self._events[key]
+        while len(self._events) >= self.max_event_keys:
+            del self._events[next(iter(self._events))]
+
+class SqliteStateStore(StateStore):
+    """
+    SQLite 文件实现：同一节点上的多个工作进程共用 (WAL 模式，写操作在 IMMEDIATE 事务中执行)。
+    SQLite 的文件锁在网络文件系统上不可靠，多节点部署请使用 RedisStateStore。
+    连接在首次使用时建立，fork 出的子进程会重新连接。
+    """
+    def __init__(self, path: str, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM state WHERE key = ? AND (expire_time IS NULL OR expire_time > ?)", (key, time.time())
+            ).fetchone()
+        return None if row is None else _decode(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expire_time) VALUES (?, ?, ?)",
+                (key, _encode(value), now + ttl if ttl is not None else None),
+            )
+            self._purge_locked(conn, now)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM state WHERE key = ? AND expire_time <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO state (key, value, expire_time) VALUES (?, ?, ?)",
+                (key, _encode(value), now + ttl if ttl is not None else None),
+            )
+            return cursor.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT value, expire_time FROM state WHERE key = ? AND (expire_time IS NULL OR expire_time > ?)", (key, now)
+            ).fetchone()
+            value = (_decode(row[0]) if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO state (key, value, expire_time) VALUES (?, ?, ?)",
+                (key, _encode(value), row[1] if row else None),
+            )
+            return value
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM state WHERE substr(key, 1, ?) = ? AND (expire_time IS NULL OR expire_time > ?)",
+                (len(prefix), prefix, time.time()),
+            ).fetchall()
+        return {key: _decode(raw) for key, raw in rows}
+
+    def record_event(self, key: str, at: float, window: float) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO state_events (key, at, expire_time) VALUES (?, ?, ?)", (key, at, at + window))
+            conn.execute("DELETE FROM state_events WHERE key = ? AND at <= ?", (key, at - window))
+
+    def events(self, key: str, since: float) -> List[float]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT at FROM state_events WHERE key = ? AND at > ? ORDER BY at", (key, since)
+            ).fetchall()
+        return [at for (at,) in rows]
+
+    def clear_events(self, key: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM state_events WHERE key = ?", (key,))
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _connection(self) -> sqlite3.Connection:
+        # 调用方需持有 self._lock
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_time REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS state_events (key TEXT NOT NULL, at REAL NOT NULL, expire_time REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_state_events_key_at ON state_events (key, at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _purge_locked(self, conn: sqlite3.Connection, now: float) -> None:
+        # 调用方需持有 self._lock：定期清理过期的键与事件 (包括之后再未出现的限流键)
+        if now < self._next_purge:
+            return
+        self._next_purge = now + PURGE_INTERVAL_SECONDS
+        conn.execute("DELETE FROM state WHERE expire_time <= ?", (now,))
+        conn.execute("DELETE FROM state_events WHERE expire_time <= ?", (now,))
+
+class RedisStateStore(StateStore):
+    """
+    兼容 Redis 协议的服务 (Redis、Valkey、KeyDB 等) 实现，供多节点部署使用，依赖 redis 包。
+    键统一加上 prefix，便于与其他应用共用实例；过期由服务端处理，限流事件存放在有序集合中。
+    """
+    def __init__(self, url: str, prefix: str = ""):
+        import redis
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Any:
+        raw = self._redis.get(self.prefix + key)
+        return None if raw is None else _decode(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._redis.set(self.prefix + key, _encode(value), px=_milliseconds(ttl))
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(self._redis.set(self.prefix + key, _encode(value), px=_milliseconds(ttl), nx=True))
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(self.prefix + key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return int(self._redis.incrby(self.prefix + key, amount))
+
+    def scan(self, prefix: str) -> Dict[str, Any]:
+        pattern = re.sub(r"([\\*?\[\]])", r"\\\1", self.prefix + prefix) + "*"
+        keys = list(self._redis.scan_iter(match=pattern, count=500))
+        if not keys:
+            return {}
+        start = len(self.prefix)
+        return {
+            key.decode("utf-8")[start:]: _decode(raw)
+            for key, raw in zip(keys, self._redis.mget(keys)) if raw is not None
+        }
+
+    def record_event(self, key: str, at: float, window: float) -> None:
+        key = self.prefix + key
+        pipe = self._redis.pipeline()
+        pipe.zadd(key, {f"{at}:{uuid.uuid4().hex[:8]}": at})
+        pipe.zremrangebyscore(key, "-inf", at - window)
+        pipe.pexpire(key, _milliseconds(window))
+        pipe.execute()
+
+    def events(self, key: str, since: float) -> List[float]:
+        return [score for _, score in self._redis.zrangebyscore(self.prefix + key, f"({since}", "+inf", withscores=True)]
+
+    def clear_events(self, key: str) -> None:
+        self._redis.delete(self.prefix + key)
+
+def _milliseconds(ttl: Optional[float]) -> Optional[int]:
+    return max(int(ttl * 1000), 1) if ttl is not None else None
+
+def create_store(backend: str) -> StateStore:
+    """
+    按 STATE_BACKEND 创建状态存储: "memory" / "sqlite" / "redis"。
+    """
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SqliteStateStore(STATE_SQLITE_PATH)
+    if backend == "redis":
+        return RedisStateStore(STATE_REDIS_URL, STATE_REDIS_PREFIX)
+    raise ValueError(f"未知的共享状态存储: {backend}")
+
+state_store = create_store(STATE_BACKEND)
@@ -0,0 +1,240 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+import tracing
+from state_store import StateStore, state_store
+from config import (
+    OUTPUT_DIR,
+    TEMP_DIR,
+    DATA_DIR,
+    PROJECT_ROOT,
+    TEMP_OWNERSHIP_TTL_SECONDS,
+    STORAGE_SHARD_LEVELS,
+    STORAGE_SHARD_CHARS,
+)
+
+# Linux FICLONE ioctl，在 Btrfs/XFS 等文件系统上创建写时复制的副本 (reflink)
+FICLONE = 0x40049409
+
+# 跨文件系统复制时的分块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def _reflink(src: str, dst: str) -> bool:
+    """
+    尝试创建 reflink 副本，不支持时返回 False 且不留下目标文件。
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def _copy_chunked(src: str, dst: str) -> None:
+    """
+    分块复制到 .part 文件后原子替换，避免读者看到写了一半的文件。
+    """
+    part_path = f"{dst}.{threading.get_ident()}.part"
+    try:
+        with open(src, "rb") as fsrc, open(part_path, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+        os.replace(part_path, dst)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    为 src 创建一个独立的目录项 dst：优先硬链接 (O(1))，其次 reflink，最后分块复制。
+    返回实际使用的方式: "link" / "reflink" / "copy"。
+    """
+    with tracing.stage("file_copy", op="link_or_copy") as fields:
+        fields["method"] = _link_or_copy(src, dst)
+    return fields["method"]
+
+def _link_or_copy(src: str, dst: str) -> str:
+    try:
+        os.link(src, dst)
+        return "link"
+    except OSError:
+        pass
+    if _reflink(src, dst):
+        return "reflink"
+    _copy_chunked(src, dst)
+    return "copy"
+
+def move_file(src: str, dst: str) -> str:
+    """
+    移动文件：同一文件系统内原子重命名 (O(1))，跨文件系统时复制后删除源文件。
+    返回实际使用的方式: "rename" / "copy"。
+    """
+    with tracing.stage("file_copy", op="move") as fields:
+        fields["method"] = _move_file(src, dst)
+    return fields["method"]
+
+def _move_file(src: str, dst: str) -> str:
+    try:
+        os.replace(src, dst)
+        return "rename"
+    except OSError:
+        pass
+    _copy_chunked(src, dst)
+    os.remove(src)
+    return "copy"
+
+async def promote_file(src: str, dst: str, exclusive: bool) -> str:
+    """
+    将临时文件提升为持久文件。
+    exclusive 为 True 表示调用方独占该临时文件，可直接重命名；否则保留源文件，只做链接或复制。
+    可能涉及数据复制的分支在线程池中执行，不阻塞事件循环。
+    """
+    start = time.perf_counter()
+    method = "rename" if exclusive else "link"
+    try:
+        if exclusive:
+            os.replace(src, dst)
+        else:
+            os.link(src, dst)
+    except OSError:
+        method = await run_in_threadpool(move_file if exclusive else link_or_copy, src, dst)
+    else:
+        tracing.record_stage("file_copy", time.perf_counter() - start, op="promote", method=method)
+    touch_promoted(dst)
+    return method
+
+def touch_promoted(path: str) -> None:
+    """
+    把刚移入持久目录的文件的修改时间刷新为当前时间。
+    重命名与硬链接保留源文件 (临时文件或缓存文件) 的 mtime，可能早于 ORPHAN_GRACE_SECONDS，
+    写入数据库记录之前若恰好执行对账，会被当作无记录的孤儿文件删除。
+    """
+    os.utime(path)
+
+# 按分片布局存放文件的目录 (绝对路径)
+SHARDED_DIRS = (os.path.abspath(DATA_DIR), os.path.abspath(TEMP_DIR))
+
+def shard_parts(filename: str) -> List[str]:
+    """
+    文件所在的分片子目录 (由文件名去掉扩展名后的 MD5 前缀决定)。
+    同一音频的 WAV 与各转码副本主文件名相同，因此落在同一目录。
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    digest = hashlib.md5(stem.encode("utf-8")).hexdigest()
+    return [digest[i * STORAGE_SHARD_CHARS:(i + 1) * STORAGE_SHARD_CHARS] for i in range(STORAGE_SHARD_LEVELS)]
+
+def is_shard_dir_name(name: str) -> bool:
+    """
+    判断目录名是否为分片目录 (固定长度的十六进制串)，用于扫描时区分 cache 等其他子目录。
+    """
+    return len(name) == STORAGE_SHARD_CHARS and all(c in "0123456789abcdef" for c in name)
+
+def sharded_path(base_dir: str, filename: str) -> str:
+    """
+    返回文件在 base_dir (data 或 temp) 下按分片布局的绝对路径，并创建所需的子目录。
+    """
+    directory = os.path.join(os.path.abspath(base_dir), *shard_parts(filename))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(filename))
+
+def output_url(abs_path: str) -> str:
+    """
+    将输出目录内的绝对路径转换为 /output/... 形式的 URL 路径 (数据库存储与前端访问使用)。
+    """
+    relative = os.path.relpath(os.path.abspath(abs_path), os.path.abspath(OUTPUT_DIR))
+    return "/output/" + relative.replace(os.sep, "/")
+
+def path_candidates(abs_path: str) -> List[str]:
+    """
+    兼容旧的平铺路径：直接位于 data/temp 目录下的文件 (旧版 /output/data/<uuid>.wav 链接)
+    依次尝试分片位置与原位置；其他路径原样返回。
+    """
+    directory, filename = os.path.split(abs_path)
+    if directory not in SHARDED_DIRS or not STORAGE_SHARD_LEVELS:
+        return [abs_path]
+    return [os.path.join(directory, *shard_parts(filename), filename), abs_path]
+
+def _locate(abs_path: str) -> str:
+    candidates = path_candidates(abs_path)
+    for candidate in candidates[:-1]:
+        if os.path.exists(candidate):
+            return candidate
+    return candidates[-1]
+
+def literal_output_path(path_or_url: str) -> str:
+    """
+    按字面将音频路径解析为磁盘绝对路径，不做旧版平铺路径到分片位置的兼容查找。
+    """
+    if not path_or_url:
+        # 空值直接返回空字符串，便于上层做统一错误处理
+        return ""
+
+    # 统一路径分隔符，避免 Windows 反斜杠导致解析逻辑失效
+    candidate = path_or_url.replace("\\", "/").strip()
+
+    if candidate.startswith("/output/"):
+        # 标准情况：前端/数据库存的是 /output/... 形式的 URL 路径
+        relative = candidate[len("/output/"):].lstrip("/")
+        return os.path.abspath(os.path.join(OUTPUT_DIR, *relative.split("/")))
+
+    output_index = candidate.find("/output/")
+    if output_index != -1:
+        # 兼容情况：字符串中包含 /output/... 片段
+        relative = candidate[output_index + 1 :].lstrip("/")
+        return os.path.abspath(os.path.join(PROJECT_ROOT, *relative.split("/")))
+
+    candidate = candidate.lstrip("./")
+    if candidate.startswith("../"):
+        # 兼容情况：../output/... 这种基于项目根目录的相对路径
+        return os.path.abspath(os.path.join(PROJECT_ROOT, *candidate.lstrip("./").split("/")))
+
+    # 兜底：当作相对项目根目录的路径处理
+    return os.path.abspath(os.path.join(PROJECT_ROOT, *candidate.split("/")))
+
+def resolve_output_path_to_abs_path(path_or_url: str) -> str:
+    """
+    将音频路径统一解析为磁盘绝对路径。
+    
+    说明：
+    - 推荐输入：以 /output/... 开头的 URL 路径（后端返回/数据库存储的标准格式）。
+    - 兼容输入：允许字符串中包含 /output/... 片段，以及旧版 ../output/... 
+    - 旧版平铺路径 (/output/data/<uuid>.wav) 在文件已迁移到分片目录后解析为分片位置，旧链接保持可用。
+    - 该函数仅负责“解析”，不负责鉴权与目录边界校验；调用方需自行做白名单目录校验。
+    """
+    abs_path = literal_output_path(path_or_url)
+    return _locate(abs_path) if abs_path else abs_path
+
+class TempFileRegistry:
+    """
+    临时文件归属登记。
+    合成任务产生的临时文件登记在生成它的用户名下；保存时若确认为该用户独占，
+    即可直接重命名到持久目录，无需复制。
+    登记保存在共享状态中 (TEMP_OWNERSHIP_TTL_SECONDS 后过期)，生成与保存可由不同的工作进程处理。
+    """
+    def __init__(self, store: StateStore = state_store):
+        self.store = store
+
+    def register(self, path: str, user_id: int) -> None:
+        self.store.set(self._key(path), user_id, ttl=TEMP_OWNERSHIP_TTL_SECONDS)
+
+    def owner(self, path: str) -> Optional[int]:
+        return self.store.get(self._key(path))
+
+    def release(self, path: str) -> None:
+        self.store.delete(self._key(path))
+
+    def _key(self, path: str) -> str:
+        # 以相对输出目录的路径为键，各节点的共享存储挂载点不同也能对应
+        return f"temp-owner:{os.path.relpath(os.path.abspath(path), os.path.abspath(OUTPUT_DIR))}"
+
+temp_files = TempFileRegistry()
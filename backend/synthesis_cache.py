@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from config import (
+    SYNTH_CACHE_ENABLED,
+    SYNTH_CACHE_DIR,
+    SYNTH_CACHE_MAX_BYTES,
+    SYNTH_CACHE_MAX_AGE_SECONDS,
+    SYNTH_CACHE_INDEX_PATH,
+)
+from storage import link_or_copy, move_file
+from text_utils import normalize_text
+
+# 最近被访问过的条目在该时长内不会被淘汰，避免正在读取的文件被删除
+EVICTION_GRACE_SECONDS = 60
+
+def make_cache_key(text: str, emo_type: int, params: dict, ref_digest: str) -> str:
+    """
+    由 (规范化文本, 情感类型, 全部推理参数, 参考音频内容哈希) 计算内容寻址的缓存键。
+    文本规范化与任务去重指纹相同 (text_utils.normalize_text)：换行参与分句、会影响合成结果，因此保留。
+    """
+    payload = json.dumps(
+        {
+            "text": normalize_text(text),
+            "emo_type": emo_type,
+            "params": params,
+            "ref": ref_digest,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class SqliteCacheIndex:
+    """
+    可选的 SQLite 缓存索引，重启后无需扫描缓存目录即可恢复 LRU 状态。
+    """
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "create_time REAL NOT NULL, access_time REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self):
+        return self._conn.execute(
+            "SELECT key, size, create_time, access_time FROM cache_entries ORDER BY access_time"
+        ).fetchall()
+
+    def put(self, key: str, size: int, create_time: float, access_time: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, size, create_time, access_time) VALUES (?, ?, ?, ?)",
+            (key, size, create_time, access_time),
+        )
+        self._conn.commit()
+
+    def touch(self, key: str, access_time: float) -> None:
+        self._conn.execute("UPDATE cache_entries SET access_time = ? WHERE key = ?", (access_time, key))
+        self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        self._conn.commit()
+
+class SynthesisCache:
+    """
+    内容寻址的合成结果缓存。
+    缓存文件以 <key>.wav 存放在 SYNTH_CACHE_DIR，按总大小与条目年龄做 LRU 淘汰，并统计命中率。
+    索引在每个进程内各自维护，缓存目录本身可由多个工作进程或节点 (共享存储) 共用。
+    """
+    def __init__(self, cache_dir: str, max_bytes: int, max_age: float, index_path: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> [size, create_time, access_time]，按访问时间排序
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._index_path = index_path
+        self._index: Optional[SqliteCacheIndex] = None
+        self._initialized = False
+
+    def init(self) -> None:
+        """
+        创建缓存目录、打开索引并恢复 LRU 状态 (有索引时读取索引，否则扫描缓存目录)。
+        应用启动时 (lifespan) 在每个工作进程中调用一次，重复调用无副作用；未调用时在首次使用时执行。
+        """
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self._index_path:
+                self._index = SqliteCacheIndex(self._index_path)
+            self._load_locked()
+            self._initialized = True
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        命中时返回缓存文件路径并刷新其 LRU 位置，未命中返回 None。
+        """
+        self.init()
+        path = self.path_for(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not os.path.exists(path):
+                # 文件被外部删除，索引同步失效
+                self._remove_locked(key, delete_file=False)
+                entry = None
+            if entry is None:
+                entry = self._adopt_locked(key, path)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry[2] = time.time()
+            self._entries.move_to_end(key)
+            if self._index:
+                self._index.touch(key, entry[2])
+        return path
+
+    def _adopt_locked(self, key: str, path: str) -> Optional[list]:
+        # 调用方需持有 self._lock：多个工作进程共用缓存目录时，其他进程生成的缓存文件不在本进程的索引中，
+        # 按文件名 (即缓存键) 查找到后加入索引
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self._entries[key] = [stat.st_size, stat.st_mtime, stat.st_mtime]
+        self._total_bytes += stat.st_size
+        if self._index:
+            self._index.put(key, stat.st_size, stat.st_mtime, stat.st_mtime)
+        return entry
+
+    def store(self, key: str, src_path: str, move: bool = False) -> str:
+        """
+        将生成结果存入缓存，返回缓存文件路径。
+        move 为 True 时直接移入缓存 (源文件为可丢弃的 TTS 临时结果)，否则链接或复制。
+        """
+        self.init()
+        path = self.path_for(key)
+        part_path = f"{path}.{threading.get_ident()}.part"
+        if move:
+            move_file(src_path, part_path)
+        else:
+            link_or_copy(src_path, part_path)
+        os.replace(part_path, path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = [size, now, now]
+            self._entries.move_to_end(key)
+            self._total_bytes += size
+            if self._index:
+                self._index.put(key, size, now, now)
+            self._evict_locked()
+        return path
+
+    def stats(self) -> dict:
+        self.init()
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _load_locked(self) -> None:
+        # 调用方需持有 self._lock
+        if self._index:
+            rows = self._index.load()
+        else:
+            rows = []
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".wav"):
+                        stat = entry.stat()
+                        rows.append((entry.name[:-4], stat.st_size, stat.st_mtime, stat.st_atime))
+            rows.sort(key=lambda row: row[3])
+        for key, size, create_time, access_time in rows:
+            self._entries[key] = [size, create_time, access_time]
+            self._total_bytes += size
+        self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        now = time.time()
+        # 先按年龄淘汰
+        for key in [k for k, e in self._entries.items() if now - e[1] > self.max_age and now - e[2] > EVICTION_GRACE_SECONDS]:
+            self._remove_locked(key)
+        # 再按最近最少使用淘汰，直到总大小不超过上限
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if now - self._entries[key][2] > EVICTION_GRACE_SECONDS:
+                self._remove_locked(key)
+
+    def _remove_locked(self, key: str, delete_file: bool = True) -> None:
+        size = self._entries.pop(key)[0]
+        self._total_bytes -= size
+        self.evictions += 1
+        if self._index:
+            self._index.delete(key)
+        if delete_file:
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+# 导入时只创建对象，不访问文件系统；目录与索引在应用启动时由 init() 初始化
+synthesis_cache = (
+    SynthesisCache(SYNTH_CACHE_DIR, SYNTH_CACHE_MAX_BYTES, SYNTH_CACHE_MAX_AGE_SECONDS, SYNTH_CACHE_INDEX_PATH)
+    if SYNTH_CACHE_ENABLED else None
+)
+
+def init() -> None:
+    """
+    应用启动时调用 (见 main.lifespan)：启用缓存时创建缓存目录并加载索引。
+    """
+    if synthesis_cache is not None:
+        synthesis_cache.init()
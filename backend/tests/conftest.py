@@ -0,0 +1,88 @@
+"""
+测试公共配置：把 backend 与 bench 目录加入导入路径，输出目录与数据库指向临时目录 (须在导入 config 之前设置)，
+并提供在子进程中启动模拟 IndexTTS2 服务 (bench/fake_tts_server.py) 的工具。
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+BENCH_DIR = os.path.join(BACKEND_DIR, "bench")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+_workdir = tempfile.mkdtemp(prefix="audiobook-tests-")
+os.environ.setdefault("AUDIOBOOK_OUTPUT_DIR", os.path.join(_workdir, "output"))
+os.environ.setdefault("AUDIOBOOK_DATABASE_PATH", os.path.join(_workdir, "test.db"))
+os.environ.setdefault("AUDIOBOOK_STATE_BACKEND", "memory")
+
+import httpx
+import pytest
+from load_bench import free_port
+
+class FakeTTSServer:
+    """
+    子进程中的模拟 TTS 服务。port 为 None 时自动选择空闲端口；可先确定端口、稍后再启动 (模拟服务恢复)。
+    """
+    def __init__(self, workdir: str, port: int = None, *extra_args: str):
+        self.workdir = workdir
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}/"
+        self.extra_args = extra_args
+        self.process = None
+
+    def start(self) -> "FakeTTSServer":
+        self.process = subprocess.Popen([
+            sys.executable, os.path.join(BENCH_DIR, "fake_tts_server.py"),
+            "--port", str(self.port), "--latency", "0.05", "--jitter", "0", "--seconds-per-char", "0.02",
+            "--workdir", self.workdir, *self.extra_args,
+        ])
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(self.url + "config", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("模拟 TTS 服务启动超时")
+
+    def stats(self) -> dict:
+        return httpx.get(self.url + "stats", timeout=5).json()
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+@pytest.fixture
+def fake_tts(tmp_path):
+    """
+    返回启动模拟服务的工厂函数，测试结束时统一关闭。
+    """
+    servers = []
+
+    def factory(*extra_args: str, port: int = None, start: bool = True) -> FakeTTSServer:
+        server = FakeTTSServer(str(tmp_path / f"fake-tts-{len(servers)}"), port, *extra_args)
+        servers.append(server)
+        return server.start() if start else server
+
+    yield factory
+    for server in servers:
+        server.stop()
+
+@pytest.fixture(scope="session")
+def database():
+    """
+    在临时数据库中建表 (与启动时相同的迁移流程)。
+    """
+    from database import engine, Base
+    from migrations import migrate
+    import models  # noqa: F401  注册全部模型
+    migrate(engine, Base.metadata)
+    return engine
@@ -0,0 +1,20 @@
+"""
+整书上传的章节解码 (routers.books._build_chapters)：编码识别与文本库上传一致。
+"""
+import pytest
+from routers.books import _build_chapters
+
+TEXT = "第一章 开始\n㐀字与“引号”。"
+
+@pytest.mark.parametrize("content", [
+    TEXT.encode("utf-8"),
+    TEXT.encode("utf-8-sig"),
+    TEXT.encode("utf-16"),
+    TEXT.encode("gb18030"),
+    # 开头为 ASCII、后文为 GB18030：按 UTF-8 识别后回退
+    b"x" * 100 + TEXT.encode("gb18030"),
+])
+def test_chapter_encodings(content):
+    [(title, text)] = _build_chapters([("01.txt", content)])
+    assert title == "01"
+    assert text.endswith(TEXT) and "\ufeff" not in text
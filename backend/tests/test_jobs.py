@@ -0,0 +1,216 @@
+"""
+合成任务队列 (jobs.JobManager)：有界队列、取消、批量任务执行上限、重复提交合并与幂等键重放。
+"""
+import threading
+import time
+import pytest
+from jobs import (
+    JobManager, RemoteJob, QueueFullError, IdempotencyConflict,
+    JOB_PENDING, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED,
+)
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Requester
+from state_store import MemoryStateStore
+
+class Task:
+    """
+    可控的任务函数：记录调用次数，started 在开始执行时置位，执行到 release 置位为止；fail 为 True 时抛出异常。
+    """
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, value, job=None):
+        with self._lock:
+            self.calls += 1
+        self.started.set()
+        assert self.release.wait(10)
+        if self.fail:
+            raise RuntimeError("boom")
+        return value
+
+@pytest.fixture
+def make_manager():
+    """
+    返回创建 JobManager 的工厂函数 (默认使用独立的内存状态存储)，测试结束时统一关闭。
+    """
+    managers = []
+
+    def factory(store=None, **kwargs) -> JobManager:
+        options = dict(worker_count=2, max_queued=10, max_per_user=10, result_ttl=60, idempotency_ttl=60)
+        options.update(kwargs)
+        manager = JobManager(store=store or MemoryStateStore(), **options)
+        managers.append(manager)
+        return manager
+
+    yield factory
+    for manager in managers:
+        manager.shutdown()
+
+def _cooperative(started: threading.Event, job=None):
+    # 在安全点之间循环，直到被取消
+    started.set()
+    while True:
+        job.check_cancelled()
+        time.sleep(0.01)
+
+def test_queue_rejects_when_full(make_manager):
+    manager = make_manager(worker_count=1, max_queued=2)
+    task = Task()
+    running = manager.submit(1, task, "running")
+    assert task.started.wait(10)
+    queued = [manager.submit(2, task, "queued"), manager.submit(3, task, "queued")]
+    assert all(job.status == JOB_PENDING for job in queued)
+
+    with pytest.raises(QueueFullError, match="合成队列已满"):
+        manager.submit(4, task, "rejected")
+    # 出队 (取消) 后重新接收
+    manager.cancel(queued[0].id)
+    assert manager.submit(4, task, "accepted").status == JOB_PENDING
+
+    task.release.set()
+    assert running.wait(10) and running.status == JOB_SUCCEEDED
+
+def test_queue_rejects_user_over_limit(make_manager):
+    manager = make_manager(worker_count=1, max_per_user=2)
+    task = Task()
+    manager.submit(1, task, "running")
+    assert task.started.wait(10)
+    manager.submit(1, task, "queued")
+
+    # 执行中的任务也计入单用户在途任务数，其他用户不受影响
+    with pytest.raises(QueueFullError, match="排队任务过多"):
+        manager.submit(1, task, "rejected")
+    assert manager.submit(2, task, "other").status == JOB_PENDING
+    task.release.set()
+
+def test_cancel_queued_job(make_manager):
+    manager = make_manager(worker_count=1)
+    task = Task()
+    running = manager.submit(1, task, "running")
+    assert task.started.wait(10)
+    queued = manager.submit(1, task, "queued")
+
+    assert manager.cancel(queued.id)
+    assert queued.status == JOB_CANCELLED
+    task.release.set()
+    assert running.wait(10)
+    # 已取消的任务不会再执行，已结束的任务无法取消
+    assert task.calls == 1
+    assert not manager.cancel(running.id)
+
+def test_cancel_running_job(make_manager):
+    manager = make_manager()
+    started = threading.Event()
+    job = manager.submit(1, _cooperative, started)
+    assert started.wait(10) and job.status == JOB_RUNNING
+
+    assert manager.cancel(job.id)
+    assert job.wait(10) and job.status == JOB_CANCELLED
+
+def test_batch_jobs_limited_to_max_batch_running(make_manager):
+    manager = make_manager(worker_count=2, max_batch_running=1)
+    batch_task, interactive_task = Task(), Task()
+    batch = [
+        manager.submit(user_id, batch_task, "book", requester=Requester(user_id, PRIORITY_BATCH))
+        for user_id in (1, 2)
+    ]
+    assert batch_task.started.wait(10)
+    interactive = manager.submit(3, interactive_task, "preview", requester=Requester(3, PRIORITY_INTERACTIVE))
+
+    # 第二个批量任务等待批量名额，空闲的工作线程留给交互任务
+    assert interactive_task.started.wait(10)
+    assert [job.status for job in batch] == [JOB_RUNNING, JOB_PENDING]
+    interactive_task.release.set()
+    assert interactive.wait(10)
+    time.sleep(0.1)
+    assert batch[1].status == JOB_PENDING
+
+    batch_task.release.set()
+    assert all(job.wait(10) and job.status == JOB_SUCCEEDED for job in batch)
+
+def test_concurrent_identical_submits_attach_to_one_job(make_manager):
+    manager = make_manager()
+    task = Task()
+    jobs = [None] * 8
+
+    def submit(index):
+        jobs[index] = manager.submit(1, task, "result", dedup_key="same")
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(jobs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({job.id for job in jobs}) == 1
+    # 其他用户的相同内容不合并
+    other = manager.submit(2, task, "result", dedup_key="same")
+    assert other.id != jobs[0].id
+
+    task.release.set()
+    assert jobs[0].wait(10) and other.wait(10)
+    assert jobs[0].status == JOB_SUCCEEDED and jobs[0].result == "result"
+    assert task.calls == 2
+
+def test_coalesce_across_processes_sharing_a_store(make_manager):
+    store = MemoryStateStore()
+    first, second = make_manager(store), make_manager(store)
+    task = Task()
+    job = first.submit(1, task, "result", dedup_key="same")
+    assert task.started.wait(10)
+
+    attached = second.submit(1, task, "result", dedup_key="same")
+    assert isinstance(attached, RemoteJob) and attached.id == job.id
+    task.release.set()
+    assert job.wait(10) and task.calls == 1
+
+def test_idempotency_key_replays_within_window(make_manager):
+    manager = make_manager()
+    task = Task()
+    task.release.set()
+    job = manager.submit(1, task, "result", dedup_key="a", idempotency_key="key-1")
+    assert job.wait(10)
+
+    # 任务已结束 (指纹登记已释放)，同一幂等键重试仍返回首次提交的任务
+    assert manager.submit(1, task, "result", dedup_key="a", idempotency_key="key-1").id == job.id
+    assert task.calls == 1
+
+def test_idempotency_key_expires_after_window(make_manager):
+    manager = make_manager(idempotency_ttl=0.2)
+    task = Task()
+    task.release.set()
+    job = manager.submit(1, task, "result", dedup_key="a", idempotency_key="key-1")
+    assert job.wait(10)
+
+    time.sleep(0.3)
+    again = manager.submit(1, task, "result", dedup_key="a", idempotency_key="key-1")
+    assert again.id != job.id
+
+def test_idempotency_key_reused_with_different_body(make_manager):
+    manager = make_manager()
+    task = Task()
+    task.release.set()
+    manager.submit(1, task, "result", dedup_key="a", idempotency_key="key-1")
+
+    with pytest.raises(IdempotencyConflict):
+        manager.submit(1, task, "other", dedup_key="b", idempotency_key="key-1")
+    # 幂等键按用户区分
+    assert manager.submit(2, task, "other", dedup_key="b", idempotency_key="key-1") is not None
+
+def test_failed_leader_releases_claim(make_manager):
+    manager = make_manager()
+    failing = Task(fail=True)
+    failing.release.set()
+    job = manager.submit(1, failing, "result", dedup_key="same", idempotency_key="key-1")
+    assert job.wait(10) and job.status == JOB_FAILED
+
+    # 失败任务不再吸收相同内容的提交；幂等键重试时重新执行
+    retry_task = Task()
+    retry_task.release.set()
+    coalesced = manager.submit(1, retry_task, "result", dedup_key="same")
+    assert coalesced.id != job.id
+    replayed = manager.submit(1, retry_task, "result", dedup_key="same", idempotency_key="key-1")
+    assert replayed.id != job.id
+    assert coalesced.wait(10) and coalesced.status == JOB_SUCCEEDED
@@ -0,0 +1,46 @@
+"""
+存储清理 (reaper)：合成缓存命中时以硬链接生成的临时文件不应按缓存文件的创建时间被当作过期文件删除；
+刚保存到持久目录、尚未写入记录的文件也不应按临时文件的 mtime 被当作孤儿文件删除。
+"""
+import asyncio
+import os
+import time
+import uuid
+import reaper
+import tts_service
+from config import DATA_DIR, SYNTH_CACHE_DIR, TEMP_DIR, TEMP_MAX_AGE_SECONDS
+from fake_tts_server import write_tone
+from storage import promote_file, sharded_path
+
+def _old_file(directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4().hex}.wav")
+    write_tone(path, 0.5, 16000)
+    old = time.time() - TEMP_MAX_AGE_SECONDS - 3600
+    os.utime(path, (old, old))
+    return path
+
+def test_cache_hit_survives_reap_temp():
+    cached_path = _old_file(SYNTH_CACHE_DIR)
+    output_path = sharded_path(TEMP_DIR, f"{uuid.uuid4()}.wav")
+    tts_service._link_cached(cached_path, output_path)
+
+    reaper.reap_temp()
+    assert os.path.exists(output_path)
+    assert os.path.exists(cached_path)
+
+def test_expired_temp_file_is_removed():
+    expired = _old_file(os.path.dirname(sharded_path(TEMP_DIR, f"{uuid.uuid4()}.wav")))
+
+    result = reaper.reap_temp()
+    assert not os.path.exists(expired)
+    assert result["files_removed"] >= 1
+
+def test_promoted_file_survives_reconcile_before_commit(database):
+    temp_path = _old_file(os.path.dirname(sharded_path(TEMP_DIR, f"{uuid.uuid4()}.wav")))
+    data_path = sharded_path(DATA_DIR, os.path.basename(temp_path))
+    asyncio.run(promote_file(temp_path, data_path, exclusive=True))
+
+    result = reaper.reconcile_data()
+    assert os.path.exists(data_path)
+    assert result["orphan_files_removed"] == 0
@@ -0,0 +1,59 @@
+"""
+TTS 分段调度 (scheduler.TTSScheduler.submit)：线程池容量等于名额数时，
+被优先级预留或用户配额暂缓的批量分段不能占住线程、挡住交互分段。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Requester, TTSScheduler
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=True)
+
+def _blocking(release: threading.Event):
+    def run():
+        assert release.wait(10)
+        return "batch"
+    return run
+
+def test_interactive_segment_passes_saturating_batch_work(executor):
+    scheduler = TTSScheduler(slots=2, reserved_interactive=1)
+    release = threading.Event()
+    batch = Requester(1, PRIORITY_BATCH)
+    batch_futures = [scheduler.submit(executor, batch, 100, _blocking(release)) for _ in range(6)]
+    assert scheduler.snapshot()["running"] == {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+    assert scheduler.snapshot()["waiting"][PRIORITY_BATCH] == 5
+
+    interactive = scheduler.submit(executor, Requester(2, PRIORITY_INTERACTIVE), 10, lambda: "interactive")
+    assert interactive.result(timeout=5) == "interactive"
+
+    release.set()
+    assert [future.result(timeout=10) for future in batch_futures] == ["batch"] * 6
+    assert scheduler.snapshot()["running"] == {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+
+def test_user_over_concurrency_does_not_block_other_users(executor):
+    scheduler = TTSScheduler(slots=2, user_max_concurrency=1)
+    release = threading.Event()
+    heavy = Requester(1, PRIORITY_BATCH)
+    heavy_futures = [scheduler.submit(executor, heavy, 100, _blocking(release)) for _ in range(4)]
+
+    other = scheduler.submit(executor, Requester(2, PRIORITY_INTERACTIVE), 10, lambda: "other")
+    assert other.result(timeout=5) == "other"
+
+    release.set()
+    assert all(future.result(timeout=10) == "batch" for future in heavy_futures)
+
+def test_cancelled_waiting_segment_leaves_queue(executor):
+    scheduler = TTSScheduler(slots=1)
+    release = threading.Event()
+    requester = Requester(1, PRIORITY_BATCH)
+    running = scheduler.submit(executor, requester, 10, _blocking(release))
+    queued = scheduler.submit(executor, requester, 10, lambda: "never")
+
+    assert queued.cancel()
+    assert scheduler.snapshot()["waiting"][PRIORITY_BATCH] == 0
+    release.set()
+    assert running.result(timeout=10) == "batch"
@@ -0,0 +1,36 @@
+"""
+合成缓存 (synthesis_cache)：缓存键与任务去重指纹 (routers.jobs.synthesis_fingerprint) 对 "相同文本" 的判断一致；
+创建对象时不访问文件系统，目录与索引在 init() 时初始化。
+"""
+import os
+import pytest
+from synthesis_cache import SynthesisCache, make_cache_key
+from routers.jobs import synthesis_fingerprint
+
+@pytest.mark.parametrize("a, b, same", [
+    ("你好，  世界。", " 你好， 世界。\r\n", True),
+    ("Caf\u00e9", "Cafe\u0301", True),
+    ("第一行。\n第二行。", "第一行。 第二行。", False),
+])
+def test_cache_key_agrees_with_fingerprint(a, b, same):
+    assert (make_cache_key(a, 0, {}, "ref") == make_cache_key(b, 0, {}, "ref")) is same
+    assert (synthesis_fingerprint(a, 0, None, None, None) == synthesis_fingerprint(b, 0, None, None, None)) is same
+
+@pytest.mark.parametrize("with_index", [False, True])
+def test_init_creates_directory_and_restores_entries(tmp_path, with_index):
+    cache_dir = str(tmp_path / "cache")
+    index_path = str(tmp_path / "index.db") if with_index else None
+    source = tmp_path / "result.wav"
+    source.write_bytes(b"RIFF" + b"\0" * 100)
+
+    cache = SynthesisCache(cache_dir, max_bytes=1 << 20, max_age=3600, index_path=index_path)
+    assert not os.path.exists(cache_dir) and not os.path.exists(tmp_path / "index.db")
+    cache.init()
+    assert os.path.isdir(cache_dir)
+    cache.store("key", str(source))
+
+    # 新进程 (新对象) 启动时从索引或缓存目录恢复条目
+    restarted = SynthesisCache(cache_dir, max_bytes=1 << 20, max_age=3600, index_path=index_path)
+    restarted.init()
+    assert restarted.stats()["entries"] == 1
+    assert restarted.lookup("key") == cache.path_for("key")
@@ -0,0 +1,105 @@
+"""
+多 TTS 服务的故障转移与熔断 (tts_backends.BackendBalancer、tts_service._predict_with_failover) 及合成失败原因的上报，
+使用 bench/fake_tts_server.py 模拟的 IndexTTS2 服务。
+"""
+import time
+import httpx
+import pytest
+import tts_backends
+import tts_service
+from fake_tts_server import write_tone
+from load_bench import free_port
+from tts_backends import Backend, BackendBalancer
+
+@pytest.fixture
+def reference(tmp_path):
+    path = str(tmp_path / "reference.wav")
+    write_tone(path, 0.5, 16000)
+    return path
+
+@pytest.fixture
+def use_balancer(monkeypatch):
+    """
+    用测试专用的负载均衡器替换 tts_service 中的全局实例。
+    """
+    def install(*urls: str) -> BackendBalancer:
+        balancer = BackendBalancer([Backend(url, max_concurrency=1) for url in urls])
+        monkeypatch.setattr(tts_service, "balancer", balancer)
+        return balancer
+    return install
+
+def test_failover_to_healthy_backend(fake_tts, use_balancer, reference):
+    dead_url = f"http://127.0.0.1:{free_port()}/"
+    live = fake_tts()
+    balancer = use_balancer(dead_url, live.url)
+    dead, healthy = balancer.backends
+
+    assert tts_service._predict_with_failover(reference, reference, "你好。")
+    assert dead.total_failures == 1 and dead.consecutive_failures == 1
+    assert healthy.total_requests == 1 and healthy.total_failures == 0
+    assert live.stats()["requests"] == 1
+
+def test_circuit_opens_then_recovers_through_half_open(fake_tts, use_balancer, reference, monkeypatch):
+    monkeypatch.setattr(tts_backends, "TTS_CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(tts_backends, "TTS_CIRCUIT_RESET_SECONDS", 0.5)
+    server = fake_tts(start=False)
+    balancer = use_balancer(server.url)
+    backend = balancer.backends[0]
+
+    # 服务未启动：连接失败计入熔断，达到阈值后熔断，期间不再接收请求
+    with pytest.raises(tts_backends.NoBackendAvailable):
+        tts_service._predict_with_failover(reference, reference, "你好。")
+    assert backend.consecutive_failures == 2
+    assert backend.circuit_state(time.time()) == "open"
+    with pytest.raises(tts_backends.NoBackendAvailable):
+        balancer.acquire(timeout=0.1)
+
+    # 服务恢复、熔断到期后进入半开状态，放行的试探请求成功后恢复正常
+    server.start()
+    time.sleep(0.6)
+    assert backend.circuit_state(time.time()) == "half_open"
+    assert tts_service._predict_with_failover(reference, reference, "恢复了。")
+    assert backend.circuit_state(time.time()) == "closed"
+    assert backend.consecutive_failures == 0
+
+def test_poison_segment_does_not_retry_or_trip_circuit(fake_tts, use_balancer, reference, monkeypatch):
+    monkeypatch.setattr(tts_backends, "TTS_CIRCUIT_FAILURE_THRESHOLD", 2)
+    server = fake_tts("--fail-text", "坏分段")
+    balancer = use_balancer(server.url)
+    backend = balancer.backends[0]
+
+    for _ in range(3):
+        with pytest.raises(Exception) as error:
+            tts_service._predict_with_failover(reference, reference, "这是一个坏分段。")
+        assert not tts_backends.is_backend_fault(error.value)
+    # 每次只调用一次 (不重试)，熔断保持关闭，其他请求不受影响
+    assert server.stats()["requests"] == 3
+    assert backend.circuit_state(time.time()) == "closed"
+    assert tts_service._predict_with_failover(reference, reference, "正常的分段。")
+    assert server.stats()["requests"] == 4
+
+def test_synthesis_failure_carries_cause(fake_tts, use_balancer, reference):
+    server = fake_tts("--fail-text", "坏分段")
+    use_balancer(server.url)
+
+    with pytest.raises(tts_service.SynthesisError) as error:
+        tts_service.synthesize_audio("这是一个坏分段。", 0, voice_path=reference, emo_voice_path=reference)
+    assert error.value.cause == "backend_error"
+    assert "backend_error" in str(error.value)
+
+def test_client_kept_on_content_error_and_discarded_on_fault(fake_tts):
+    server = fake_tts()
+    pool = tts_backends.ClientPool(server.url, 1)
+
+    with pytest.raises(ValueError):
+        with pool.client():
+            raise ValueError("bad segment")
+    with pool.client() as client:
+        pass
+    assert pool._created == 1 and pool._idle.qsize() == 1
+
+    with pytest.raises(httpx.ConnectError):
+        with pool.client() as reused:
+            assert reused is client
+            raise httpx.ConnectError("connection reset")
+    assert pool._created == 0 and pool._idle.qsize() == 0
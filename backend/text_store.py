@@ -0,0 +1,115 @@
+from typing import Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+from text_utils import detect_encoding, normalize_line, ChapterSplitter, IncrementalTextDecoder
+from config import TEXT_UPLOAD_MAX_BYTES, TEXT_UPLOAD_CHUNK_BYTES, TEXT_INLINE_MAX_CHARS
+
+async def ingest_upload(db: AsyncSession, user_id: int, file: UploadFile) -> Tuple[models.TextDocument, Optional[str]]:
+    """
+    流式导入上传的文本文件：按块读取并增量解码 (首块识别编码，UTF-8 后续解码失败时回退到 GB18030)，逐行规范化，
+    边读边按 "第X章" 切分章节并写入文本库，内存中只保留当前章节。
+    返回文本记录，以及字数不超过 TEXT_INLINE_MAX_CHARS 时的规范化全文 (否则为 None)。
+    """
+    document = models.TextDocument(user_id=user_id, filename=file.filename, char_count=0, chapter_count=0)
+    db.add(document)
+    await db.flush()
+
+    splitter = ChapterSplitter()
+    decoder = None
+    pending = ""
+    total_bytes = 0
+    inline_lines = []
+    inline_chars = 0
+
+    async def add_chapter(chapter: Optional[Tuple[str, str]]) -> None:
+        if chapter is None:
+            return
+        title, text = chapter
+        document.chapter_count += 1
+        document.char_count += len(text)
+        db.add(models.TextChapter(
+            document_id=document.id,
+            seq=document.chapter_count,
+            title=title,
+            text=text,
+            char_count=len(text),
+        ))
+        # 逐章写入，已写入的章节正文不再常驻内存
+        await db.flush()
+
+    try:
+        while True:
+            chunk = await file.read(TEXT_UPLOAD_CHUNK_BYTES)
+            total_bytes += len(chunk)
+            if total_bytes > TEXT_UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="文件大小超出限制")
+            if decoder is None:
+                decoder = IncrementalTextDecoder(detect_encoding(chunk))
+            try:
+                text = pending + decoder.decode(chunk, final=not chunk)
+            except UnicodeDecodeError:
+                raise HTTPException(status_code=400, detail="文件解码失败")
+            document.encoding = decoder.encoding
+            lines = text.splitlines()
+            # 末尾不完整的一行留到下一块
+            pending = lines.pop() if chunk and lines and not text.endswith(("\n", "\r")) else ""
+            for raw_line in lines:
+                line = normalize_line(raw_line)
+                if inline_lines is not None and line:
+                    inline_chars += len(line)
+                    inline_lines.append(line)
+                    if inline_chars > TEXT_INLINE_MAX_CHARS:
+                        inline_lines = None
+                await add_chapter(splitter.feed(line))
+            if not chunk:
+                break
+        await add_chapter(splitter.finish())
+    except Exception:
+        await db.rollback()
+        raise
+
+    if document.chapter_count == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="文件内容为空")
+    await db.commit()
+    await db.refresh(document)
+    return document, "\n".join(inline_lines) if inline_lines is not None else None
+
+async def get_document(db: AsyncSession, document_id: int, current_user: models.User) -> models.TextDocument:
+    """
+    查询文本记录，不存在或无权访问时返回 404。
+    """
+    document = await db.get(models.TextDocument, document_id)
+    if not document or (document.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="文本不存在")
+    return document
+
+async def get_chapter(db: AsyncSession, chapter_id: int, current_user: models.User) -> models.TextChapter:
+    """
+    查询章节，不存在或无权访问时返回 404。
+    """
+    chapter = await db.get(models.TextChapter, chapter_id)
+    if not chapter:
+        raise HTTPException(status_code=404, detail="章节不存在")
+    await get_document(db, chapter.document_id, current_user)
+    return chapter
+
+async def list_chapters(db: AsyncSession, document_id: int) -> list:
+    result = await db.execute(
+        select(models.TextChapter)
+        .where(models.TextChapter.document_id == document_id)
+        .order_by(models.TextChapter.seq)
+    )
+    return result.scalars().all()
+
+async def resolve_text(db: AsyncSession, text: Optional[str], chapter_id: Optional[int], current_user: models.User) -> str:
+    """
+    合成接口的文本来源：指定 chapter_id 时读取文本库中的章节，否则使用请求中的文本。
+    """
+    if chapter_id is not None:
+        return (await get_chapter(db, chapter_id, current_user)).text
+    if not text:
+        raise HTTPException(status_code=400, detail="请输入文本或选择章节")
+    return text
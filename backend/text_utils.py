@@ -0,0 +1,218 @@
+import codecs
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+# 句末标点 (中文与 ASCII)，切分后标点保留在句尾
+SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？!?；;…\n])|(?<=\.)(?=\s|$)")
+
+# 句末标点之后的后引号与右括号，归入前一句 (如 "……。”然后" 中的 ”)
+CLOSING_PUNCTUATION = "”’」』）》〉】)]\""
+
+# 句内停顿标点，单句超长时在这些位置继续切分
+CLAUSE_END_PATTERN = re.compile(r"(?<=[，,、：:])")
+
+# 行内连续空白 (换行参与分句，单独保留)
+INLINE_SPACE_PATTERN = re.compile(r"[^\S\n]+")
+
+def normalize_text(text: str) -> str:
+    """
+    规范化文本，用于判断两次合成请求是否相同 (任务去重指纹与合成缓存键共用)：
+    统一 Unicode 形式与换行符，合并行内连续空白，去除每行首尾空白。
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.strip() for line in INLINE_SPACE_PATTERN.sub(" ", text).split("\n")).strip()
+
+def split_sentences(text: str) -> List[str]:
+    """
+    按中英文句末标点将文本切分为句子，去除空白句。紧跟句末标点的后引号与右括号保留在该句句尾。
+    """
+    sentences = []
+    previous = ""
+    for piece in SENTENCE_END_PATTERN.split(text):
+        closers = len(piece) - len(piece.lstrip(CLOSING_PUNCTUATION))
+        if closers and sentences and not previous[-1:].isspace():
+            sentences[-1] += piece[:closers]
+            piece = piece[closers:]
+        previous = piece
+        piece = piece.strip()
+        if piece:
+            sentences.append(piece)
+    return sentences
+
+def _needs_space(left: str, right: str) -> bool:
+    """
+    两段文本直接相连时是否需要补一个空格：两侧都是 ASCII 字符 (英文单词、标点) 时需要，中文之间不需要。
+    """
+    return bool(left) and bool(right) and left[-1].isascii() and right[0].isascii() \
+        and not left[-1].isspace() and not right[0].isspace()
+
+def join_sentences(sentences: List[str]) -> str:
+    """
+    将切分后的句子重新连接为文本：英文句子之间补回空格，中文句子直接相连。
+    """
+    text = ""
+    for sentence in sentences:
+        text += " " + sentence if _needs_space(text, sentence) else sentence
+    return text
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    """
+    将超过长度上限的单句先按逗号等停顿标点切分，仍超长的部分再按字数硬切。
+    """
+    pieces = []
+    for clause in CLAUSE_END_PATTERN.split(sentence):
+        while len(clause) > max_chars:
+            pieces.append(clause[:max_chars])
+            clause = clause[max_chars:]
+        if clause:
+            pieces.append(clause)
+    return _pack(pieces, max_chars)
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """
+    贪心地把相邻片段合并为不超过 max_chars 的分段。
+    """
+    segments = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > max_chars:
+            segments.append(current)
+            current = ""
+        current += piece
+    if current:
+        segments.append(current)
+    return segments
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """
+    将长文本切分为长度受限的合成分段。
+    优先在句末断开，尽量把相邻短句合并到同一分段，以减少 TTS 调用次数。
+    英文句子之间的空格保留在后一句句首，合并时随句子一起拼接，分段首尾的空白最后去除。
+    """
+    pieces = []
+    previous = ""
+    for sentence in split_sentences(text):
+        if _needs_space(previous, sentence):
+            sentence = " " + sentence
+        previous = sentence
+        if len(sentence) > max_chars:
+            pieces.extend(_split_long_sentence(sentence, max_chars))
+        else:
+            pieces.append(sentence)
+    return [segment.strip() for segment in _pack(pieces, max_chars) if segment.strip()]
+
+def natural_sort_key(name: str) -> list:
+    """
+    自然排序键，使 "第2章" 排在 "第10章" 之前。
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+# 章节标题："第十二章 标题"、"第12回"、"第三卷" 等，标题行不超过 CHAPTER_TITLE_MAX_CHARS 字
+CHAPTER_TITLE_PATTERN = re.compile(r"^第[0-9零〇一二两三四五六七八九十百千万]+[章回节卷]")
+CHAPTER_TITLE_MAX_CHARS = 40
+
+# 需要删除的零宽字符与字节序标记
+INVISIBLE_CHARS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"))
+
+# 全角字母数字转半角，各类空白统一为普通空格 (中文标点保持不变)
+FULLWIDTH_TABLE = {
+    **{code: code - 0xFEE0 for code in range(0xFF10, 0xFF1A)},
+    **{code: code - 0xFEE0 for code in range(0xFF21, 0xFF3B)},
+    **{code: code - 0xFEE0 for code in range(0xFF41, 0xFF5B)},
+    **dict.fromkeys(map(ord, "\u3000\u00a0\t\u2002\u2003\u2009"), " "),
+    **INVISIBLE_CHARS,
+}
+
+def detect_encoding(head: bytes) -> str:
+    """
+    根据文件开头的字节判断编码：先看 BOM，再看 UTF-16 的零字节特征，
+    能按 UTF-8 解码 (允许末尾截断的多字节字符) 则为 UTF-8，否则按 GB18030 (兼容 GBK) 处理。
+    """
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
+    sample = head[:1024]
+    if len(sample) >= 4:
+        if sample[1::2].count(0) > len(sample) // 4 and sample[0::2].count(0) == 0:
+            return "utf-16-le"
+        if sample[0::2].count(0) > len(sample) // 4 and sample[1::2].count(0) == 0:
+            return "utf-16-be"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gb18030"
+
+class IncrementalTextDecoder:
+    """
+    按块增量解码文本。编码由首块识别 (见 detect_encoding)，但文件开头可能全是 ASCII、中文部分却是 GBK，
+    因此识别为 UTF-8 的文件在后续块中遇到非法字节时，已解码的部分保留，其余字节改按 GB18030 解码。
+    其他编码 (或回退后) 仍解码失败时抛出 UnicodeDecodeError。
+    """
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+
+    def decode(self, data: bytes, final: bool = False) -> str:
+        # 上一块末尾未解码完的字节 (被截断的多字节字符)，回退时需要一并重新解码
+        buffered = self._decoder.getstate()[0]
+        try:
+            return self._decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            if self.encoding != "utf-8":
+                raise
+            data = buffered + data
+            self.encoding = "gb18030"
+            self._decoder = codecs.getincrementaldecoder(self.encoding)()
+            return data[:e.start].decode("utf-8") + self._decoder.decode(data[e.start:], final)
+
+def normalize_line(line: str) -> str:
+    """
+    规范化一行文本：全角字母数字转半角，删除零宽字符，折叠连续空白并去除首尾空白。
+    """
+    return " ".join(line.translate(FULLWIDTH_TABLE).split())
+
+def is_chapter_title(line: str) -> bool:
+    """
+    判断规范化后的一行是否为章节标题。以句末标点结尾的行视为正文 (如 "第三回合他赢了。")。
+    """
+    return (
+        len(line) <= CHAPTER_TITLE_MAX_CHARS
+        and CHAPTER_TITLE_PATTERN.match(line) is not None
+        and not line.endswith(("。", "！", "？", "…", "”", "!", "?"))
+    )
+
+class ChapterSplitter:
+    """
+    增量章节切分：逐行输入规范化后的文本，遇到 "第X章" 等标题行时产出上一章。
+    第一个标题之前的非空内容作为 "序" 单独成章。内存中只保留当前章节。
+    """
+    def __init__(self, default_title: str = "序"):
+        self.title = default_title
+        self.lines: List[str] = []
+
+    def feed(self, line: str) -> Optional[Tuple[str, str]]:
+        """
+        输入一行，若该行开始了新章节，返回已完成的上一章 (标题, 正文)。
+        """
+        if not is_chapter_title(line):
+            if line:
+                self.lines.append(line)
+            return None
+        finished = self._flush()
+        self.title = line
+        return finished
+
+    def finish(self) -> Optional[Tuple[str, str]]:
+        """
+        输入结束，返回最后一章。
+        """
+        return self._flush()
+
+    def _flush(self) -> Optional[Tuple[str, str]]:
+        lines, self.lines = self.lines, []
+        if not lines:
+            return None
+        return self.title, "\n".join(lines)
@@ -0,0 +1,147 @@
+import contextvars
+import json
+import logging
+import re
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+import metrics
+from config import TRACE_LOG_ENABLED, TRACE_LOG_FILE, TRACE_REQUEST_ID_HEADER
+
+# 关联 ID：HTTP 请求进入时设置，提交任务时随 Job 传递到工作线程，分段线程池中通过 copy_context 继承
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+job_id_var: contextvars.ContextVar = contextvars.ContextVar("job_id", default=None)
+
+# 客户端传入的关联 ID 只接受有限长度的常规字符，避免日志注入
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+logger = logging.getLogger("audiobook.trace")
+
+def _configure_logger() -> None:
+    """
+    结构化追踪日志：每行一个 JSON 对象，写到 TRACE_LOG_FILE (未配置时为标准错误输出)，不向上层 logger 传播。
+    """
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(TRACE_LOG_FILE, encoding="utf-8") if TRACE_LOG_FILE else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO if TRACE_LOG_ENABLED else logging.CRITICAL + 1)
+    logger.propagate = False
+
+_configure_logger()
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+@contextmanager
+def bind(request_id: Optional[str], job_id: Optional[str] = None):
+    """
+    在当前线程/协程中设置关联 ID (工作线程执行任务时使用)。
+    """
+    request_token = request_id_var.set(request_id)
+    job_token = job_id_var.set(job_id)
+    try:
+        yield
+    finally:
+        job_id_var.reset(job_token)
+        request_id_var.reset(request_token)
+
+def event(name: str, **fields) -> None:
+    """
+    输出一条结构化追踪日志，自动附带关联 ID 与任务 ID。
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = {"ts": round(time.time(), 3), "event": name, "request_id": request_id_var.get()}
+    job_id = job_id_var.get()
+    if job_id:
+        record["job_id"] = job_id
+    record.update(fields)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+def record_stage(name: str, seconds: float, **fields) -> None:
+    """
+    记录一个已知耗时的阶段：写入阶段耗时直方图并输出追踪日志。
+    """
+    metrics.STAGE_SECONDS.labels(stage=name).observe(seconds)
+    event("stage", stage=name, ms=round(seconds * 1000, 2), **fields)
+
+@contextmanager
+def stage(name: str, **fields):
+    """
+    计时一个阶段。产出的字典可在阶段内补充字段 (如实际使用的复制方式)，异常时记录 error 字段后继续抛出。
+    """
+    start = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        fields["error"] = e.__class__.__name__
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - start, **fields)
+
+class RequestTraceMiddleware:
+    """
+    ASGI 中间件：为每个 HTTP 请求分配关联 ID (沿用客户端传入的 TRACE_REQUEST_ID_HEADER)，
+    写入响应头，统计在途请求数与按路由模板划分的请求耗时，并输出一条请求追踪日志。
+    """
+    def __init__(self, app):
+        self.app = app
+        self.header = TRACE_REQUEST_ID_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == self.header:
+                candidate = value.decode("latin-1")
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or new_request_id()
+        status = None
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message, headers=list(message.get("headers", [])) + [(self.header, request_id.encode("latin-1"))])
+                _observe_request(scope, status, time.perf_counter() - start)
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+            if status is None:
+                # 未发出响应头就抛出异常，由外层的错误处理返回 500
+                status = 500
+                _observe_request(scope, status, time.perf_counter() - start)
+            event(
+                "request",
+                method=scope["method"],
+                path=scope["path"],
+                route=_route_template(scope),
+                status=status,
+                ms=round((time.perf_counter() - start) * 1000, 2),
+            )
+            request_id_var.reset(token)
+
+def _route_template(scope) -> str:
+    # 使用路由模板而不是实际路径作为标签，避免 /audio/{id} 等路径产生无限多的时间序列
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+def _observe_request(scope, status: int, elapsed: float) -> None:
+    metrics.HTTP_REQUEST_SECONDS.labels(method=scope["method"], route=_route_template(scope), status=status).observe(elapsed)
@@ -0,0 +1,204 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import models
+from database import SessionLocal
+from config import (
+    FFMPEG_BINARY,
+    TRANSCODE_ENABLED,
+    TRANSCODE_WORKERS,
+    TRANSCODE_LOSSY_FORMAT,
+    TRANSCODE_LOSSY_BITRATE,
+    TRANSCODE_KEEP_WAV,
+)
+from storage import resolve_output_path_to_abs_path
+from media_cache import media_cache
+from reaper import storage_usage
+
+# 各格式的文件扩展名与 MIME 类型
+AUDIO_FORMATS = {
+    "wav": (".wav", "audio/wav"),
+    "flac": (".flac", "audio/flac"),
+    "opus": (".opus", "audio/ogg; codecs=opus"),
+    "mp3": (".mp3", "audio/mpeg"),
+}
+
+# 各轻量格式对应的 ffmpeg 编码器
+LOSSY_CODECS = {
+    "opus": "libopus",
+    "mp3": "libmp3lame",
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def replace_extension(url_path: str, fmt: str) -> str:
+    """
+    将音频 URL 路径替换为指定格式的扩展名。
+    """
+    return os.path.splitext(url_path)[0] + AUDIO_FORMATS[fmt][0]
+
+def _run_ffmpeg(args: list) -> None:
+    subprocess.run(
+        [FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+def transcode_wav(wav_path: str, flac_path: str, lossy_path: str, lossy_format: str, bitrate: str) -> None:
+    """
+    在进程池中执行：将 WAV 转码为 FLAC 母版与轻量格式副本。
+    先写入临时文件再重命名，避免读者看到写了一半的文件。
+    """
+    flac_part = flac_path + ".part"
+    lossy_part = lossy_path + ".part"
+    try:
+        _run_ffmpeg(["-i", wav_path, "-c:a", "flac", "-f", "flac", flac_part])
+        _run_ffmpeg([
+            "-i", wav_path, "-c:a", LOSSY_CODECS[lossy_format], "-b:a", bitrate,
+            "-f", "ogg" if lossy_format == "opus" else lossy_format, lossy_part,
+        ])
+        os.replace(flac_part, flac_path)
+        os.replace(lossy_part, lossy_path)
+    finally:
+        for path in (flac_part, lossy_part):
+            if os.path.exists(path):
+                os.remove(path)
+
+def start() -> None:
+    """
+    创建转码进程池。未启用转码或找不到 ffmpeg 时不创建，保存的音频保持 WAV 格式。
+    """
+    global _executor
+    if not TRANSCODE_ENABLED or _executor is not None:
+        return
+    if shutil.which(FFMPEG_BINARY) is None:
+        print(f"Transcoder disabled: ffmpeg not found ({FFMPEG_BINARY})")
+        return
+    _executor = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS)
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def schedule_transcode(audio_id: int, audio_path: str) -> bool:
+    """
+    提交后台转码任务，转码完成后在回调中更新数据库记录。
+    进程池未启动时返回 False。
+    """
+    if _executor is None:
+        return False
+    flac_url = replace_extension(audio_path, "flac")
+    lossy_url = replace_extension(audio_path, TRANSCODE_LOSSY_FORMAT)
+    future = _executor.submit(
+        transcode_wav,
+        resolve_output_path_to_abs_path(audio_path),
+        resolve_output_path_to_abs_path(flac_url),
+        resolve_output_path_to_abs_path(lossy_url),
+        TRANSCODE_LOSSY_FORMAT,
+        TRANSCODE_LOSSY_BITRATE,
+    )
+    future.add_done_callback(lambda f: _on_transcode_done(f, audio_id, audio_path, flac_url, lossy_url))
+    return True
+
+def _on_transcode_done(future, audio_id: int, wav_url: str, flac_url: str, lossy_url: str) -> None:
+    """
+    转码完成回调 (在进程池的管理线程中执行)：记录结果，按配置删除原始 WAV，
+    并把新增副本与删除 WAV 带来的大小变化计入用户的存储占用。
+    """
+    db = SessionLocal()
+    try:
+        audio = db.query(models.Audio).filter(models.Audio.id == audio_id).first()
+        error = future.exception() if not future.cancelled() else None
+        if audio is None:
+            # 转码期间记录已被删除，清理生成的文件
+            if not future.cancelled() and error is None:
+                for url in (flac_url, lossy_url):
+                    _remove_quietly(resolve_output_path_to_abs_path(url))
+            return
+        if future.cancelled() or error is not None:
+            print(f"Transcode failed for audio {audio_id}: {error}")
+            audio.transcode_status = "failed"
+            db.commit()
+            return
+        audio.flac_path = flac_url
+        audio.lossy_path = lossy_url
+        audio.lossy_format = TRANSCODE_LOSSY_FORMAT
+        audio.transcode_status = "done"
+        if not TRANSCODE_KEEP_WAV:
+            audio.audio_path = flac_url
+        db.commit()
+        delta = sum(_size_quietly(resolve_output_path_to_abs_path(url)) for url in (flac_url, lossy_url))
+        if not TRANSCODE_KEEP_WAV:
+            wav_path = resolve_output_path_to_abs_path(wav_url)
+            wav_size = _size_quietly(wav_path)
+            if _remove_quietly(wav_path):
+                delta -= wav_size
+        storage_usage.add(audio.user_id, delta)
+    finally:
+        db.close()
+
+def _remove_quietly(path: str) -> bool:
+    try:
+        os.remove(path)
+        removed = True
+    except OSError:
+        removed = False
+    media_cache.invalidate(path)
+    return removed
+
+def _size_quietly(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def available_formats(audio: models.Audio) -> dict:
+    """
+    返回某条音频记录当前可用的格式及其 URL 路径。
+    """
+    formats = {}
+    ext = os.path.splitext(audio.audio_path)[1].lower()
+    for fmt, (fmt_ext, _) in AUDIO_FORMATS.items():
+        if ext == fmt_ext:
+            formats[fmt] = audio.audio_path
+    if audio.flac_path:
+        formats["flac"] = audio.flac_path
+    if audio.lossy_path and audio.lossy_format:
+        formats[audio.lossy_format] = audio.lossy_path
+    return formats
+
+def negotiate_format(available: dict, requested: Optional[str], accept: Optional[str]) -> Optional[str]:
+    """
+    选择返回的音频格式：显式指定的 format 参数优先，其次按 Accept 头的先后与 q 值，
+    都无法匹配时返回母版格式 (FLAC 优先，否则 WAV)。
+    """
+    if requested:
+        return requested if requested in available else None
+    if accept:
+        candidates = []
+        for order, part in enumerate(accept.split(",")):
+            fields = [f.strip() for f in part.split(";")]
+            mime = fields[0].lower()
+            quality = 1.0
+            for field in fields[1:]:
+                if field.startswith("q="):
+                    try:
+                        quality = float(field[2:])
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0:
+                candidates.append((-quality, order, mime))
+        for _, _, mime in sorted(candidates):
+            for fmt in available:
+                fmt_mime = AUDIO_FORMATS[fmt][1].split(";")[0]
+                if mime in (fmt_mime, f"audio/{fmt}") or (fmt == "opus" and mime == "audio/opus"):
+                    return fmt
+    for fmt in ("flac", "wav"):
+        if fmt in available:
+            return fmt
+    return next(iter(available), None)
@@ -0,0 +1,307 @@
+from gradio_client import Client
+from contextlib import contextmanager
+from typing import List, Optional
+import httpx
+import queue
+import threading
+import time
+import metrics
+import tracing
+from config import (
+    TTS_BACKENDS,
+    TTS_CLIENT_POOL_SIZE,
+    TTS_CLIENT_ACQUIRE_TIMEOUT,
+    TTS_CLIENT_IDLE_CHECK_SECONDS,
+    TTS_BALANCE_STRATEGY,
+    TTS_HEALTH_CHECK_INTERVAL,
+    TTS_CIRCUIT_FAILURE_THRESHOLD,
+    TTS_CIRCUIT_RESET_SECONDS,
+    TTS_BACKEND_ACQUIRE_TIMEOUT,
+)
+
+class NoBackendAvailable(Exception):
+    """
+    所有 TTS 服务均不可用 (宕机、熔断或等待超时) 时抛出。
+    """
+    pass
+
+def is_backend_fault(error: BaseException) -> bool:
+    """
+    判断一次调用失败是否说明服务本身有问题：连接失败、超时与 5xx 等传输层错误计入熔断并换服务重试；
+    服务端推理报错 (gradio_client 的 AppError) 等由请求内容决定的错误换服务也会同样失败，不计入熔断。
+    """
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return False
+
+class ClientPool:
+    """
+    Gradio Client 长连接池 (线程安全)。
+    Client 初始化时会拉取一次 API 配置，池化后每次合成不再重复该开销。
+    """
+    def __init__(self, url: str, size: int):
+        self.url = url
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        """
+        预先创建全部客户端。TTS 服务未就绪时仅打印日志，后续按需创建。
+        """
+        if not self.health_check():
+            print(f"TTS Service not ready: {self.url}")
+            return
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            try:
+                self._idle.put((self._create(), time.time()))
+            except Exception as e:
+                with self._lock:
+                    self._created -= 1
+                print(f"TTS Client init failed: {e}")
+                return
+
+    def health_check(self) -> bool:
+        """
+        探测 TTS 服务是否可用 (读取 Gradio 配置接口)。
+        """
+        try:
+            r = httpx.get(self.url.rstrip("/") + "/config", timeout=5)
+            return r.status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    @contextmanager
+    def client(self):
+        """
+        借出一个客户端。调用过程中出现服务故障 (见 is_backend_fault) 时视为连接损坏，直接丢弃不再归还；
+        服务端推理报错等由请求内容决定的错误不影响连接，客户端照常归还。
+        """
+        client = self._acquire()
+        try:
+            yield client
+        except Exception as e:
+            if is_backend_fault(e):
+                self._discard()
+            else:
+                self._idle.put((client, time.time()))
+            raise
+        else:
+            self._idle.put((client, time.time()))
+
+    def _acquire(self) -> Client:
+        while True:
+            try:
+                client, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        return self._create()
+                    except Exception:
+                        self._discard()
+                        raise
+                try:
+                    client, last_used = self._idle.get(timeout=TTS_CLIENT_ACQUIRE_TIMEOUT)
+                except queue.Empty:
+                    raise TimeoutError("等待 TTS 客户端超时")
+            # 长时间空闲的连接先做健康检查，服务重启后旧客户端的配置可能已失效
+            if time.time() - last_used > TTS_CLIENT_IDLE_CHECK_SECONDS and not self.health_check():
+                self._discard()
+                continue
+            return client
+
+    def _create(self) -> Client:
+        # 新建客户端需要拉取服务端 API 配置，是连接池未命中时的主要开销
+        with tracing.stage("gradio_connect", backend=self.url):
+            return Client(self.url, verbose=False)
+
+    def _discard(self) -> None:
+        with self._lock:
+            self._created -= 1
+
+class Backend:
+    """
+    单个 IndexTTS2 服务：连接池、路由权重、并发上限、健康状态与熔断状态。
+    """
+    def __init__(self, url: str, weight: int = 1, max_concurrency: int = TTS_CLIENT_POOL_SIZE):
+        self.url = url
+        self.weight = max(weight, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.pool = ClientPool(url, self.max_concurrency)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+        self.current_weight = 0  # 平滑加权轮询的当前权重
+
+    def circuit_state(self, now: float) -> str:
+        """
+        熔断状态: "closed" 正常，"open" 熔断中，"half_open" 熔断到期、允许一个试探请求。
+        """
+        if self.consecutive_failures < TTS_CIRCUIT_FAILURE_THRESHOLD:
+            return "closed"
+        return "open" if now < self.circuit_open_until else "half_open"
+
+    def accepts(self, now: float) -> bool:
+        """
+        当前是否可以接收新请求。
+        """
+        if not self.healthy or self.outstanding >= self.max_concurrency:
+            return False
+        state = self.circuit_state(now)
+        if state == "open":
+            return False
+        if state == "half_open":
+            return self.outstanding == 0
+        return True
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy,
+            "circuit": self.circuit_state(now),
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+        }
+
+class BackendBalancer:
+    """
+    多 TTS 服务负载均衡器。
+    - 路由策略：按权重折算的最少在途请求，或平滑加权轮询；
+    - 每个服务有独立的并发上限，全部繁忙时阻塞等待；
+    - 连续的服务故障 (连接、超时、5xx) 达到阈值后熔断，到期后放行一个试探请求，成功即恢复；
+    - 后台线程定期做健康检查。
+    """
+    def __init__(self, backends: List[Backend], strategy: str = "least_outstanding"):
+        self.backends = backends
+        self.strategy = strategy
+        self._cond = threading.Condition()
+        self._health_thread = None
+
+    @property
+    def total_capacity(self) -> int:
+        return sum(b.max_concurrency for b in self.backends)
+
+    def acquire(self, exclude=(), timeout: float = TTS_BACKEND_ACQUIRE_TIMEOUT) -> Backend:
+        """
+        选择一个可用服务并占用一个并发名额。
+        exclude 中的服务 (如本次请求已失败过的) 仅在没有其他可用服务时才会被选中。
+        """
+        deadline = time.time() + timeout
+        with tracing.stage("backend_wait") as fields, self._cond:
+            while True:
+                now = time.time()
+                candidates = [b for b in self.backends if b.accepts(now)]
+                preferred = [b for b in candidates if b not in exclude] or candidates
+                if preferred:
+                    backend = self._choose(preferred)
+                    backend.outstanding += 1
+                    backend.total_requests += 1
+                    fields["backend"] = backend.url
+                    return backend
+                if not any(b.healthy and b.circuit_state(now) != "open" for b in self.backends):
+                    raise NoBackendAvailable("没有可用的 TTS 服务")
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise NoBackendAvailable("等待 TTS 服务超时")
+                self._cond.wait(min(remaining, 1.0))
+
+    def release(self, backend: Backend, error: Optional[Exception] = None) -> None:
+        """
+        归还并发名额并记录本次调用结果，用于熔断判断。
+        只有服务故障 (见 is_backend_fault) 累计连续失败次数；其他错误说明服务仍能正常响应，与成功一样重置计数。
+        """
+        with self._cond:
+            backend.outstanding -= 1
+            if error is not None:
+                backend.total_failures += 1
+                backend.last_error = f"{error.__class__.__name__}: {error}"
+            if error is None or not is_backend_fault(error):
+                backend.consecutive_failures = 0
+            else:
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= TTS_CIRCUIT_FAILURE_THRESHOLD:
+                    backend.circuit_open_until = time.time() + TTS_CIRCUIT_RESET_SECONDS
+            self._cond.notify_all()
+
+    def _choose(self, candidates: List[Backend]) -> Backend:
+        if self.strategy == "weighted":
+            # 平滑加权轮询 (与 nginx 相同的算法)，在候选服务之间按权重均匀分布请求
+            total = sum(b.weight for b in candidates)
+            for b in candidates:
+                b.current_weight += b.weight
+            chosen = max(candidates, key=lambda b: b.current_weight)
+            chosen.current_weight -= total
+            return chosen
+        return min(candidates, key=lambda b: (b.outstanding / b.weight, -b.weight))
+
+    def warm_up(self) -> None:
+        for backend in self.backends:
+            threading.Thread(target=backend.pool.warm_up, name="tts-warm-up", daemon=True).start()
+
+    def start_health_checks(self, interval: float = TTS_HEALTH_CHECK_INTERVAL) -> None:
+        """
+        启动后台健康检查线程，重复调用无副作用。
+        """
+        if self._health_thread is not None:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, args=(interval,), name="tts-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self, interval: float) -> None:
+        while True:
+            for backend in self.backends:
+                healthy = backend.pool.health_check()
+                with self._cond:
+                    if healthy and not backend.healthy:
+                        # 服务恢复：让熔断立即进入半开状态，尽快放行试探请求
+                        backend.circuit_open_until = min(backend.circuit_open_until, time.time())
+                    backend.healthy = healthy
+                    self._cond.notify_all()
+            time.sleep(interval)
+
+    def status(self) -> list:
+        now = time.time()
+        with self._cond:
+            return [b.to_dict(now) for b in self.backends]
+
+    def outstanding_by_backend(self) -> dict:
+        """
+        各服务的在途请求数 (供监控指标采集)。
+        """
+        with self._cond:
+            return {(b.url,): b.outstanding for b in self.backends}
+
+    def availability_by_backend(self) -> dict:
+        """
+        各服务当前是否可接收请求：健康且未处于熔断中为 1，否则为 0。
+        """
+        now = time.time()
+        with self._cond:
+            return {(b.url,): int(b.healthy and b.circuit_state(now) != "open") for b in self.backends}
+
+balancer = BackendBalancer(
+    [Backend(b["url"], b.get("weight", 1), b.get("max_concurrency", TTS_CLIENT_POOL_SIZE)) for b in TTS_BACKENDS],
+    strategy=TTS_BALANCE_STRATEGY,
+)
+
+metrics.gauge("audiobook_tts_backend_in_flight", "各 TTS 服务的在途请求数", ["backend"], collect=balancer.outstanding_by_backend)
+metrics.gauge("audiobook_tts_backend_up", "TTS 服务是否可用 (健康且未熔断)", ["backend"], collect=balancer.availability_by_backend)
@@ -1,8 +1,32 @@
 from gradio_client import Client, handle_file
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from collections import deque
+import hashlib
+import httpx
 import os
-import shutil
+import threading
+import time
 import uuid
-from config import VOICE_DIR, TEMP_DIR
+import metrics
+import postprocess
+import scheduler
+import tracing
+from config import (
+    VOICE_DIR,
+    TEMP_DIR,
+    TTS_MAX_ATTEMPTS,
+    TTS_SEGMENT_MAX_CHARS,
+    TTS_SEGMENT_CONCURRENCY,
+    TTS_SEGMENT_GAP_MS,
+)
+from jobs import JobCancelled
+from tts_backends import balancer, Backend, NoBackendAvailable, is_backend_fault
+from synthesis_cache import synthesis_cache, make_cache_key
+from storage import link_or_copy, move_file, sharded_path, output_url
+from text_utils import split_text
+from emotion import EMO_AUTO, group_runs
+from wav_utils import WavConcatWriter, streaming_wav_header, silence_bytes, iter_pcm_chunks, wav_duration
 
 # 定义参考音频映射
 EMO_MAP = {
@@ -12,73 +36,492 @@ EMO_MAP = {
     3: os.path.join(VOICE_DIR, "惧.wav")
 }
 
-TTS_URL = "http://localhost:7860/"
+# /gen_single 的固定推理参数 (参考音频与文本之外的部分)
+TTS_PARAMS = {
+    "emo_control_method": "与音色参考音频相同",
+    "emo_weight": 0.65,
+    "vec1": 0,
+    "vec2": 0,
+    "vec3": 0,
+    "vec4": 0,
+    "vec5": 0,
+    "vec6": 0,
+    "vec7": 0,
+    "vec8": 0,
+    "emo_text": "",
+    "emo_random": False,
+    "max_text_tokens_per_segment": 120,
+    "param_16": True,
+    "param_17": 0.8,
+    "param_18": 30,
+    "param_19": 0.8,
+    "param_20": 0,
+    "param_21": 3,
+    "param_22": 10,
+    "param_23": 1500,
+}
 
-def synthesize_audio(text: str, emo_type: int) -> str:
+class ReferenceAudioCache:
     """
-    使用本地 IndexTTS2 合成音频。
-    返回生成的音频文件 URL 路径（以 /output/... 开头），用于前端直接访问。
+    参考音频上传句柄缓存。
+    以 (服务地址, 文件内容哈希, mtime) 为键记录服务端返回的文件路径，
+    同一参考音频只上传一次，之后的合成请求直接引用服务端文件。
+    """
+    def __init__(self):
+        self._handles = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, client: Client, path: str) -> dict:
+        """
+        返回可直接传给 predict 的文件参数；上传失败时回退为 handle_file (每次上传)。
+        """
+        key = (url, self.file_digest(path), os.stat(path).st_mtime_ns)
+        with self._lock:
+            handle = self._handles.get(key)
+        if handle is not None:
+            return dict(handle)
+        try:
+            with tracing.stage("reference_upload", backend=url, bytes=os.path.getsize(path)):
+                handle = self._upload(client, path)
+        except Exception as e:
+            tracing.event("reference_upload_failed", backend=url, cause=error_cause(e), error=str(e))
+            return handle_file(path)
+        with self._lock:
+            self._handles[key] = handle
+        return dict(handle)
+
+    def invalidate(self, url: str) -> None:
+        """
+        清除某个服务端的全部句柄 (服务重启后服务端临时文件会被清理)。
+        """
+        with self._lock:
+            for key in [k for k in self._handles if k[0] == url]:
+                del self._handles[key]
+
+    def file_digest(self, path: str) -> str:
+        """
+        计算文件内容的 SHA-256，按 (路径, 大小, mtime) 记忆化，避免重复读取文件。
+        """
+        stat = os.stat(path)
+        stamp = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(stamp)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[stamp] = digest
+        return digest
+
+    def _upload(self, client: Client, path: str) -> dict:
+        with open(path, "rb") as f:
+            r = httpx.post(
+                client.upload_url,
+                headers=client.headers,
+                files=[("files", (os.path.basename(path), f))],
+                timeout=60,
+            )
+        r.raise_for_status()
+        # 不携带 gradio.FileData 元信息，gradio_client 便不会在 predict 时再次上传
+        return {"path": r.json()[0], "orig_name": os.path.basename(path)}
+
+reference_cache = ReferenceAudioCache()
+
+# 分段合成线程池：只执行已获得调度器名额的分段，容量等于名额数；由负载均衡器决定每个分段发往哪个服务
+segment_executor = ThreadPoolExecutor(
+    max_workers=scheduler.tts_scheduler.slots,
+    thread_name_prefix="tts-segment",
+)
+
+def init_client_pool() -> None:
+    """
+    应用启动时在后台预热各服务的客户端连接池并启动健康检查，不阻塞服务启动。
+    """
+    balancer.warm_up()
+    balancer.start_health_checks()
+
+def _tts_params(prompt_path: str, emo_ref_path: str) -> dict:
+    """
+    音色与情感参考为同一音频时沿用固定参数；不同时改为使用独立的情感参考音频。
+    """
+    if prompt_path == emo_ref_path:
+        return TTS_PARAMS
+    return dict(TTS_PARAMS, emo_control_method="使用情感参考音频")
+
+def _predict(backend: Backend, prompt_path: str, emo_ref_path: str, text: str):
+    """
+    借出指定服务的客户端并调用 /gen_single。
+    失败时清除该服务端的参考音频句柄 (服务重启后服务端缓存可能已被清理)。
     """
     try:
-        # 解析参考音频路径
-        ref_audio_path = EMO_MAP.get(emo_type, os.path.join(VOICE_DIR, "喜.wav"))
-        
-        if not os.path.exists(ref_audio_path):
-             print(f"Reference audio not found: {ref_audio_path}")
-             return None
-
-        client = Client(TTS_URL)
-        
-        # 根据检查和用户要求调用 API
-        # 使用 handle_file 上传文件，这是 Gradio Client 的要求
-        result_path = client.predict(
-            emo_control_method="与音色参考音频相同",
-            prompt=handle_file(ref_audio_path),
-            text=text,
-            emo_ref_path=handle_file(ref_audio_path),
-			emo_weight=0.65,
-			vec1=0,
-			vec2=0,
-			vec3=0,
-			vec4=0,
-			vec5=0,
-			vec6=0,
-			vec7=0,
-			vec8=0,
-			emo_text="",
-			emo_random=False,
-			max_text_tokens_per_segment=120,
-			param_16=True,
-			param_17=0.8,
-			param_18=30,
-			param_19=0.8,
-			param_20=0,
-			param_21=3,
-			param_22=10,
-			param_23=1500,
-			api_name="/gen_single"
+        with backend.pool.client() as client:
+            prompt_handle = reference_cache.get(backend.url, client, prompt_path)
+            emo_handle = prompt_handle if emo_ref_path == prompt_path else reference_cache.get(backend.url, client, emo_ref_path)
+            with tracing.stage("predict", backend=backend.url, chars=len(text)):
+                return client.predict(
+                    prompt=prompt_handle,
+                    text=text,
+                    emo_ref_path=emo_handle,
+                    api_name="/gen_single",
+                    **_tts_params(prompt_path, emo_ref_path)
+                )
+    except Exception:
+        reference_cache.invalidate(backend.url)
+        raise
+
+def error_cause(error: BaseException) -> str:
+    """
+    把异常归类为有限的几种原因，用作错误计数指标的标签。
+    """
+    if isinstance(error, NoBackendAvailable):
+        return "no_backend"
+    if isinstance(error, (TimeoutError, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(error, (ConnectionError, httpx.ConnectError, httpx.RemoteProtocolError)):
+        return "connection"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code // 100}xx"
+    if isinstance(error, FileNotFoundError):
+        return "reference_missing"
+    if error.__class__.__name__ == "AppError":
+        # gradio_client 对服务端推理异常抛出的错误
+        return "backend_error"
+    if isinstance(error, RuntimeError) and str(error) == "Invalid result path":
+        return "invalid_result"
+    return "other"
+
+# 合成失败原因 (error_cause 的取值) 对应的提示信息
+SYNTHESIS_ERROR_MESSAGES = {
+    "no_backend": "TTS 服务暂不可用",
+    "timeout": "TTS 服务响应超时",
+    "connection": "无法连接 TTS 服务",
+    "http_4xx": "TTS 服务拒绝了请求",
+    "http_5xx": "TTS 服务内部错误",
+    "reference_missing": "参考音频不存在",
+    "backend_error": "TTS 服务推理失败",
+    "invalid_result": "TTS 服务返回的结果无效",
+    "empty_text": "文本为空",
+    "format_mismatch": "分段音频格式不一致",
+}
+
+class SynthesisError(Exception):
+    """
+    合成失败。cause 为 error_cause 归类的原因 (与失败计数指标的标签一致)，消息为面向用户的说明，
+    任务失败时作为 job.error 返回给前端。
+    """
+    def __init__(self, cause: str):
+        self.cause = cause
+        super().__init__(f"语音合成失败：{SYNTHESIS_ERROR_MESSAGES.get(cause, '语音合成服务异常')} ({cause})")
+
+def _predict_with_failover(prompt_path: str, emo_ref_path: str, text: str):
+    """
+    经负载均衡器选择服务并调用，服务故障 (连接、超时、5xx) 后优先换其他服务重试，最多 TTS_MAX_ATTEMPTS 次。
+    服务端推理报错等由分段内容决定的错误直接抛出，不重试，避免一个有问题的分段触发熔断、影响其他用户。
+    """
+    failed = []
+    for attempt in range(TTS_MAX_ATTEMPTS):
+        try:
+            backend = balancer.acquire(exclude=failed)
+        except NoBackendAvailable as e:
+            metrics.TTS_BACKEND_ERRORS.labels(backend="", cause=error_cause(e)).inc()
+            raise
+        try:
+            result = _predict(backend, prompt_path, emo_ref_path, text)
+        except Exception as e:
+            metrics.TTS_BACKEND_ERRORS.labels(backend=backend.url, cause=error_cause(e)).inc()
+            balancer.release(backend, e)
+            if attempt == TTS_MAX_ATTEMPTS - 1 or not is_backend_fault(e):
+                raise
+            tracing.event("backend_retry", backend=backend.url, attempt=attempt + 1, cause=error_cause(e), error=str(e))
+            failed.append(backend)
+        else:
+            balancer.release(backend)
+            return result
+
+def _cache_key(prompt_path: str, emo_ref_path: str, emo_type: int, text: str, **extra_params) -> str:
+    """
+    计算合成缓存键，extra_params 用于纳入影响输出的额外参数 (如分段拼接参数)。
+    音色与情感参考不同时两者的内容哈希都计入键中。
+    """
+    params = dict(_tts_params(prompt_path, emo_ref_path), **extra_params)
+    ref_digest = reference_cache.file_digest(emo_ref_path)
+    if prompt_path != emo_ref_path:
+        ref_digest = f"{reference_cache.file_digest(prompt_path)}:{ref_digest}"
+    return make_cache_key(text, emo_type, params, ref_digest)
+
+def _link_cached(cached_path: str, output_path: str) -> None:
+    """
+    将缓存文件链接到临时输出路径，并把修改时间刷新为当前时间。
+    硬链接与缓存文件共享 inode (含 mtime)，不刷新的话清理任务会按缓存的创建时间
+    把刚生成的临时文件当作过期文件删除。
+    """
+    link_or_copy(cached_path, output_path)
+    os.utime(output_path)
+
+def _submit_segment(requester: scheduler.Requester, prompt_path: str, emo_ref_path: str, text: str, emo_type: int) -> Future:
+    """
+    提交单个分段的合成，返回结果文件本地路径的 Future。
+    启用缓存时先按分段内容查找，命中时直接返回已完成的 Future；
+    未命中的分段经调度器排队 (优先级与用户公平排队)，获得 TTS 名额后才占用分段线程池调用 TTS，并把结果存入缓存。
+    """
+    cache_key = None
+    if synthesis_cache is not None:
+        cache_key = _cache_key(prompt_path, emo_ref_path, emo_type, text)
+        cached_path = synthesis_cache.lookup(cache_key)
+        if cached_path:
+            future = Future()
+            future.set_result(cached_path)
+            return future
+    return scheduler.tts_scheduler.submit(
+        segment_executor, requester, len(text), _synthesize_segment, prompt_path, emo_ref_path, text, cache_key
+    )
+
+def _synthesize_segment(prompt_path: str, emo_ref_path: str, text: str, cache_key: Optional[str]) -> str:
+    result_path = _predict_with_failover(prompt_path, emo_ref_path, text)
+
+    # 兼容处理：如果返回的是字典（部分 gradio_client 版本），则依次从 name/path/value 提取文件路径
+    if isinstance(result_path, dict):
+        result_path = result_path.get('name') or result_path.get('path') or result_path.get('value')
+
+    if not result_path:
+        raise RuntimeError("Invalid result path")
+    if cache_key is not None:
+        return synthesis_cache.store(cache_key, result_path, move=True)
+    return result_path
+
+def _generate_segment(prompt_path: str, emo_ref_path: str, text: str, emo_type: int) -> str:
+    """
+    以当前发起方的身份合成单个分段并等待完成，返回结果文件的本地路径。
+    """
+    return _submit_segment(scheduler.current_requester(), prompt_path, emo_ref_path, text, emo_type).result()
+
+def _reference_audio_path(emo_type: int) -> str:
+    """
+    解析情感对应的参考音频路径，未知情感回退到 "喜"。
+    """
+    return EMO_MAP.get(emo_type, os.path.join(VOICE_DIR, "喜.wav"))
+
+def _plan_segments(text: str, emo_type: int, voice_path: Optional[str] = None, emo_voice_path: Optional[str] = None) -> List[Tuple[str, str, int, str]]:
+    """
+    生成合成计划：按顺序排列的 (音色参考路径, 情感参考路径, 情感, 分段文本)。
+    自动情感模式 (EMO_AUTO) 下先逐句识别情感，把情感相同的连续句子合并后再按长度分段，
+    TTS 调用次数由情感切换次数决定，而不是句子数。参考音频缺失时抛出 FileNotFoundError。
+    voice_path 为音色库中的音色 (未指定时音色与情感参考相同)；emo_voice_path 为音色库中的情感参考，
+    指定后所有分段使用该情感参考，emo_type 仅作为标签。
+    """
+    if emo_voice_path:
+        runs = [(emo_type, text)]
+    else:
+        runs = group_runs(text) if emo_type == EMO_AUTO else [(emo_type, text)]
+    plan = []
+    for run_emo_type, run_text in runs:
+        emo_ref_path = emo_voice_path or _reference_audio_path(run_emo_type)
+        prompt_path = voice_path or emo_ref_path
+        for path in {prompt_path, emo_ref_path}:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Reference audio not found: {path}")
+        plan.extend(
+            (prompt_path, emo_ref_path, run_emo_type, segment)
+            for segment in split_text(run_text, TTS_SEGMENT_MAX_CHARS)
         )
+    return plan
+
+def _iter_segment_results(plan: list, requester: Optional[scheduler.Requester] = None):
+    """
+    并行合成计划中的各分段，并按原顺序逐个产出结果文件路径。
+    最多 TTS_SEGMENT_CONCURRENCY 个分段同时在途；生成器提前关闭时取消尚未开始的分段。
+    requester 为分段调度时的发起方，未指定时沿用当前上下文 (任务工作线程中绑定的发起方)。
+    """
+    requester = requester or scheduler.current_requester()
+    pending = deque()
+    next_index = 0
+    try:
+        while next_index < len(plan) or pending:
+            while next_index < len(plan) and len(pending) < TTS_SEGMENT_CONCURRENCY:
+                prompt_path, emo_ref_path, emo_type, segment = plan[next_index]
+                pending.append(_submit_segment(requester, prompt_path, emo_ref_path, segment, emo_type))
+                next_index += 1
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _synthesize_segments(plan: list, output_path: str, job=None, postprocessing: Optional[postprocess.PostProcessOptions] = None) -> None:
+    """
+    长文本分段并行合成。
+    已完成的分段按原顺序流式拼接到输出文件，
+    因此内存与临时磁盘占用只与并发数相关，而与章节长度无关。
+    指定 postprocessing 时等全部分段完成后交给后处理进程池统一裁剪、归一化并拼接。
+    """
+    if postprocessing is not None:
+        segment_paths = []
+        for done, segment_path in enumerate(_iter_segment_results(plan), start=1):
+            segment_paths.append(segment_path)
+            if job is not None:
+                job.progress = done / len(plan)
+                job.check_cancelled()
+        _postprocess(segment_paths, output_path, postprocessing)
+        return
+
+    writer = WavConcatWriter(output_path, gap_ms=TTS_SEGMENT_GAP_MS)
+    results = _iter_segment_results(plan)
+    try:
+        for done, segment_path in enumerate(results, start=1):
+            with tracing.stage("concat"):
+                writer.append(segment_path)
+            if job is not None:
+                job.progress = done / len(plan)
+                job.check_cancelled()
+        writer.close()
+    except BaseException:
+        results.close()
+        writer.abort()
+        raise
+
+def stream_audio(text: str, emo_type: int, voice_path: Optional[str] = None, emo_voice_path: Optional[str] = None,
+                 requester: Optional[scheduler.Requester] = None):
+    """
+    边合成边输出 WAV 字节流。
+    先产出长度未知的 WAV 文件头，之后每完成一个分段就产出其 PCM 数据，
+    客户端在首个分段合成完成后即可开始播放。分段格式不一致或合成失败时抛出 SynthesisError。
+    生成器在不同线程中被逐步迭代，因此发起方 requester 需显式传入。
+    """
+    try:
+        plan = _plan_segments(text, emo_type, voice_path, emo_voice_path)
+    except FileNotFoundError as e:
+        _record_failure("stream", "reference_missing", e)
+        raise SynthesisError("reference_missing") from e
+    if not plan:
+        _record_failure("stream", "empty_text", "Empty text")
+        raise SynthesisError("empty_text")
+
+    start = time.perf_counter()
+    stream_params = None
+    pcm_bytes = 0
+    results = _iter_segment_results(plan, requester)
+    try:
+        for segment_path in results:
+            chunks = iter_pcm_chunks(segment_path)
+            params = next(chunks)
+            if stream_params is None:
+                stream_params = params
+                yield streaming_wav_header(*params)
+            elif params != stream_params:
+                raise SynthesisError("format_mismatch")
+            elif TTS_SEGMENT_GAP_MS > 0:
+                gap = silence_bytes(params, TTS_SEGMENT_GAP_MS)
+                pcm_bytes += len(gap)
+                yield gap
+            for chunk in chunks:
+                pcm_bytes += len(chunk)
+                yield chunk
+    except Exception as e:
+        cause = e.cause if isinstance(e, SynthesisError) else error_cause(e)
+        _record_failure("stream", cause, e)
+        raise SynthesisError(cause) from e
+    finally:
+        results.close()
+    channels, sampwidth, framerate = stream_params
+    _record_synthesis("stream", pcm_bytes / (channels * sampwidth * framerate), time.perf_counter() - start, len(text), len(plan))
+
+def _postprocess(segment_paths: List[str], output_path: str, postprocessing: postprocess.PostProcessOptions) -> None:
+    with tracing.stage("postprocess", normalize=postprocessing.normalize, join=postprocessing.join) as fields:
+        fields.update(postprocess.process(segment_paths, output_path, postprocessing))
+
+def _record_synthesis(mode: str, audio_seconds: float, wall_seconds: float, chars: int, segments: int) -> None:
+    """
+    记录一次成功的合成：实时率 (RTF，合成耗时 / 音频时长，与书籍进度中的定义一致) 与累计时长指标，并输出追踪日志。
+    追踪日志另记 speed_ratio (音频时长 / 合成耗时，即 RTF 的倒数)。
+    """
+    rtf = wall_seconds / audio_seconds if audio_seconds > 0 else None
+    if rtf is not None:
+        metrics.SYNTHESIS_REALTIME_FACTOR.labels(mode=mode).observe(rtf)
+    metrics.SYNTHESIS_AUDIO_SECONDS.labels(mode=mode).inc(audio_seconds)
+    metrics.SYNTHESIS_WALL_SECONDS.labels(mode=mode).inc(wall_seconds)
+    tracing.event(
+        "synthesis",
+        mode=mode,
+        chars=chars,
+        segments=segments,
+        audio_seconds=round(audio_seconds, 3),
+        wall_seconds=round(wall_seconds, 3),
+        realtime_factor=round(rtf, 3) if rtf is not None else None,
+        speed_ratio=round(audio_seconds / wall_seconds, 3) if wall_seconds > 0 else None,
+    )
+
+def _record_failure(mode: str, cause: str, error) -> None:
+    metrics.SYNTHESIS_FAILURES.labels(mode=mode, cause=cause).inc()
+    tracing.event("synthesis_failed", mode=mode, cause=cause, error=str(error))
+
+def synthesize_audio(text: str, emo_type: int, job=None, voice_path: Optional[str] = None, emo_voice_path: Optional[str] = None,
+                     postprocessing: Optional[postprocess.PostProcessOptions] = None) -> str:
+    """
+    使用本地 IndexTTS2 合成音频。
+    文本超过 TTS_SEGMENT_MAX_CHARS 时按句切分，分段并行合成后按顺序拼接。
+    emo_type 为 EMO_AUTO (-1) 时逐句识别情感，各情感段使用对应参考音频，输出仍为单个文件。
+    voice_path / emo_voice_path 为音色库中的音色与情感参考音频 (可选)，见 _plan_segments。
+    postprocessing 为可选的后处理参数 (响度归一化、静音裁剪、分段拼接方式)，见 postprocess 模块。
+    job 为可选的任务对象，用于上报进度并在分段之间响应取消。
+    返回生成的音频文件 URL 路径（以 /output/... 开头），用于前端直接访问；合成失败时抛出 SynthesisError。
+    """
+    start = time.perf_counter()
+    try:
+        # 解析参考音频并生成分段计划 (自动情感模式下按句识别情感)
+        plan = _plan_segments(text, emo_type, voice_path, emo_voice_path)
+        if not plan:
+            raise SynthesisError("empty_text")
+
+        # 按分片布局存放，避免临时目录平铺大量文件
+        output_path = sharded_path(TEMP_DIR, f"{uuid.uuid4()}.wav")
+
+        cached_path = None
+        if len(plan) == 1:
+            # 单分段：缓存文件以链接方式共享，TTS 临时结果直接移动到输出目录
+            prompt_path, emo_ref_path, segment_emo_type, segment = plan[0]
+            segment_path = _generate_segment(prompt_path, emo_ref_path, segment, segment_emo_type)
+            if postprocessing is not None:
+                _postprocess([segment_path], output_path, postprocessing)
+            elif synthesis_cache is not None:
+                _link_cached(segment_path, output_path)
+            else:
+                move_file(segment_path, output_path)
+        else:
+            # 多分段：整段文本的缓存键还需包含分段与拼接参数
+            cache_key = None
+            if synthesis_cache is not None:
+                extra_params = {}
+                if emo_type == EMO_AUTO:
+                    # 自动情感：识别结果与各情感的参考音频都会影响输出
+                    extra_params["segment_emotions"] = [item[2] for item in plan]
+                    extra_params["reference_digests"] = sorted({reference_cache.file_digest(item[1]) for item in plan})
+                if postprocessing is not None:
+                    extra_params["postprocess"] = postprocessing.cache_params()
+                cache_key = _cache_key(
+                    plan[0][0], plan[0][1], emo_type, text,
+                    segment_max_chars=TTS_SEGMENT_MAX_CHARS,
+                    segment_gap_ms=TTS_SEGMENT_GAP_MS,
+                    **extra_params,
+                )
+                cached_path = synthesis_cache.lookup(cache_key)
+            if cached_path:
+                _link_cached(cached_path, output_path)
+            else:
+                _synthesize_segments(plan, output_path, job, postprocessing)
+                if cache_key is not None:
+                    synthesis_cache.store(cache_key, output_path)
 
-        # 兼容处理：如果返回的是字典（部分 gradio_client 版本），则依次从 name/path/value 提取文件路径
-        if isinstance(result_path, dict):
-            result_path = result_path.get('name') or result_path.get('path') or result_path.get('value')
-
-        if not result_path:
-             print("TTS Service Error: Invalid result path")
-             return None
-        
-        # 结果是一个临时文件路径。将其复制到输出目录。
-        if not os.path.exists(TEMP_DIR):
-            os.makedirs(TEMP_DIR)
-            
-        filename = f"{uuid.uuid4()}.wav"
-        output_path = os.path.join(TEMP_DIR, filename)
-        
-        shutil.copy(result_path, output_path)
-        
+        # 整段命中缓存时单独统计，不计入 TTS 实际合成的实时率
+        _record_synthesis("cached" if cached_path else "file", wav_duration(output_path), time.perf_counter() - start, len(text), len(plan))
         # 返回统一的可访问 URL 路径，前端可直接作为 <audio src> 使用
-        return f"/output/temp/{filename}"
+        return output_url(output_path)
 
+    except JobCancelled:
+        raise
     except Exception as e:
-        print(f"TTS Service Error: {e}")
-        return None
+        cause = e.cause if isinstance(e, SynthesisError) else error_cause(e)
+        _record_failure("file", cause, e)
+        raise SynthesisError(cause) from e
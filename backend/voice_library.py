@@ -0,0 +1,281 @@
+import hashlib
+import io
+import math
+import os
+import shutil
+import subprocess
+import wave
+from array import array
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+from config import (
+    VOICE_DIR,
+    VOICE_LIBRARY_DIR,
+    VOICE_UPLOAD_MAX_BYTES,
+    VOICE_MAX_PER_USER,
+    VOICE_SAMPLE_RATE,
+    VOICE_MIN_SECONDS,
+    VOICE_MAX_SECONDS,
+    VOICE_TARGET_DBFS,
+    VOICE_PEAK_DBFS,
+    VOICE_SILENCE_DBFS,
+    FFMPEG_BINARY,
+)
+
+# 只解码上传音频的前若干秒 (足够覆盖开头的静音与最长保留时长)，处理耗时与上传文件大小无关
+DECODE_MAX_SECONDS = 60
+
+# 静音检测的帧长、首尾保留的余量、截断点的搜索范围与淡入淡出时长 (秒)
+FRAME_SECONDS = 0.02
+EDGE_PAD_SECONDS = 0.1
+CUT_SEARCH_SECONDS = 2.0
+FADE_SECONDS = 0.01
+
+class ProcessedVoice:
+    """
+    处理后的参考音频：单声道 16 位 WAV 数据及其信息。
+    """
+    def __init__(self, wav_bytes: bytes, duration: float, sample_rate: int):
+        self.wav_bytes = wav_bytes
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.content_hash = hashlib.sha256(wav_bytes).hexdigest()
+
+def _decode_wav(content: bytes) -> Optional[Tuple[List[float], int]]:
+    """
+    用标准库解码 PCM WAV，返回 (单声道采样 [-1, 1], 采样率)。非 PCM WAV 返回 None。
+    """
+    try:
+        with wave.open(io.BytesIO(content), "rb") as wav:
+            channels, sampwidth, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            if wav.getcomptype() != "NONE" or sampwidth not in (1, 2, 4):
+                return None
+            frames = wav.readframes(min(wav.getnframes(), rate * DECODE_MAX_SECONDS))
+    except (wave.Error, EOFError):
+        return None
+    if sampwidth == 1:
+        # 8 位 WAV 为无符号整数
+        ints = [value - 128 for value in array("B", frames)]
+        scale = 128.0
+    else:
+        ints = array("h" if sampwidth == 2 else "i", frames)
+        scale = float(1 << (8 * sampwidth - 1))
+    if channels > 1:
+        mono = [sum(ints[i:i + channels]) / channels for i in range(0, len(ints) - channels + 1, channels)]
+    else:
+        mono = ints
+    return [value / scale for value in mono], rate
+
+def _decode_with_ffmpeg(content: bytes) -> Tuple[List[float], int]:
+    """
+    其他格式 (mp3/flac/m4a 等) 交给 ffmpeg 解码为目标采样率的单声道 16 位 PCM。
+    """
+    if shutil.which(FFMPEG_BINARY) is None:
+        raise HTTPException(status_code=400, detail="仅支持 PCM WAV 格式的参考音频")
+    result = subprocess.run(
+        [
+            FFMPEG_BINARY, "-v", "error", "-i", "pipe:0", "-t", str(DECODE_MAX_SECONDS),
+            "-ac", "1", "-ar", str(VOICE_SAMPLE_RATE), "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+        ],
+        input=content,
+        capture_output=True,
+        timeout=60,
+    )
+    if result.returncode != 0 or not result.stdout:
+        raise HTTPException(status_code=400, detail="无法解析的音频文件")
+    ints = array("h")
+    ints.frombytes(result.stdout[:len(result.stdout) // 2 * 2])
+    return [value / 32768.0 for value in ints], VOICE_SAMPLE_RATE
+
+def _resample(samples: List[float], rate: int, target_rate: int) -> List[float]:
+    """
+    线性插值重采样。参考音频只需保留音色特征，线性插值的精度已足够。
+    """
+    if rate == target_rate or not samples:
+        return list(samples)
+    ratio = rate / target_rate
+    last = len(samples) - 1
+    out = []
+    for i in range(int(len(samples) * target_rate / rate)):
+        position = i * ratio
+        j = int(position)
+        if j >= last:
+            out.append(samples[last])
+            continue
+        frac = position - j
+        out.append(samples[j] + (samples[j + 1] - samples[j]) * frac)
+    return out
+
+def _frame_rms(samples: List[float], frame: int) -> List[float]:
+    energies = []
+    for i in range(0, len(samples), frame):
+        chunk = samples[i:i + frame]
+        energies.append(math.sqrt(sum(v * v for v in chunk) / len(chunk)))
+    return energies
+
+def _trim(samples: List[float], rate: int) -> List[float]:
+    """
+    去除首尾静音，超过 VOICE_MAX_SECONDS 时在上限前 CUT_SEARCH_SECONDS 内能量最低的帧处截断 (尽量落在停顿处)。
+    """
+    frame = int(rate * FRAME_SECONDS)
+    energies = _frame_rms(samples, frame)
+    threshold = 10 ** (VOICE_SILENCE_DBFS / 20)
+    voiced = [i for i, energy in enumerate(energies) if energy > threshold]
+    if not voiced:
+        raise HTTPException(status_code=400, detail="参考音频中没有检测到有效语音")
+    pad = int(EDGE_PAD_SECONDS / FRAME_SECONDS)
+    first = max(voiced[0] - pad, 0)
+    last = min(voiced[-1] + pad, len(energies) - 1)
+
+    max_frames = int(VOICE_MAX_SECONDS / FRAME_SECONDS)
+    if last - first + 1 > max_frames:
+        search_start = first + max_frames - int(CUT_SEARCH_SECONDS / FRAME_SECONDS)
+        search_end = first + max_frames
+        last = min(range(search_start, search_end), key=lambda i: energies[i])
+    trimmed = samples[first * frame:(last + 1) * frame]
+    if len(trimmed) < VOICE_MIN_SECONDS * rate:
+        raise HTTPException(status_code=400, detail=f"有效语音时长不足 {VOICE_MIN_SECONDS:g} 秒")
+    return trimmed
+
+def _normalize(samples: List[float], rate: int) -> List[float]:
+    """
+    按 RMS 把响度调整到 VOICE_TARGET_DBFS，峰值不超过 VOICE_PEAK_DBFS，首尾加短淡入淡出避免爆音。
+    """
+    rms = math.sqrt(sum(v * v for v in samples) / len(samples))
+    peak = max(abs(v) for v in samples)
+    gain = 10 ** (VOICE_TARGET_DBFS / 20) / rms if rms > 0 else 1.0
+    if peak > 0:
+        gain = min(gain, 10 ** (VOICE_PEAK_DBFS / 20) / peak)
+    out = [v * gain for v in samples]
+    fade = min(int(rate * FADE_SECONDS), len(out) // 2)
+    for i in range(fade):
+        out[i] *= i / fade
+        out[-1 - i] *= i / fade
+    return out
+
+def _encode_wav(samples: List[float], rate: int) -> bytes:
+    pcm = array("h", (max(-32768, min(32767, int(round(v * 32767)))) for v in samples))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def process_reference_audio(content: bytes) -> ProcessedVoice:
+    """
+    参考音频预处理 (只在上传时执行一次)：解码为单声道，重采样到 VOICE_SAMPLE_RATE，
+    去除首尾静音并裁剪到合适长度，响度归一化后编码为 16 位 WAV。
+    处理后的文件通常远小于原始上传，TTS 服务每次合成时需要处理的参考音频也随之变短。
+    """
+    decoded = _decode_wav(content) or _decode_with_ffmpeg(content)
+    samples = _resample(decoded[0], decoded[1], VOICE_SAMPLE_RATE)
+    samples = _normalize(_trim(samples, VOICE_SAMPLE_RATE), VOICE_SAMPLE_RATE)
+    return ProcessedVoice(_encode_wav(samples, VOICE_SAMPLE_RATE), len(samples) / VOICE_SAMPLE_RATE, VOICE_SAMPLE_RATE)
+
+def voice_file_path(content_hash: str) -> str:
+    return os.path.join(VOICE_LIBRARY_DIR, content_hash[:2], f"{content_hash}.wav")
+
+def voice_url(content_hash: str) -> str:
+    relative = os.path.relpath(voice_file_path(content_hash), VOICE_DIR)
+    return "/voice/" + relative.replace(os.sep, "/")
+
+def store_voice_file(voice: ProcessedVoice) -> str:
+    """
+    按内容哈希保存处理后的音频，相同内容只保存一份。返回文件绝对路径。
+    """
+    path = voice_file_path(voice.content_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.{os.getpid()}.part"
+        with open(part_path, "wb") as f:
+            f.write(voice.wav_bytes)
+        os.replace(part_path, path)
+    return path
+
+async def create_voice(db: AsyncSession, user: models.User, name: str, emo_type: Optional[int], file: UploadFile) -> models.Voice:
+    """
+    上传并处理参考音频，写入音色库。同一用户重复上传处理后内容相同的音频时返回已有记录。
+    """
+    content = await file.read(VOICE_UPLOAD_MAX_BYTES + 1)
+    if len(content) > VOICE_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="文件大小超出限制")
+    if not content:
+        raise HTTPException(status_code=400, detail="文件内容为空")
+
+    processed = await run_in_threadpool(process_reference_audio, content)
+    result = await db.execute(
+        select(models.Voice).where(models.Voice.user_id == user.id, models.Voice.content_hash == processed.content_hash)
+    )
+    existing = result.scalars().first()
+    if existing:
+        return existing
+    count = await db.scalar(select(func.count()).select_from(models.Voice).where(models.Voice.user_id == user.id))
+    if count >= VOICE_MAX_PER_USER:
+        raise HTTPException(status_code=400, detail=f"音色数量已达上限 ({VOICE_MAX_PER_USER})")
+
+    await run_in_threadpool(store_voice_file, processed)
+    voice = models.Voice(
+        user_id=user.id,
+        name=name,
+        emo_type=emo_type,
+        content_hash=processed.content_hash,
+        audio_path=voice_url(processed.content_hash),
+        duration=round(processed.duration, 3),
+        sample_rate=processed.sample_rate,
+        original_bytes=len(content),
+        stored_bytes=len(processed.wav_bytes),
+    )
+    db.add(voice)
+    await db.commit()
+    await db.refresh(voice)
+    return voice
+
+async def get_voice(db: AsyncSession, voice_id: int, current_user: models.User) -> models.Voice:
+    """
+    查询音色，不存在或无权访问时返回 404。
+    """
+    voice = await db.get(models.Voice, voice_id)
+    if not voice or (voice.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="音色不存在")
+    return voice
+
+async def resolve_voice_path(db: AsyncSession, voice_id: Optional[int], current_user: models.User) -> Optional[str]:
+    """
+    合成接口的音色参数：返回音色文件的绝对路径，未指定时返回 None (使用内置参考音频)。
+    """
+    if voice_id is None:
+        return None
+    voice = await get_voice(db, voice_id, current_user)
+    path = voice_file_path(voice.content_hash)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="音色文件不存在")
+    return path
+
+async def delete_voice(db: AsyncSession, voice: models.Voice) -> None:
+    """
+    删除音色记录；没有其他记录引用相同内容时一并删除文件。
+    """
+    content_hash = voice.content_hash
+    await db.delete(voice)
+    await db.commit()
+    await remove_unreferenced_files(db, [content_hash])
+
+async def remove_unreferenced_files(db: AsyncSession, content_hashes: List[str]) -> None:
+    """
+    删除已没有任何音色记录引用的音频文件 (在删除记录并提交之后调用)。
+    """
+    for content_hash in set(content_hashes):
+        remaining = await db.scalar(
+            select(func.count()).select_from(models.Voice).where(models.Voice.content_hash == content_hash)
+        )
+        if not remaining:
+            try:
+                os.remove(voice_file_path(content_hash))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,115 @@
+import os
+import struct
+import wave
+
+# 每次读写的帧数，控制拼接时的内存占用
+COPY_CHUNK_FRAMES = 64 * 1024
+
+class WavConcatWriter:
+    """
+    流式 WAV 拼接器。
+    按顺序追加分段文件，逐块复制 PCM 数据并在分段之间插入静音，
+    整个过程只在内存中保留一个数据块。输出先写入 .part 文件，close 时原子替换为目标文件。
+    """
+    def __init__(self, output_path: str, gap_ms: int = 0):
+        self.output_path = output_path
+        self.gap_ms = gap_ms
+        self._part_path = output_path + ".part"
+        self._writer = None
+        self._params = None
+        self._segments = 0
+
+    def append(self, segment_path: str) -> None:
+        """
+        追加一个分段，首个分段决定输出文件的采样格式。
+        """
+        with wave.open(segment_path, "rb") as reader:
+            params = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+            if self._writer is None:
+                self._params = params
+                self._writer = wave.open(self._part_path, "wb")
+                self._writer.setnchannels(params[0])
+                self._writer.setsampwidth(params[1])
+                self._writer.setframerate(params[2])
+            elif params != self._params:
+                raise ValueError(f"分段音频格式不一致: {params} != {self._params}")
+            elif self.gap_ms > 0:
+                self._write_silence(self.gap_ms)
+            while True:
+                frames = reader.readframes(COPY_CHUNK_FRAMES)
+                if not frames:
+                    break
+                self._writer.writeframes(frames)
+        self._segments += 1
+
+    def close(self) -> None:
+        """
+        完成写入并把 .part 文件替换为最终文件。
+        """
+        if self._writer is None:
+            raise ValueError("没有可拼接的音频分段")
+        self._writer.close()
+        self._writer = None
+        os.replace(self._part_path, self.output_path)
+
+    def abort(self) -> None:
+        """
+        放弃写入并删除未完成的 .part 文件。
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._part_path):
+            os.remove(self._part_path)
+
+    def _write_silence(self, duration_ms: int) -> None:
+        channels, sampwidth, framerate = self._params
+        remaining = framerate * duration_ms // 1000
+        while remaining > 0:
+            frames = min(remaining, COPY_CHUNK_FRAMES)
+            # 8 位 PCM 为无符号格式，静音值为 0x80
+            silence = b"\x80" if sampwidth == 1 else b"\x00"
+            self._writer.writeframes(silence * (frames * channels * sampwidth))
+            remaining -= frames
+
+def streaming_wav_header(channels: int, sampwidth: int, framerate: int) -> bytes:
+    """
+    生成长度未知的 WAV 文件头，用于边合成边传输。
+    RIFF 与 data 块长度填写 0xFFFFFFFF，主流播放器会一直读取到连接结束。
+    """
+    byte_rate = framerate * channels * sampwidth
+    block_align = channels * sampwidth
+    return b"".join([
+        b"RIFF", struct.pack("<I", 0xFFFFFFFF), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, framerate, byte_rate, block_align, sampwidth * 8),
+        b"data", struct.pack("<I", 0xFFFFFFFF),
+    ])
+
+def silence_bytes(params: tuple, duration_ms: int) -> bytes:
+    """
+    生成指定格式与时长的静音 PCM 数据，params 为 (声道数, 采样宽度, 采样率)。
+    """
+    channels, sampwidth, framerate = params
+    frames = framerate * duration_ms // 1000
+    silence = b"\x80" if sampwidth == 1 else b"\x00"
+    return silence * (frames * channels * sampwidth)
+
+def iter_pcm_chunks(path: str, chunk_frames: int = COPY_CHUNK_FRAMES):
+    """
+    逐块读取 WAV 文件的 PCM 数据。
+    首个产出值为 (声道数, 采样宽度, 采样率) 格式元组，之后为 PCM 数据块。
+    """
+    with wave.open(path, "rb") as reader:
+        yield (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+        while True:
+            frames = reader.readframes(chunk_frames)
+            if not frames:
+                break
+            yield frames
+
+def wav_duration(path: str) -> float:
+    """
+    读取 WAV 文件头计算音频时长 (秒)。
+    """
+    with wave.open(path, "rb") as reader:
+        return reader.getnframes() / float(reader.getframerate())